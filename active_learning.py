@@ -0,0 +1,174 @@
+import os
+import shutil
+import numpy as np
+from config_loader import get_config
+from grain_records import unpack
+from stream_analysis import iou_matrix
+
+# 待标注图片的保存目录（按内容哈希命名）
+QUEUE_DIR = os.path.join('active_learning', 'images')
+
+def get_active_learning_config():
+    config = {"enabled": True, "uncertain_low": 0.25, "uncertain_high": 0.6, "disagreement_iou": 0.5,
+              "weights": {"uncertainty": 0.5, "disagreement": 0.3, "viability": 0.2},
+              "min_score": 0.2, "max_queue": 500, "label_conf": 0.25, "dataset_dir": "datasets/flower"}
+    config.update(get_config('active_learning', default={}) or {})
+    return config
+
+def informativeness(grains, config=None):
+    """按已有的逐粒检测结果评估图片的信息量（不需要重新推理）
+
+    - uncertainty：置信度落在 [uncertain_low, uncertain_high) 的检测框比例
+    - disagreement：与另一类别的检测框高度重叠（模型对类别犹豫）的检测框比例
+    - viability：活力判断的不确定度，可育概率越接近 0.5 越高
+    返回 {"score", "uncertainty", "disagreement", "viability", "grains"}。
+    """
+    config = config or get_active_learning_config()
+    kept = grains[grains["conf"] >= config["uncertain_low"]]
+    n = len(kept)
+    if n == 0:
+        return {"score": 0.0, "uncertainty": 0.0, "disagreement": 0.0, "viability": 0.0, "grains": 0}
+
+    uncertainty = float((kept["conf"] < config["uncertain_high"]).mean())
+    viability = float((1 - np.abs(2 * kept["score"] - 1)).mean())
+
+    boxes = np.stack([kept["x1"], kept["y1"], kept["x2"], kept["y2"]], axis=1)
+    overlap = iou_matrix(boxes, boxes) >= config["disagreement_iou"]
+    conflict = overlap & (kept["cls"][:, None] != kept["cls"][None, :])
+    disagreement = float(conflict.any(axis=1).mean())
+
+    weights = config["weights"]
+    score = (weights["uncertainty"] * uncertainty + weights["disagreement"] * disagreement
+             + weights["viability"] * viability)
+    return {"score": float(score), "uncertainty": uncertainty, "disagreement": disagreement,
+            "viability": viability, "grains": n}
+
+def offer(history, image_hash, data, filename, grains, width, height, timestamp):
+    """检测完成后调用：信息量达到阈值时保存图片并加入标注队列，返回评分（未入队返回 None）
+
+    width、height 为检测所用图像（decode_upload 缩放后）的尺寸，导出标注时按它归一化。
+    队列超过 max_queue 时删除信息量最低的待标注图片。
+    """
+    config = get_active_learning_config()
+    if not config["enabled"]:
+        return None
+    info = informativeness(grains, config)
+    if info["score"] < config["min_score"]:
+        return None
+
+    os.makedirs(QUEUE_DIR, exist_ok=True)
+    ext = os.path.splitext(filename or '')[1].lower() or '.jpg'
+    image_path = os.path.join(QUEUE_DIR, f"{image_hash}{ext}")
+    if not os.path.exists(image_path):
+        tmp_path = f"{image_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, image_path)
+    history.queue_image({**info, "image_hash": image_hash, "filename": filename, "image_path": image_path,
+                         "width": width, "height": height, "timestamp": timestamp})
+    for path in history.trim_queue(config["max_queue"]):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return info
+
+# mine 结果中各图片的状态说明
+MINE_STATUS = {
+    "pending": "已入队",
+    "exported": "已导出",
+    "missing": "原图丢失",
+    "below_threshold": "低于阈值",
+    "not_kept": "未保存原图",
+}
+
+def mine(history, limit=50):
+    """对全部已保存的检测结果按信息量排序（包括未保存图片、无法导出的历史记录）
+
+    status：pending / exported / missing 为标注队列中的状态；不在队列中的图片，
+    信息量低于 min_score 的为 below_threshold，其余为 not_kept（入队时主动学习未启用或已被挤出队列，原图未保存）。
+    """
+    config = get_active_learning_config()
+    queue_status = {entry["image_hash"]: status for status in ("pending", "exported", "missing")
+                    for entry in history.labeling_queue(status=status, limit=None)}
+    ranked = []
+    for image_hash, timestamp, blob in history.load_grain_rows():
+        info = informativeness(unpack(blob), config)
+        status = queue_status.get(image_hash) or \
+            ("below_threshold" if info["score"] < config["min_score"] else "not_kept")
+        ranked.append({**info, "image_hash": image_hash, "timestamp": timestamp, "status": status})
+    ranked.sort(key=lambda item: item["score"], reverse=True)
+    return ranked[:limit]
+
+def yolo_labels(grains, width, height, label_conf=0.25):
+    """当前模型的检测结果转为 YOLO 标注行（类别 cx cy w h，均归一化），供人工校正"""
+    kept = grains[grains["conf"] >= label_conf]
+    x1 = np.clip(kept["x1"], 0, width)
+    y1 = np.clip(kept["y1"], 0, height)
+    x2 = np.clip(kept["x2"], 0, width)
+    y2 = np.clip(kept["y2"], 0, height)
+    rows = np.stack([(x1 + x2) / 2 / width, (y1 + y2) / 2 / height, (x2 - x1) / width, (y2 - y1) / height], axis=1)
+    return [f"{int(cls)} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}"
+            for cls, (cx, cy, w, h) in zip(kept["cls"], rows) if w > 0 and h > 0]
+
+def export_queue(history, limit=None, split='train', dataset_dir=None):
+    """把信息量最高的待标注图片按 datasets/flower 的 YOLO 目录结构导出
+
+    图片复制到 images/<split>/al_<哈希前 12 位>.<扩展名>，预填标注写入 labels/<split>/ 同名 .txt，
+    并追加到 datasets/<split>.txt（如果存在）。导出后的条目标记为 exported。返回导出的图片路径列表。
+    """
+    config = get_active_learning_config()
+    dataset_dir = dataset_dir or config["dataset_dir"]
+    split_name = 'val' if split == 'val' else 'train'
+    images_dir = os.path.join(dataset_dir, 'images', split_name)
+    labels_dir = os.path.join(dataset_dir, 'labels', split_name)
+    os.makedirs(images_dir, exist_ok=True)
+    os.makedirs(labels_dir, exist_ok=True)
+
+    exported, done = [], []
+    for entry in history.labeling_queue(limit=limit):
+        if not os.path.exists(entry["image_path"]):
+            history.set_queue_status([entry["image_hash"]], 'missing')
+            continue
+        stored = history.load_grains(entry["image_hash"])
+        if stored is None:
+            continue
+        name = f"al_{entry['image_hash'][:12]}"
+        ext = os.path.splitext(entry["image_path"])[1]
+        image_path = os.path.join(images_dir, name + ext)
+        shutil.copyfile(entry["image_path"], image_path)
+        lines = yolo_labels(unpack(stored), entry["width"], entry["height"], config["label_conf"])
+        with open(os.path.join(labels_dir, name + '.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + ('\n' if lines else ''))
+        exported.append(image_path.replace(os.sep, '/'))
+        done.append(entry["image_hash"])
+
+    # 追加到数据集图片列表
+    list_path = os.path.join(os.path.dirname(os.path.normpath(dataset_dir)), f"{split_name}.txt")
+    if exported and os.path.exists(list_path):
+        with open(list_path, 'r', encoding='utf-8') as f:
+            listed = {line.strip() for line in f}
+        with open(list_path, 'a', encoding='utf-8') as f:
+            for path in exported:
+                if path not in listed:
+                    f.write(path + '\n')
+    history.set_queue_status(done, 'exported')
+    return exported
+
+if __name__ == '__main__':
+    # python active_learning.py mine [数量] | export [数量] [train|val]
+    import sys
+    from analysis_history import AnalysisHistory
+    history = AnalysisHistory()
+    command = sys.argv[1] if len(sys.argv) > 1 else 'mine'
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    if command == 'mine':
+        for item in mine(history, count or 20):
+            print(f"{item['image_hash'][:12]}  {item['timestamp']}  信息量 {item['score']:.3f}  "
+                  f"低置信度 {item['uncertainty']:.0%}  类别冲突 {item['disagreement']:.0%}  "
+                  f"{MINE_STATUS[item['status']]}")
+    elif command == 'export':
+        paths = export_queue(history, count, sys.argv[3] if len(sys.argv) > 3 else 'train')
+        print(f"已导出 {len(paths)} 张图片，请校正 labels/ 下的预填标注后再训练")
+    else:
+        print("用法：python active_learning.py mine [数量] | export [数量] [train|val]")
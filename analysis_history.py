@@ -0,0 +1,560 @@
+import os
+import sys
+import gzip
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from config_loader import get_config
+
+# 旧版分析记录文件（首次启动时导入数据库）
+LEGACY_JSON_PATH = 'analysis_data.json'
+
+CLASS_NAMES = ["WT", "T1-C5-C1", "T1-C5-E5"]
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+class AnalysisHistory:
+    """分析历史存储
+
+    原始记录保存在 analysis_records 表中；超过保留期的记录按天、按类别
+    汇总到 analysis_daily 表，原始行压缩归档到冷存储文件后删除。
+    读取趋势时原始记录与日汇总合并返回，图表不受影响。
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or get_config('database', 'analysis_db', 'analysis.db')
+        self._compact_lock = threading.Lock()
+        self.init_database()
+        self.migrate_legacy_json()
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def init_database(self):
+        """初始化数据库"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        # 增量 vacuum 需要在建表前设置
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
+        # 原始分析记录
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            filename TEXT,
+            data TEXT NOT NULL
+        )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_records_timestamp ON analysis_records (timestamp)')
+
+        # 按天、按类别汇总的历史数据
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_daily (
+            date TEXT NOT NULL,
+            class_name TEXT NOT NULL,
+            records INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            viable INTEGER NOT NULL,
+            non_viable INTEGER NOT NULL,
+            PRIMARY KEY (date, class_name)
+        )
+        ''')
+
+        # 旧版数据库没有 image_hash 列
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(analysis_records)')]
+        if 'image_hash' not in columns:
+            cursor.execute('ALTER TABLE analysis_records ADD COLUMN image_hash TEXT')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_records_image_hash ON analysis_records (image_hash)')
+
+        # 单张图片的逐粒检测结果（grain_records.GRAIN_DTYPE 结构数组），按图片内容哈希关联
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS grain_records (
+            image_hash TEXT PRIMARY KEY,
+            record_id INTEGER,
+            timestamp TEXT NOT NULL,
+            grains INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            model_key TEXT
+        )
+        ''')
+        # 旧版数据库没有 model_key 列（产生结果的模型权重和推理设置）
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(grain_records)')]
+        if 'model_key' not in columns:
+            cursor.execute('ALTER TABLE grain_records ADD COLUMN model_key TEXT')
+
+        # 已分析图片的感知哈希（重复检测）
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS image_hashes (
+            image_hash TEXT PRIMARY KEY,
+            phash INTEGER NOT NULL,
+            filename TEXT,
+            timestamp TEXT NOT NULL,
+            crop_phashes BLOB
+        )
+        ''')
+        # 旧版数据库没有中心裁剪的感知哈希（image_index.crop_hashes）
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(image_hashes)')]
+        if 'crop_phashes' not in columns:
+            cursor.execute('ALTER TABLE image_hashes ADD COLUMN crop_phashes BLOB')
+
+        # 主动学习标注队列：按信息量排序的待标注图片（图片文件保存在 active_learning/ 下）
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS labeling_queue (
+            image_hash TEXT PRIMARY KEY,
+            score REAL NOT NULL,
+            uncertainty REAL NOT NULL,
+            disagreement REAL NOT NULL,
+            filename TEXT,
+            image_path TEXT NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            timestamp TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending'
+        )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_queue_status_score ON labeling_queue (status, score)')
+
+        # 已从数据库删除、尚未写入归档文件的原始记录（与删除在同一事务中写入，保证归档不丢失、不重复）
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archive_pending (
+            id INTEGER PRIMARY KEY,
+            batch INTEGER NOT NULL,
+            timestamp TEXT NOT NULL,
+            filename TEXT,
+            data TEXT NOT NULL
+        )
+        ''')
+
+        # 元数据（迁移标记等）
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        ''')
+
+        conn.commit()
+        conn.close()
+
+    def migrate_legacy_json(self, json_path=LEGACY_JSON_PATH):
+        """把旧版 analysis_data.json 中的记录导入数据库（只执行一次）"""
+        conn = self.connect()
+        try:
+            if conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone():
+                return
+            records = []
+            if os.path.exists(json_path):
+                try:
+                    with open(json_path, 'r', encoding='utf-8') as f:
+                        records = json.load(f)
+                except Exception as e:
+                    # 不写入迁移标记，修复文件后下次启动会重新导入
+                    print(f"读取旧版分析记录失败，暂不迁移：{e}")
+                    return
+            conn.executemany(
+                'INSERT INTO analysis_records (timestamp, filename, data) VALUES (?, ?, ?)',
+                [(r["timestamp"], r.get("filename"), json.dumps(r["data"], ensure_ascii=False)) for r in records]
+            )
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (str(len(records)),))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def add_record(self, record, grains=None, grain_count=0, model_key=None):
+        """保存一条分析记录；grains 为逐粒检测结果（打包后的字节），与记录在同一事务中写入
+
+        model_key 标识产生逐粒结果的模型权重和推理设置，复用结果时据此判断是否仍然有效。
+        """
+        conn = self.connect()
+        try:
+            cursor = conn.execute(
+                'INSERT INTO analysis_records (timestamp, filename, data, image_hash) VALUES (?, ?, ?, ?)',
+                (record["timestamp"], record.get("filename"), json.dumps(record["data"], ensure_ascii=False),
+                 record.get("image_hash"))
+            )
+            if grains is not None and record.get("image_hash"):
+                conn.execute(
+                    'INSERT OR REPLACE INTO grain_records (image_hash, record_id, timestamp, grains, data, model_key) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (record["image_hash"], cursor.lastrowid, record["timestamp"], grain_count, grains, model_key)
+                )
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+    def load_grains(self, image_hash, model_key=None):
+        """读取一张图片的逐粒检测结果（打包的字节），没有时返回 None
+
+        指定 model_key 时只返回由同一模型权重和推理设置得到的结果。
+        """
+        conn = self.connect()
+        try:
+            if model_key is None:
+                row = conn.execute('SELECT data FROM grain_records WHERE image_hash = ?', (image_hash,)).fetchone()
+            else:
+                row = conn.execute('SELECT data FROM grain_records WHERE image_hash = ? AND model_key = ?',
+                                   (image_hash, model_key)).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def add_image_hash(self, image_hash, phash, filename, timestamp, crop_phashes=None):
+        conn = self.connect()
+        try:
+            conn.execute('INSERT OR IGNORE INTO image_hashes (image_hash, phash, filename, timestamp, crop_phashes) '
+                         'VALUES (?, ?, ?, ?, ?)',
+                         (image_hash, phash, filename, timestamp, crop_phashes))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def has_image_hash(self, image_hash):
+        conn = self.connect()
+        try:
+            return conn.execute('SELECT 1 FROM image_hashes WHERE image_hash = ?', (image_hash,)).fetchone() is not None
+        finally:
+            conn.close()
+
+    def load_image_hashes(self):
+        """全部已分析图片的哈希：[(image_hash, phash, filename, timestamp, crop_phashes)]"""
+        conn = self.connect()
+        try:
+            return conn.execute('SELECT image_hash, phash, filename, timestamp, crop_phashes FROM image_hashes').fetchall()
+        finally:
+            conn.close()
+
+    def load_grain_rows(self):
+        """全部逐粒检测结果：[(image_hash, timestamp, data)]，按时间排序"""
+        conn = self.connect()
+        try:
+            return conn.execute('SELECT image_hash, timestamp, data FROM grain_records ORDER BY timestamp').fetchall()
+        finally:
+            conn.close()
+
+    def queue_image(self, entry):
+        """加入标注队列（已在队列中的图片保持原状态）"""
+        conn = self.connect()
+        try:
+            conn.execute(
+                'INSERT OR IGNORE INTO labeling_queue (image_hash, score, uncertainty, disagreement, filename, '
+                'image_path, width, height, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (entry["image_hash"], entry["score"], entry["uncertainty"], entry["disagreement"], entry.get("filename"),
+                 entry["image_path"], entry["width"], entry["height"], entry["timestamp"])
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def labeling_queue(self, status='pending', limit=None):
+        """按信息量从高到低读取标注队列"""
+        conn = self.connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            query = 'SELECT * FROM labeling_queue WHERE status = ? ORDER BY score DESC'
+            params = [status]
+            if limit:
+                query += ' LIMIT ?'
+                params.append(limit)
+            return [dict(row) for row in conn.execute(query, params)]
+        finally:
+            conn.close()
+
+    def set_queue_status(self, image_hashes, status):
+        conn = self.connect()
+        try:
+            conn.executemany('UPDATE labeling_queue SET status = ? WHERE image_hash = ?',
+                             [(status, image_hash) for image_hash in image_hashes])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def trim_queue(self, max_size):
+        """待标注图片超过 max_size 时删除信息量最低的，返回被删除条目的图片路径"""
+        conn = self.connect()
+        try:
+            rows = conn.execute(
+                "SELECT image_hash, image_path FROM labeling_queue WHERE status = 'pending' "
+                "ORDER BY score DESC LIMIT -1 OFFSET ?", (max_size,)).fetchall()
+            conn.executemany('DELETE FROM labeling_queue WHERE image_hash = ?', [(row[0],) for row in rows])
+            conn.commit()
+            return [row[1] for row in rows]
+        finally:
+            conn.close()
+
+    def load_records(self, since=None, include_aggregated=True):
+        """按时间顺序读取分析记录
+
+        since 为 datetime 时只返回该时间之后的数据。已汇总的历史以每天
+        一条记录返回（"aggregated": True），data 为当天各类别计数之和。
+        """
+        since_text = since.strftime(TIMESTAMP_FORMAT) if since else ""
+        conn = self.connect()
+        try:
+            records = []
+            if include_aggregated:
+                daily = {}
+                for date, class_name, count, total, viable, non_viable in conn.execute(
+                        'SELECT date, class_name, records, total, viable, non_viable FROM analysis_daily '
+                        'WHERE date >= ? ORDER BY date', (since_text[:10],)):
+                    entry = daily.setdefault(date, {
+                        "timestamp": f"{date} 12:00:00",
+                        "filename": None,
+                        "aggregated": True,
+                        "records": 0,
+                        "data": {name: {"total": 0, "viable": 0, "non_viable": 0} for name in CLASS_NAMES}
+                    })
+                    entry["records"] = max(entry["records"], count)
+                    entry["data"][class_name] = {"total": total, "viable": viable, "non_viable": non_viable}
+                records.extend(daily.values())
+
+            for timestamp, filename, data in conn.execute(
+                    'SELECT timestamp, filename, data FROM analysis_records WHERE timestamp >= ? ORDER BY timestamp, id',
+                    (since_text,)):
+                records.append({"timestamp": timestamp, "filename": filename, "data": json.loads(data)})
+        finally:
+            conn.close()
+
+        # 日汇总都早于原始记录，按时间稳定排序即可合并
+        records.sort(key=lambda r: r["timestamp"])
+        return records
+
+    def iter_records(self, batch_size=1000):
+        """按时间顺序逐批读取全部记录（日汇总在前，原始记录在后），内存占用与历史长度无关"""
+        conn = self.connect()
+        try:
+            cursor = conn.execute(
+                'SELECT date, class_name, records, total, viable, non_viable FROM analysis_daily ORDER BY date')
+            entry = None
+            for date, class_name, count, total, viable, non_viable in cursor:
+                if entry is None or entry["timestamp"][:10] != date:
+                    if entry is not None:
+                        yield entry
+                    entry = {
+                        "timestamp": f"{date} 12:00:00",
+                        "filename": None,
+                        "aggregated": True,
+                        "records": count,
+                        "data": {name: {"total": 0, "viable": 0, "non_viable": 0} for name in CLASS_NAMES}
+                    }
+                entry["data"][class_name] = {"total": total, "viable": viable, "non_viable": non_viable}
+            if entry is not None:
+                yield entry
+
+            cursor = conn.execute('SELECT timestamp, filename, data FROM analysis_records ORDER BY timestamp, id')
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for timestamp, filename, data in rows:
+                    yield {"timestamp": timestamp, "filename": filename, "data": json.loads(data)}
+        finally:
+            conn.close()
+
+    def class_count_rows(self, include_aggregated=True):
+        """每条记录各类别的 (total, viable) 计数，列顺序与 CLASS_NAMES 对应
+
+        计数直接在 SQLite 中用 json_extract 取出，不在 Python 中解析 JSON；
+        已汇总的历史每天一行（include_aggregated=False 时只返回逐张图片的原始记录）。
+        """
+        raw_columns = ", ".join(
+            f"""COALESCE(json_extract(data, '$."{name}".total'), 0), COALESCE(json_extract(data, '$."{name}".viable'), 0)"""
+            for name in CLASS_NAMES)
+        daily_columns = ", ".join(
+            f"SUM(CASE WHEN class_name = '{name}' THEN total ELSE 0 END), "
+            f"SUM(CASE WHEN class_name = '{name}' THEN viable ELSE 0 END)"
+            for name in CLASS_NAMES)
+        conn = self.connect()
+        try:
+            rows = conn.execute(f'SELECT {daily_columns} FROM analysis_daily GROUP BY date ORDER BY date').fetchall() \
+                if include_aggregated else []
+            rows.extend(conn.execute(f'SELECT {raw_columns} FROM analysis_records ORDER BY timestamp, id'))
+            return rows
+        finally:
+            conn.close()
+
+    def recent_records(self, limit=10):
+        """按时间顺序返回最近 limit 条记录（原始记录不足时补上日汇总）"""
+        conn = self.connect()
+        try:
+            rows = conn.execute(
+                'SELECT timestamp, filename, data FROM analysis_records ORDER BY timestamp DESC, id DESC LIMIT ?',
+                (limit,)).fetchall()
+        finally:
+            conn.close()
+        if len(rows) < limit:
+            return self.load_records()[-limit:]
+        return [{"timestamp": t, "filename": f, "data": json.loads(d)} for t, f, d in reversed(rows)]
+
+    def latest_records(self, limit=1000):
+        """最近 limit 条原始记录（按 id 倒序取，按时间顺序返回），只读取这些行"""
+        conn = self.connect()
+        try:
+            rows = conn.execute(
+                'SELECT timestamp, filename, data FROM analysis_records ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        finally:
+            conn.close()
+        return [{"timestamp": t, "filename": f, "data": json.loads(d)} for t, f, d in reversed(rows)]
+
+    def summary(self):
+        """历史记录摘要：记录数、最早和最新时间（只查索引，不读取记录内容）"""
+        conn = self.connect()
+        try:
+            raw, first, last = conn.execute(
+                'SELECT COUNT(*), MIN(timestamp), MAX(timestamp) FROM analysis_records').fetchone()
+            days, first_day, last_day = conn.execute(
+                'SELECT COUNT(DISTINCT date), MIN(date), MAX(date) FROM analysis_daily').fetchone()
+        finally:
+            conn.close()
+        timestamps = [t for t in (first, last, first_day and f"{first_day} 12:00:00",
+                                  last_day and f"{last_day} 12:00:00") if t]
+        return {
+            "total": raw + days,
+            "first": min(timestamps) if timestamps else None,
+            "last": max(timestamps) if timestamps else None
+        }
+
+    def data_version(self):
+        """历史数据版本号：新增记录或执行汇总后变化，用于缓存失效"""
+        conn = self.connect()
+        try:
+            # sqlite_sequence 记录 AUTOINCREMENT 的最大 id，删除行后也不会回退
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'analysis_records'").fetchone()
+            generation = conn.execute("SELECT value FROM meta WHERE key = 'compact_generation'").fetchone()
+            return (row[0] if row else 0, int(generation[0]) if generation else 0)
+        finally:
+            conn.close()
+
+    def count_records(self):
+        conn = self.connect()
+        try:
+            raw = conn.execute('SELECT COUNT(*) FROM analysis_records').fetchone()[0]
+            days = conn.execute('SELECT COUNT(DISTINCT date) FROM analysis_daily').fetchone()[0]
+            return {"raw": raw, "aggregated_days": days}
+        finally:
+            conn.close()
+
+    def _flush_archive(self, conn, archive_dir):
+        """把 archive_pending 中的记录写入压缩归档后删除
+
+        每个批次、每个月写一个文件 analysis_<月份>_b<批次号>.jsonl.gz（先写临时文件再替换），
+        批次内容固定，写入中断或提交失败后重试只会覆盖同名文件，不会产生重复行。
+        """
+        batches = [row[0] for row in conn.execute('SELECT DISTINCT batch FROM archive_pending ORDER BY batch')]
+        if batches:
+            os.makedirs(archive_dir, exist_ok=True)
+        for batch in batches:
+            by_month = {}
+            for row_id, timestamp, filename, data in conn.execute(
+                    'SELECT id, timestamp, filename, data FROM archive_pending WHERE batch = ? ORDER BY id', (batch,)):
+                by_month.setdefault(timestamp[:7], []).append(
+                    json.dumps({"id": row_id, "timestamp": timestamp, "filename": filename, "data": json.loads(data)},
+                               ensure_ascii=False))
+            for month, lines in by_month.items():
+                path = os.path.join(archive_dir, f"analysis_{month}_b{batch}.jsonl.gz")
+                with gzip.open(f"{path}.tmp", 'wt', encoding='utf-8') as f:
+                    f.write("\n".join(lines) + "\n")
+                os.replace(f"{path}.tmp", path)
+            conn.execute('DELETE FROM archive_pending WHERE batch = ?', (batch,))
+            conn.commit()
+
+    def compact(self, retention_days=None, archive=None, batch_size=500, vacuum_pages=200):
+        """把超过保留期的原始记录汇总为日数据，并归档/删除原始行
+
+        每批处理 batch_size 行、单独提交，避免长时间持有写锁；删除原始行的同时删除
+        不再被任何记录引用的逐粒检测结果和图片哈希。归档在提交之后写入（见 _flush_archive）。
+        删除后做增量 vacuum 回收空间。返回处理结果统计。
+        """
+        analysis_config = get_config('analysis', default={})
+        retention_days = retention_days if retention_days is not None else analysis_config.get('retention_days', 90)
+        archive = archive if archive is not None else analysis_config.get('archive_raw', True)
+        archive_dir = analysis_config.get('archive_dir', 'history_archive')
+        cutoff = (datetime.now() - timedelta(days=retention_days)).strftime(TIMESTAMP_FORMAT)
+
+        compacted = 0
+        with self._compact_lock:
+            conn = self.connect()
+            try:
+                # 上次未写完的归档
+                self._flush_archive(conn, archive_dir)
+                while True:
+                    rows = conn.execute(
+                        'SELECT id, timestamp, filename, data, image_hash FROM analysis_records '
+                        'WHERE timestamp < ? ORDER BY timestamp, id LIMIT ?', (cutoff, batch_size)).fetchall()
+                    if not rows:
+                        break
+
+                    # 按天、按类别汇总
+                    aggregates = {}
+                    for _, timestamp, _, data, _ in rows:
+                        for class_name, counts in json.loads(data).items():
+                            agg = aggregates.setdefault((timestamp[:10], class_name), [0, 0, 0, 0])
+                            agg[0] += 1
+                            agg[1] += counts.get("total", 0)
+                            agg[2] += counts.get("viable", 0)
+                            agg[3] += counts.get("non_viable", 0)
+
+                    if archive:
+                        batch = min(row[0] for row in rows)
+                        conn.executemany(
+                            'INSERT OR REPLACE INTO archive_pending (id, batch, timestamp, filename, data) '
+                            'VALUES (?, ?, ?, ?, ?)', [(row[0], batch, row[1], row[2], row[3]) for row in rows])
+
+                    conn.executemany('''
+                    INSERT INTO analysis_daily (date, class_name, records, total, viable, non_viable)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (date, class_name) DO UPDATE SET
+                        records = records + excluded.records,
+                        total = total + excluded.total,
+                        viable = viable + excluded.viable,
+                        non_viable = non_viable + excluded.non_viable
+                    ''', [(date, class_name, *agg) for (date, class_name), agg in aggregates.items()])
+                    conn.executemany('DELETE FROM analysis_records WHERE id = ?', [(row[0],) for row in rows])
+
+                    # 同一图片的其他记录都已删除时，一并删除它的逐粒检测结果和图片哈希
+                    hashes = [(image_hash,) for image_hash in {row[4] for row in rows if row[4]}]
+                    for table in ('grain_records', 'image_hashes'):
+                        conn.executemany(
+                            f'DELETE FROM {table} WHERE image_hash = ? AND NOT EXISTS '
+                            f'(SELECT 1 FROM analysis_records WHERE analysis_records.image_hash = {table}.image_hash)',
+                            hashes)
+
+                    conn.execute('''
+                    INSERT INTO meta (key, value) VALUES ('compact_generation', 1)
+                    ON CONFLICT (key) DO UPDATE SET value = value + 1
+                    ''')
+                    conn.commit()
+                    compacted += len(rows)
+
+                    if archive:
+                        self._flush_archive(conn, archive_dir)
+
+                # 增量回收空闲页，每次只回收一小段（仅 auto_vacuum=INCREMENTAL 的库有效）
+                # incremental_vacuum 每返回一行回收一页，必须 fetchall() 执行完毕
+                if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+                    freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                    while freelist:
+                        conn.execute(f'PRAGMA incremental_vacuum({vacuum_pages})').fetchall()
+                        conn.commit()
+                        remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                        if remaining >= freelist:
+                            break
+                        freelist = remaining
+            finally:
+                conn.close()
+
+        return {"compacted": compacted, "cutoff": cutoff, **self.count_records()}
+
+if __name__ == '__main__':
+    # python analysis_history.py compact [保留天数]
+    history = AnalysisHistory()
+    if len(sys.argv) > 1 and sys.argv[1] == "compact":
+        days = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        print(history.compact(retention_days=days))
+    else:
+        print(history.count_records())
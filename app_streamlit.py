@@ -10,36 +10,81 @@ import time
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 from datetime import datetime
 import json
+import shutil
+import tempfile
 from user_management import UserManagement
+from auth import identifier_digest
 from knowledge_base import show_knowledge_base, show_case_studies, show_professional_knowledge_base, show_professional_case_studies
-import random
+from image_io import decode_upload
+from tracing import tracer
+from system_log import get_logger, LogReader, format_log_line
+from backup import BackupManager, BackupScheduler
+from analysis_history import AnalysisHistory
+from data_export import available_formats, export_history, flatten_record
+from chart_data import trend_figure_json, detection_figures_json
+from viability_stats import history_control_analysis
+from viability import score_grains
+from morphology import measure_grains, summarize_by_class
+from grain_records import GRAIN_DTYPE, make_grains, aggregate, select, pack, unpack, content_hash, rescore_history
+from image_index import ImageHashIndex, phash_variants, crop_hashes
+from active_learning import offer as offer_for_labeling, export_queue
+from tta import predict_tta, get_tta_config
+from stream_analysis import analyze_stream, get_stream_config
+from config_loader import get_config
 
-# 初始化用户管理系统
-user_mgmt = UserManagement()
+# 初始化用户管理系统（跨会话共享，保证会话缓存和限流状态在脚本重新运行时保留）
+@st.cache_resource
+def get_user_management():
+    return UserManagement()
+
+user_mgmt = get_user_management()
+
+# 数据备份（后台按 database.backup_interval 定时执行）
+@st.cache_resource
+def get_backup_scheduler():
+    scheduler = BackupScheduler(BackupManager())
+    scheduler.start()
+    return scheduler
+
+backup_manager = get_backup_scheduler().manager
 
-# 数据存储路径
-DATA_STORAGE_PATH = "analysis_data.json"
+# 系统日志
+logger = get_logger('app')
+
+# 分析历史存储
+@st.cache_resource
+def get_analysis_history():
+    return AnalysisHistory()
+
+analysis_history = get_analysis_history()
+
+# 已分析图片的重复检测索引
+@st.cache_resource
+def get_image_index():
+    return ImageHashIndex(analysis_history)
+
+image_index = get_image_index()
 
 # 加载历史数据
-def load_historical_data():
+def load_historical_data(since=None):
     try:
-        if os.path.exists(DATA_STORAGE_PATH):
-            with open(DATA_STORAGE_PATH, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return []
-    except:
+        return analysis_history.load_records(since=since)
+    except Exception:
+        logger.exception("加载历史数据失败")
         return []
 
 # 保存分析数据
-def save_analysis_data(data):
+def save_analysis_data(data, grains=None, model_key=None):
     try:
-        historical_data = load_historical_data()
-        historical_data.append(data)
-        with open(DATA_STORAGE_PATH, 'w', encoding='utf-8') as f:
-            json.dump(historical_data, f, ensure_ascii=False, indent=2)
+        if grains is not None:
+            analysis_history.add_record(data, pack(grains), len(grains), model_key)
+        else:
+            analysis_history.add_record(data)
     except Exception as e:
+        logger.exception("保存分析数据失败")
         st.warning(f"保存数据时出错：{e}")
 
 # 设置页面配置
@@ -63,114 +108,156 @@ html, body, [class*="css"] {
 </style>
 """, unsafe_allow_html=True)
 
-# 加载模型
-@st.cache_resource
+# 加载模型（权重文件更新后重新加载）
+MODEL_PATH = "runs/train7/weights/best.pt"
+
+@st.cache_resource(max_entries=1)
+def _load_weights(path, mtime):
+    return YOLO(path)
+
 def load_model():
-    model = YOLO("runs/train7/weights/best.pt")
-    return model
-
-# 图像预处理
-def preprocess_image(image):
-    # 转换为numpy数组
-    if not isinstance(image, np.ndarray):
-        image = np.array(image)
-    
-    # 获取图片尺寸
-    height, width = image.shape[:2]
-    
-    # 如果图片太大，进行缩放
-    max_size = 1024
-    if height > max_size or width > max_size:
-        # 计算缩放比例
-        scale = max_size / max(height, width)
-        new_height = int(height * scale)
-        new_width = int(width * scale)
-        # 缩放图片
-        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
-    
-    return image
+    return _load_weights(MODEL_PATH, os.path.getmtime(MODEL_PATH))
 
-# 花粉活力判断函数
+# 逐粒检测结果的来源：模型权重及其修改时间、是否使用 TTA、检测图像的分辨率，复用之前的结果时必须一致
+# （检测框是 decode_upload 缩放后图像上的坐标，image.preprocessing 改变后不能再用）
+def model_key(use_tta, image_shape):
+    return (f"{MODEL_PATH}@{os.path.getmtime(MODEL_PATH):.0f}{'+tta' if use_tta else ''}"
+            f"@{image_shape[1]}x{image_shape[0]}")
+
+# 运行模型并记录各阶段耗时
+def run_model(model, image):
+    with tracer.span("model.total"):
+        results = model(image)
+    # ultralytics 自带的分阶段耗时（毫秒）：预处理、前向推理、后处理（NMS）
+    speed = getattr(results[0], 'speed', None) or {}
+    for key, stage in (("preprocess", "model.preprocess"), ("inference", "model.inference"), ("postprocess", "model.nms")):
+        if speed.get(key) is not None:
+            tracer.record(stage, speed[key] / 1000)
+    return results
+
+# 花粉活力判断函数（单粒花粉，批量判断见 viability.score_grains）
 def judge_pollen_viability(pollen_region):
+    _, viable = score_grains(pollen_region, [[0, 0, pollen_region.shape[1], pollen_region.shape[0]]])
+    return bool(viable[0])
+
+# 加载标签字体
+@st.cache_resource
+def load_label_font(size=20):
     try:
-        # 转换为灰度图
-        gray = cv2.cvtColor(pollen_region, cv2.COLOR_BGR2GRAY)
-        
-        # 计算形态特征
-        mean_intensity = np.mean(gray)
-        std_intensity = np.std(gray)
-        
-        # 基于经验阈值判断活力
-        # 这里的阈值需要根据实际数据调整
-        is_viable = mean_intensity > 100 and std_intensity > 20
-        
-        return is_viable
-    except:
-        return True  # 默认为可育
+        # 尝试使用系统中文字体
+        fontpath = "C:/Windows/Fonts/simhei.ttf"  # 使用黑体
+        return ImageFont.truetype(fontpath, size)
+    except Exception:
+        return None
+
+# 检测框转为 numpy 数组：(xyxy, conf, cls)
+def boxes_to_arrays(boxes):
+    if boxes is None or not len(boxes):
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+    to_numpy = lambda t: t.cpu().numpy() if hasattr(t, 'cpu') else np.asarray(t)
+    return to_numpy(boxes.xyxy), to_numpy(boxes.conf), to_numpy(boxes.cls).astype(np.int64)
+
+# 计算逐粒检测结果：保存全部检测框（含低置信度），之后可以按新规则重新统计而不必重新推理
+def score_results(image, results):
+    xyxy, confs, classes = boxes_to_arrays(results.boxes)
+    if not len(xyxy):
+        tracer.record("viability", 0.0)
+        return np.zeros(0, dtype=GRAIN_DTYPE)
+    # 所有花粉一次性提取特征并判断活力（先判断全部花粉再绘制，避免裁剪到已绘制的边框）
+    start = time.perf_counter()
+    scores, _ = score_grains(image, xyxy)
+    tracer.record("viability", time.perf_counter() - start)
+    return make_grains(xyxy, confs, classes, scores)
 
 # 结果可视化
-def visualize_results(image, results, confidence_threshold=0.5):
+def visualize_results(image, results, confidence_threshold=0.5, copy=True, return_grains=False):
+    grains = score_results(image, results)
+    image_with_boxes, class_counts = draw_grains(image, grains, confidence_threshold, copy)
+    if return_grains:
+        return image_with_boxes, class_counts, grains
+    return image_with_boxes, class_counts
+
+# 按逐粒检测结果统计并绘制
+def draw_grains(image, grains, confidence_threshold=0.5, copy=True):
     class_names = ["WT", "T1-C5-C1", "T1-C5-E5"]
     class_colors = [(255, 0, 0), (0, 0, 255), (255, 0, 255)]
     
-    # 创建图像副本
-    image_with_boxes = image.copy()
+    # 创建图像副本（调用方不再需要原图时可传 copy=False，直接在原图上绘制）
+    image_with_boxes = image.copy() if copy else image
     
     # 统计每个类别的数量和活力
-    class_counts = {name: {"total": 0, "viable": 0, "non_viable": 0} for name in class_names}
+    viability_threshold = get_config('viability', 'threshold', 0.5)
+    class_counts = aggregate(grains, confidence_threshold, viability_threshold)
+    kept = grains[select(grains, confidence_threshold)]
+    detections = [
+        (int(g["x1"]), int(g["y1"]), int(g["x2"]), int(g["y2"]), int(g["cls"]),
+         bool(g["score"] >= viability_threshold), float(g["conf"]))
+        for g in kept
+    ]
     
-    if results.boxes is not None:
-        boxes = results.boxes
-        for box, cls in zip(boxes.xyxy, boxes.cls):
-            # 获取置信度
-            conf = float(box[4]) if len(box) > 4 else 1.0
-            
-            if conf < confidence_threshold:
-                continue
-                
-            # 获取坐标
-            x1, y1, x2, y2 = map(int, box[:4])
-            class_idx = int(cls)
-            class_name = class_names[class_idx]
-            color = class_colors[class_idx]
-            
-            # 计算花粉区域
-            pollen_region = image[y1:y2, x1:x2]
-            
-            # 判断活力
-            is_viable = judge_pollen_viability(pollen_region)
-            
-            # 更新计数
-            class_counts[class_name]["total"] += 1
-            if is_viable:
-                class_counts[class_name]["viable"] += 1
-            else:
-                class_counts[class_name]["non_viable"] += 1
-            
-            # 绘制边界框
-            cv2.rectangle(image_with_boxes, (x1, y1), (x2, y2), color, 2)
-            
-            # 添加标签（使用cv2.putText的替代方法）
+    draw_start = time.perf_counter()
+    
+    # 绘制边界框
+    for x1, y1, x2, y2, class_idx, is_viable, conf in detections:
+        cv2.rectangle(image_with_boxes, (x1, y1), (x2, y2), class_colors[class_idx], 2)
+    
+    # 添加标签：使用PIL进行中文文本渲染，所有标签只做一次数组转换
+    font = load_label_font()
+    if detections and font is not None:
+        img_pil = Image.fromarray(image_with_boxes)
+        draw = ImageDraw.Draw(img_pil)
+        for x1, y1, x2, y2, class_idx, is_viable, conf in detections:
             viability_text = "可育" if is_viable else "不育"
-            label = f"{class_name} ({viability_text}) {conf:.2f}"
-            
-            # 使用PIL进行中文文本渲染
-            img_pil = Image.fromarray(image_with_boxes)
-            draw = ImageDraw.Draw(img_pil)
-            
-            try:
-                # 尝试使用系统中文字体
-                fontpath = "C:/Windows/Fonts/simhei.ttf"  # 使用黑体
-                font = ImageFont.truetype(fontpath, 20)
-                draw.text((x1, y1-25), label, font=font, fill=color[::-1])  # OpenCV的BGR转为RGB
-                image_with_boxes = np.array(img_pil)
-            except Exception as e:
-                # 如果找不到中文字体，回退到默认英文标签
-                cv2.putText(image_with_boxes, label, (x1, y1-10),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+            label = f"{class_names[class_idx]} ({viability_text}) {conf:.2f}"
+            draw.text((x1, y1-25), label, font=font, fill=class_colors[class_idx][::-1])  # OpenCV的BGR转为RGB
+        image_with_boxes[:] = np.asarray(img_pil)
+    else:
+        # 如果找不到中文字体，回退到默认英文标签
+        for x1, y1, x2, y2, class_idx, is_viable, conf in detections:
+            viability_text = "viable" if is_viable else "non-viable"
+            label = f"{class_names[class_idx]} ({viability_text}) {conf:.2f}"
+            cv2.putText(image_with_boxes, label, (x1, y1-10),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, class_colors[class_idx], 2)
+    tracer.record("draw", time.perf_counter() - draw_start)
     
     return image_with_boxes, class_counts
 
+# 获取客户端IP（用于登录限流）
+# 只有配置了前置反向代理（security.trusted_proxies > 0）时才信任代理头：
+# X-Forwarded-For 从右往左数第 trusted_proxies 个地址是最外层代理看到的客户端地址，左侧的内容可由客户端伪造。
+# 没有代理时无法取得客户端地址（Host 头是服务器自己的地址），返回 None，跳过按 IP 限流。
+def get_client_ip():
+    trusted_proxies = int(get_config('security', 'trusted_proxies', 0) or 0)
+    if trusted_proxies <= 0:
+        return None
+    try:
+        from streamlit.web.server.websocket_headers import _get_websocket_headers
+        headers = _get_websocket_headers() or {}
+        forwarded = [part.strip() for part in (headers.get("X-Forwarded-For") or "").split(",") if part.strip()]
+        if len(forwarded) >= trusted_proxies:
+            return forwarded[-trusted_proxies]
+        return headers.get("X-Real-Ip")
+    except Exception:
+        return None
+
+# 显示备份结果
+def show_backup_report(report):
+    failed = [item for item in report if not item["success"]]
+    if failed:
+        st.error("部分数据备份失败：" + "；".join(f"{item['name']}：{item['error']}" for item in failed))
+    else:
+        st.success("数据备份成功！")
+    st.table(pd.DataFrame([
+        {
+            "数据": item["name"],
+            "备份文件": item["backup"] or "-",
+            "原始大小(KB)": round(item.get("source_bytes", 0) / 1024, 1),
+            "压缩后(KB)": round(item.get("backup_bytes", 0) / 1024, 1),
+            "耗时(秒)": round(item["seconds"], 2)
+        }
+        for item in report
+    ]))
+
 def login_page():
     """登录页面"""
     # 页面标题
@@ -211,7 +298,11 @@ def login_page():
             
             if st.button("登 录", use_container_width=True):
                 if login_identifier and login_password:
-                    success, result = user_mgmt.login(login_identifier, login_password)
+                    success, result = user_mgmt.login(login_identifier, login_password, get_client_ip())
+                    # 日志中不记录明文邮箱或手机号：成功时记录用户 ID，失败时记录标识的摘要
+                    logger.info("用户登录" if success else "登录失败",
+                                extra={"fields": {"user_id": result["id"], "success": True} if success else
+                                       {"identifier_digest": identifier_digest(login_identifier), "success": False}})
                     if success:
                         st.session_state.user = result
                         st.session_state.authenticated = True
@@ -269,6 +360,7 @@ def main_app():
     user_info = st.session_state.user
     st.sidebar.write(f"欢迎, {user_info['username']}")
     if st.sidebar.button("退出登录"):
+        user_mgmt.logout(user_info.get('session_token'))
         st.session_state.clear()
         st.experimental_rerun()
     
@@ -278,7 +370,7 @@ def main_app():
     if role == "admin":
         nav_options = ["花粉检测", "知识科普", "案例分享", "系统管理"]
     elif role == "professional":
-        nav_options = ["花粉检测", "专业分析", "知识科普", "案例分享", "数据管理"]
+        nav_options = ["花粉检测", "专业分析", "视频分析", "知识科普", "案例分享", "数据管理"]
     else:
         nav_options = ["花粉检测", "知识科普", "案例分享"]
     
@@ -299,76 +391,13 @@ def main_app():
                 help="调整检测结果的置信度阈值，值越高要求越严格"
             )
             advanced_mode = st.sidebar.checkbox("启用高级分析模式")
+            use_tta = st.sidebar.checkbox("测试时增强（TTA）", value=bool(get_tta_config()["enabled"]),
+                                          help="对翻转、旋转后的图片一起检测并融合结果，对拍摄方向不敏感，但耗时更长")
         else:
             confidence_threshold = 0.5
             advanced_mode = False
+            use_tta = bool(get_tta_config()["enabled"])
         
-        # 创建可视化图表
-        def create_visualizations(current_data, historical_data):
-            # 1. 当前样本品种分布饼图
-            fig_pie = px.pie(
-                values=[current_data[name]["total"] for name in ["WT", "T1-C5-C1", "T1-C5-E5"]],
-                names=["WT", "T1-C5-C1", "T1-C5-E5"],
-                title="花粉品种分布",
-                hole=0.3
-            )
-            
-            # 2. 当前样本活力状态堆叠柱状图
-            viable_data = []
-            non_viable_data = []
-            categories = []
-            for name in ["WT", "T1-C5-C1", "T1-C5-E5"]:
-                if current_data[name]["total"] > 0:
-                    categories.append(name)
-                    viable_data.append(current_data[name]["viable"])
-                    non_viable_data.append(current_data[name]["non_viable"])
-            
-            fig_bar = go.Figure(data=[
-                go.Bar(name="可育", x=categories, y=viable_data),
-                go.Bar(name="不育", x=categories, y=non_viable_data)
-            ])
-            fig_bar.update_layout(
-                barmode='stack',
-                title="各品种活力状态分布",
-                xaxis_title="花粉品种",
-                yaxis_title="数量"
-            )
-            
-            # 3. 历史趋势分析
-            if historical_data:
-                dates = []
-                wt_viability = []
-                t1_c5_c1_viability = []
-                t1_c5_e5_viability = []
-                
-                for record in historical_data[-10:]:  # 显示最近10条记录
-                    dates.append(record["timestamp"])
-                    for name in ["WT", "T1-C5-C1", "T1-C5-E5"]:
-                        total = record["data"][name]["total"]
-                        viable = record["data"][name]["viable"]
-                        viability_rate = (viable / total * 100) if total > 0 else 0
-                        
-                        if name == "WT":
-                            wt_viability.append(viability_rate)
-                        elif name == "T1-C5-C1":
-                            t1_c5_c1_viability.append(viability_rate)
-                        else:
-                            t1_c5_e5_viability.append(viability_rate)
-                
-                fig_line = go.Figure()
-                fig_line.add_trace(go.Scatter(x=dates, y=wt_viability, name="WT"))
-                fig_line.add_trace(go.Scatter(x=dates, y=t1_c5_c1_viability, name="T1-C5-C1"))
-                fig_line.add_trace(go.Scatter(x=dates, y=t1_c5_e5_viability, name="T1-C5-E5"))
-                fig_line.update_layout(
-                    title="花粉活力率历史趋势",
-                    xaxis_title="时间",
-                    yaxis_title="活力率(%)"
-                )
-                
-                return fig_pie, fig_bar, fig_line
-            
-            return fig_pie, fig_bar, None
-
         # 添加说明文字
         st.markdown("""
         ### 使用说明
@@ -387,33 +416,71 @@ def main_app():
             uploaded_file = st.file_uploader("选择图片", type=['jpg', 'jpeg', 'png'])
             
             if uploaded_file is not None:
-                # 检查文件大小
-                file_size = len(uploaded_file.getvalue()) / (1024 * 1024)  # 转换为MB
-                if file_size > 5:
-                    st.error("文件大小超过5MB限制，请选择更小的文件。")
-                    return
-                    
-                # 读取图片
+                # 读取图片（根据文件大小和文件头校验后再解码）
                 try:
-                    image_bytes = uploaded_file.read()
-                    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
-                    
-                    # 检查图片分辨率
-                    height, width = image.shape[:2]
-                    if width * height > 4000 * 3000:
-                        st.error("图片分辨率过高，请使用更小的图片（建议不超过4000x3000）。")
+                    success, decoded = decode_upload(uploaded_file)
+                    if not success:
+                        st.error(decoded)
                         return
+                    image = decoded["image"]
+                    width, height = decoded["width"], decoded["height"]
                         
                     # 显示原始图片
-                    st.image(image_bytes, caption="上传的图片", use_column_width=True)
+                    st.image(uploaded_file, caption="上传的图片", use_column_width=True)
                     
-                    # 处理图片
+                    # 重复检测：完全相同的图片直接复用之前的检测结果，近似图片（含翻转）提示避免重复计入统计
+                    image_hash = content_hash(uploaded_file.getbuffer())
+                    current_model = model_key(use_tta, image.shape)
+                    grains = None
+                    duplicate = None
+                    count_duplicate = False
+                    if get_config('dedup', 'enabled', True):
+                        with tracer.span("dedup.lookup"):
+                            phashes = phash_variants(image)
+                            duplicate = image_index.find(image_hash, phashes)
+                        if duplicate and duplicate["exact"]:
+                            # 只复用同一模型权重和 TTA 设置下的结果，模型更新后重新检测
+                            stored = analysis_history.load_grains(image_hash, current_model)
+                            if stored is not None:
+                                grains = unpack(stored)
+                                if st.session_state.get("saved_upload") != image_hash:
+                                    st.info(f"该图片已于 {duplicate['timestamp']} 分析过，直接使用之前的检测结果")
+                            else:
+                                st.warning(f"该图片已于 {duplicate['timestamp']} 用其他模型或推理设置分析过，"
+                                           "本次重新检测；为避免重复计入统计，本次结果默认不保存")
+                                count_duplicate = st.checkbox("仍然计入历史统计", key=f"count_duplicate_{image_hash}")
+                        elif duplicate:
+                            st.warning(f"该图片与已分析的 {duplicate['filename']}（{duplicate['timestamp']}）"
+                                       f"高度相似（{duplicate['variant']}，汉明距离 {duplicate['distance']}），"
+                                       "为避免重复计入统计，本次结果默认不保存")
+                            count_duplicate = st.checkbox("仍然计入历史统计", key=f"count_duplicate_{image_hash}")
+                    
+                    # 处理图片（直接在解码缓冲区上绘制，不再复制整帧）
                     with st.spinner("正在分析图片..."):
-                        results = load_model()(image)
-                        processed_image, class_counts = visualize_results(image, results[0])
+                        if grains is None:
+                            if use_tta:
+                                # 原图置信度已经足够高时跳过增强视图（快速通道）
+                                results, tta_info = predict_tta(load_model(), image)
+                                if tta_info["tta"]:
+                                    st.caption(f"已使用 {tta_info['views']} 个视图的测试时增强，"
+                                               f"耗时 {tta_info['seconds']:.2f} 秒")
+                            else:
+                                results = run_model(load_model(), image)
+                            grains = score_results(image, results[0])
+                        
+                        # 专业用户：在绘制前批量测量全部花粉的形态
+                        morphology_summary = {}
+                        if role == "professional":
+                            with tracer.span("morphology"):
+                                kept = grains[select(grains, confidence_threshold)]
+                                boxes = np.stack([kept["x1"], kept["y1"], kept["x2"], kept["y2"]], axis=1)
+                                morphology_summary = summarize_by_class(
+                                    measure_grains(image, boxes, decoded["scale"]), kept["cls"])
+                        
+                        processed_image, class_counts = draw_grains(image, grains, confidence_threshold, copy=False)
                     
                     # 显示处理后的图片
-                    st.image(cv2.cvtColor(processed_image, cv2.COLOR_BGR2RGB), 
+                    st.image(processed_image, channels="BGR",
                             caption="分析结果", use_column_width=True)
                     
                     # 在右侧列显示统计信息
@@ -430,36 +497,61 @@ def main_app():
                                     st.markdown(f"- 活力率：{viability_rate:.1f}%")
                                 
                                 # 专业用户额外信息
-                                if role == "professional":
+                                if role == "professional" and class_name in morphology_summary:
+                                    morph = morphology_summary[class_name]
+                                    diameter = morph["distributions"]["diameter_um"]
                                     st.markdown("##### 详细指标")
-                                    st.markdown(f"- 形态完整度：{random.randint(85, 99)}%")
-                                    st.markdown(f"- 细胞质密度指数：{random.uniform(0.8, 1.0):.2f}")
-                                    st.markdown(f"- 发育阶段：{'成熟期' if random.random() > 0.3 else '发育期'}")
+                                    st.markdown(f"- 平均直径：{diameter['mean']:.1f} µm（P10–P90：{diameter['p10']:.1f}–{diameter['p90']:.1f} µm）")
+                                    st.markdown(f"- 离心率：{morph['distributions']['eccentricity']['mean']:.2f}")
+                                    st.markdown(f"- 形态完整度：{morph['integrity']:.0f}%")
+                                    st.markdown(f"- 细胞质密度指数：{morph['density_index']:.2f}")
+                                    st.markdown(f"- 发育阶段：{morph['stage']}（成熟 {morph['mature_ratio']:.0%}）")
                                 st.markdown("---")
                     
                     # 保存当前分析数据
                     current_data = {
                         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                         "filename": uploaded_file.name,
+                        "image_hash": image_hash,
                         "data": class_counts
                     }
-                    save_analysis_data(current_data)
-                    
-                    # 加载历史数据
-                    historical_data = load_historical_data()
+                    # 同一文件只保存一次，调整侧边栏等操作引起的重跑不会重复写入历史
+                    upload_key = image_hash
+                    if st.session_state.get("saved_upload") != upload_key and (duplicate is None or count_duplicate):
+                        with tracer.span("detection.save"):
+                            save_analysis_data(current_data, grains, current_model)
+                            if get_config('dedup', 'enabled', True):
+                                image_index.add(image_hash, phashes["原图"], uploaded_file.name, current_data["timestamp"],
+                                                crop_hashes(image))
+                        # 主动学习：用本次的检测结果评估信息量，信息量高的图片进入标注队列（不额外推理）
+                        with tracer.span("active_learning.offer"):
+                            try:
+                                offer_for_labeling(analysis_history, image_hash, uploaded_file.getbuffer(),
+                                                   uploaded_file.name, grains, image.shape[1], image.shape[0],
+                                                   current_data["timestamp"])
+                            except Exception:
+                                logger.exception("加入标注队列失败")
+                        st.session_state.saved_upload = upload_key
+                        logger.info("花粉检测完成", extra={"fields": {
+                            "user": user_info['username'],
+                            "filename": uploaded_file.name,
+                            "counts": {name: counts["total"] for name, counts in class_counts.items()}
+                        }})
                     
-                    # 创建可视化图表
-                    fig_pie, fig_bar, fig_line = create_visualizations(class_counts, historical_data)
-                    
-                    # 显示图表
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.plotly_chart(fig_pie, use_container_width=True)
-                    with col2:
-                        st.plotly_chart(fig_bar, use_container_width=True)
-                    
-                    if fig_line:
-                        st.plotly_chart(fig_line, use_container_width=True)
+                    with tracer.span("detection.charts"):
+                        # 图表按 (当前计数, 历史数据版本) 缓存，输入不变时不读取历史、不重建图表
+                        pie_json, bar_json, line_json, history_summary = detection_figures_json(
+                            analysis_history, class_counts)
+                        
+                        # 显示图表
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            st.plotly_chart(pio.from_json(pie_json), use_container_width=True)
+                        with col2:
+                            st.plotly_chart(pio.from_json(bar_json), use_container_width=True)
+                        
+                        if line_json:
+                            st.plotly_chart(pio.from_json(line_json), use_container_width=True)
                     
                     # 显示详细统计表格
                     with st.expander("详细统计数据", expanded=True):
@@ -479,12 +571,27 @@ def main_app():
                         
                         st.table(pd.DataFrame(stats_data))
                         
+                        # 专业用户：各类别形态指标分布
+                        if morphology_summary:
+                            st.markdown("#### 形态指标分布")
+                            field_labels = {"diameter_um": "直径(µm)", "area_um2": "面积(µm²)", "eccentricity": "离心率",
+                                            "circularity": "圆度", "intensity": "胞质灰度"}
+                            st.table(pd.DataFrame([{
+                                "花粉类型": name,
+                                "指标": label,
+                                "均值": round(morph["distributions"][field]["mean"], 2),
+                                "标准差": round(morph["distributions"][field]["std"], 2),
+                                "P10": round(morph["distributions"][field]["p10"], 2),
+                                "P50": round(morph["distributions"][field]["p50"], 2),
+                                "P90": round(morph["distributions"][field]["p90"], 2)
+                            } for name, morph in morphology_summary.items() for field, label in field_labels.items()]))
+                        
                         # 显示历史记录摘要
-                        if historical_data:
+                        if history_summary["total"]:
                             st.markdown("#### 历史记录摘要")
-                            st.markdown(f"- 总记录数：{len(historical_data)}条")
-                            st.markdown(f"- 最早记录：{historical_data[0]['timestamp']}")
-                            st.markdown(f"- 最新记录：{historical_data[-1]['timestamp']}")
+                            st.markdown(f"- 总记录数：{history_summary['total']}条")
+                            st.markdown(f"- 最早记录：{history_summary['first']}")
+                            st.markdown(f"- 最新记录：{history_summary['last']}")
                     
                     # 专业用户特有的数据导出功能
                     if role == "professional":
@@ -509,6 +616,7 @@ def main_app():
                                 mime="application/json"
                             )
                 except Exception as e:
+                    logger.exception("处理图片失败")
                     st.error(f"处理图片时出错：{str(e)}")
         
         # 添加页脚
@@ -542,12 +650,15 @@ def main_app():
                     status_text.text(f"正在处理: {uploaded_file.name}")
                     
                     # 读取图片
-                    image_bytes = uploaded_file.read()
-                    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+                    success, decoded = decode_upload(uploaded_file)
+                    if not success:
+                        st.error(f"{uploaded_file.name}：{decoded}")
+                        continue
+                    image = decoded["image"]
                     
                     # 处理图片
-                    results = model(image)
-                    processed_image, class_counts = visualize_results(image, results[0])
+                    results = run_model(model, image)
+                    processed_image, class_counts = visualize_results(image, results[0], copy=False)
                     
                     # 保存结果
                     batch_results.append({
@@ -559,7 +670,7 @@ def main_app():
                     # 显示缩略图和结果
                     col1, col2 = st.columns(2)
                     with col1:
-                        st.image(cv2.cvtColor(processed_image, cv2.COLOR_BGR2RGB), 
+                        st.image(processed_image, channels="BGR",
                                 caption=f"分析结果 - {uploaded_file.name}",
                                 width=300)
                     with col2:
@@ -571,6 +682,7 @@ def main_app():
                                 st.write(f"- 可育率：{(counts['viable']/counts['total']*100):.1f}%")
                     
                 except Exception as e:
+                    logger.exception(f"批量处理 {uploaded_file.name} 失败")
                     st.error(f"处理 {uploaded_file.name} 时出错：{str(e)}")
             
             # 完成处理
@@ -626,96 +738,47 @@ def main_app():
         analysis_period = st.selectbox("选择分析周期", ["最近一周", "最近一月", "最近三月", "全部数据"])
         
         # 加载历史数据
-        historical_data = load_historical_data()
-        if historical_data and analysis_period:
-            # 根据选择的时间段筛选数据
-            current_time = datetime.now()
-            if analysis_period == "最近一周":
-                days = 7
-            elif analysis_period == "最近一月":
-                days = 30
-            elif analysis_period == "最近三月":
-                days = 90
-            else:
-                days = None
-                
-            if days:
-                filtered_data = [
-                    record for record in historical_data
-                    if (current_time - datetime.strptime(record["timestamp"], "%Y-%m-%d %H:%M:%S")).days <= days
-                ]
-            else:
-                filtered_data = historical_data
-            
-            if filtered_data:
-                # 创建趋势图
-                dates = [record["timestamp"] for record in filtered_data]
-                wt_viability = []
-                t1_c5_c1_viability = []
-                t1_c5_e5_viability = []
-                
-                for record in filtered_data:
-                    for name in ["WT", "T1-C5-C1", "T1-C5-E5"]:
-                        data = record["data"][name]
-                        total = data["total"]
-                        viable = data["viable"]
-                        viability_rate = (viable / total * 100) if total > 0 else 0
-                        
-                        if name == "WT":
-                            wt_viability.append(viability_rate)
-                        elif name == "T1-C5-C1":
-                            t1_c5_c1_viability.append(viability_rate)
-                        else:
-                            t1_c5_e5_viability.append(viability_rate)
-                
-                fig = go.Figure()
-                fig.add_trace(go.Scatter(x=dates, y=wt_viability, name="WT", mode="lines+markers"))
-                fig.add_trace(go.Scatter(x=dates, y=t1_c5_c1_viability, name="T1-C5-C1", mode="lines+markers"))
-                fig.add_trace(go.Scatter(x=dates, y=t1_c5_e5_viability, name="T1-C5-E5", mode="lines+markers"))
-                
-                fig.update_layout(
-                    title=f"花粉活力率趋势分析 ({analysis_period})",
-                    xaxis_title="时间",
-                    yaxis_title="活力率(%)",
-                    hovermode="x unified"
-                )
-                
-                st.plotly_chart(fig, use_container_width=True)
+        trend_start = time.perf_counter()
+        # 根据选择的时间段在数据库端筛选数据（超过保留期的部分为按天汇总的数据）
+        if analysis_period == "最近一周":
+            days = 7
+        elif analysis_period == "最近一月":
+            days = 30
+        elif analysis_period == "最近三月":
+            days = 90
+        else:
+            days = None
+        # 只查询记录数，趋势图和统计结果都有各自的缓存
+        with tracer.span("analysis.load_history"):
+            has_history = analysis_history.summary()["total"] > 0
+        if has_history and analysis_period:
+            # 趋势图在服务端降采样后缓存为 JSON，数据版本不变时不重新读取和计算
+            figure_json = trend_figure_json(analysis_history, days, f"花粉活力率趋势分析 ({analysis_period})")
+            if figure_json:
+                st.plotly_chart(pio.from_json(figure_json), use_container_width=True)
+                tracer.record("analysis.trend_chart", time.perf_counter() - trend_start)
             else:
                 st.info("所选时间段内没有分析记录")
         else:
             st.info("暂无历史数据可供分析")
         
         st.subheader("实验对照分析")
-        if historical_data:
+        if has_history:
             control_group = st.selectbox("选择对照组", ["WT", "T1-C5-C1", "T1-C5-E5"])
             if control_group:
-                # 计算对照组的基准数据
-                control_data = []
-                experimental_data = []
-                
-                for record in historical_data:
-                    control_stats = record["data"][control_group]
-                    control_viability = (control_stats["viable"] / control_stats["total"] * 100) if control_stats["total"] > 0 else 0
-                    control_data.append(control_viability)
-                    
-                    # 计算其他组的平均值
-                    other_groups = [g for g in ["WT", "T1-C5-C1", "T1-C5-E5"] if g != control_group]
-                    exp_viability = []
-                    for group in other_groups:
-                        stats = record["data"][group]
-                        if stats["total"] > 0:
-                            exp_viability.append(stats["viable"] / stats["total"] * 100)
-                    
-                    if exp_viability:
-                        experimental_data.append(sum(exp_viability) / len(exp_viability))
-                    else:
-                        experimental_data.append(0)
+                control_start = time.perf_counter()
+                # 各类别活力率向量在 SQLite/NumPy 中计算，结果按数据版本缓存
+                result = history_control_analysis(analysis_history, control_group)
                 
-                # 创建对照分析图表
+                # 创建对照分析图表（箱线图使用预先计算的分位数，不传输全部数据点）
                 fig = go.Figure()
-                fig.add_trace(go.Box(y=control_data, name=f"{control_group}（对照组）"))
-                fig.add_trace(go.Box(y=experimental_data, name="实验组平均值"))
+                for name, summary in result["classes"].items():
+                    fig.add_trace(go.Box(
+                        name=f"{name}（对照组）" if name == control_group else name,
+                        q1=[summary["q1"]], median=[summary["median"]], q3=[summary["q3"]],
+                        lowerfence=[summary["lower_fence"]], upperfence=[summary["upper_fence"]],
+                        mean=[summary["mean"]]
+                    ))
                 
                 fig.update_layout(
                     title="对照组与实验组活力率对比",
@@ -726,22 +789,149 @@ def main_app():
                 
                 # 显示统计分析
                 st.write("#### 统计分析")
-                st.write(f"对照组 ({control_group}):")
-                st.write(f"- 平均活力率：{np.mean(control_data):.1f}%")
-                st.write(f"- 标准差：{np.std(control_data):.1f}%")
-                st.write("实验组：")
-                st.write(f"- 平均活力率：{np.mean(experimental_data):.1f}%")
-                st.write(f"- 标准差：{np.std(experimental_data):.1f}%")
+                st.caption("样本为保留期内逐张图片的活力率；已汇总为日数据的历史不计入")
+                st.table(pd.DataFrame([{
+                    "花粉类型": f"{name}（对照组）" if name == control_group else name,
+                    "样本数": summary["n"],
+                    "平均活力率": f"{summary['mean']:.1f}%",
+                    "标准差": f"{summary['std']:.1f}%",
+                    "95%置信区间": f"{summary['ci'][0]:.1f}% ~ {summary['ci'][1]:.1f}%"
+                } for name, summary in result["classes"].items()]))
+                
+                if result["anova"]:
+                    p_value = result["anova"]["p"]
+                    st.write(f"单因素方差分析（{result['anova']['groups']} 组）：F = {result['anova']['f']:.2f}，p = {p_value:.4g}，"
+                             f"{'组间差异显著' if p_value < 0.05 else '组间差异不显著'}")
                 
-                # 计算差异显著性
-                if len(control_data) > 1 and len(experimental_data) > 1:
-                    from scipy import stats
-                    t_stat, p_value = stats.ttest_ind(control_data, experimental_data)
-                    st.write(f"差异显著性检验（t检验）:")
-                    st.write(f"- p值：{p_value:.4f}")
-                    st.write(f"- 结论：{'差异显著' if p_value < 0.05 else '差异不显著'} (p {'<' if p_value < 0.05 else '>'} 0.05)")
+                # 计算差异显著性（与对照组逐一比较，p 值经 Holm 校正）
+                if result["pairs"]:
+                    st.write("与对照组的差异显著性检验（Welch t 检验、Mann-Whitney U 检验，Holm 校正）:")
+                    st.table(pd.DataFrame([{
+                        "实验组": pair["group"],
+                        "活力率差值": f"{pair['diff']:+.1f}%",
+                        "差值95%置信区间": f"{pair['diff_ci'][0]:+.1f}% ~ {pair['diff_ci'][1]:+.1f}%",
+                        "Welch t": f"{pair['welch_t']:.2f}",
+                        "Welch p值": f"{pair['welch_p_holm']:.4g}",
+                        "Mann-Whitney p值": f"{pair['mw_p_holm']:.4g}",
+                        "结论": "差异显著" if pair["welch_p_holm"] < 0.05 else "差异不显著"
+                    } for pair in result["pairs"]]))
+                tracer.record("analysis.control_group", time.perf_counter() - control_start)
         else:
             st.info("暂无数据可供分析")
+        
+        st.subheader("按新规则重新统计")
+        st.caption("使用已保存的逐粒检测结果重新统计，不需要重新运行模型。逐粒结果按图片内容保存，"
+                   "同一张图片多次分析只统计一次（最近一次的结果），因此总数可能少于上面按分析记录的统计")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            rescore_confidence = st.slider("置信度阈值", 0.0, 1.0, 0.5, 0.05, key="rescore_confidence")
+        with col2:
+            rescore_viability = st.slider("可育概率阈值", 0.0, 1.0, float(get_config('viability', 'threshold', 0.5)),
+                                          0.05, key="rescore_viability")
+        with col3:
+            rescore_min_area = st.number_input("最小面积（像素）", min_value=0, value=0, step=50, key="rescore_min_area")
+        # 重新统计需要读取全部逐粒结果，只在点击按钮时运行，结果保存在会话中
+        if st.button("重新统计"):
+            with tracer.span("analysis.rescore"):
+                st.session_state.rescored = rescore_history(analysis_history, rescore_confidence, rescore_viability,
+                                                            rescore_min_area)
+        rescored = st.session_state.get("rescored")
+        if rescored is None:
+            st.info("调整阈值后点击“重新统计”")
+        elif rescored:
+            totals = {name: {"total": sum(r["data"][name]["total"] for r in rescored),
+                             "viable": sum(r["data"][name]["viable"] for r in rescored)}
+                      for name in ["WT", "T1-C5-C1", "T1-C5-E5"]}
+            st.table(pd.DataFrame([{
+                "花粉类型": name,
+                "总数量": counts["total"],
+                "可育数量": counts["viable"],
+                "可育率": f"{counts['viable'] / counts['total'] * 100:.1f}%" if counts["total"] else "0%"
+            } for name, counts in totals.items()]))
+            st.caption(f"共 {len(rescored)} 张图片")
+        else:
+            st.info("暂无逐粒检测记录")
+
+    elif nav_option == "视频分析" and role == "professional":
+        st.title("视频 / 延时摄影分析")
+        st.write("按帧间隔抽帧检测，跨帧跟踪同一粒花粉只计数一次，并给出活力率随时间的变化。")
+
+        stream_config = get_stream_config()
+        source_type = st.radio("数据来源", ["视频文件", "摄像头"], horizontal=True)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            stride = st.number_input("检测间隔（帧）", min_value=1, max_value=300, value=int(stream_config["stride"]))
+        with col2:
+            max_frames = st.number_input("最多读取帧数（0 为不限）", min_value=0, value=0 if source_type == "视频文件" else 3000)
+        with col3:
+            stream_conf = st.slider("置信度阈值", 0.0, 1.0, 0.5, 0.05, key="stream_conf")
+
+        video_file, camera = None, None
+        if source_type == "视频文件":
+            video_file = st.file_uploader("上传视频", type=['mp4', 'avi', 'mov', 'mkv'])
+        else:
+            camera = st.number_input("摄像头编号", min_value=0, max_value=9, value=0)
+
+        # 点击“停止分析”时 Streamlit 会中断正在运行的脚本并重新运行，分析循环本身收不到停止信号；
+        # 因此每个检测帧都把当前结果保存到会话中，重新运行后展示停止前的结果
+        if (video_file is not None or camera is not None) and st.button("开始分析"):
+            st.session_state.stream_result = None
+            st.button("停止分析")
+            model = load_model()
+            frame_view = st.empty()
+            status_text = st.empty()
+
+            def detect(frame):
+                return score_results(frame, run_model(model, frame)[0])
+
+            def on_progress(frame_idx, frame, partial):
+                st.session_state.stream_result = {**partial, "stopped": True}
+                total = sum(c["total"] for c in partial["counts"].values())
+                status_text.text(f"第 {frame_idx} 帧，已计数 {total} 粒花粉")
+                frame_view.image(frame, channels="BGR", width=480)
+
+            temp_path = None
+            try:
+                if video_file is not None:
+                    # OpenCV 只能按路径读取视频：点击开始后才分块复制到临时文件，不把整个视频读入内存
+                    video_file.seek(0)
+                    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(video_file.name)[1], delete=False) as temp:
+                        temp_path = temp.name
+                        shutil.copyfileobj(video_file, temp)
+                    source = temp_path
+                else:
+                    source = camera
+                with st.spinner("正在分析..."):
+                    result = analyze_stream(source, detect, stride=stride, max_frames=max_frames or None,
+                                            confidence_threshold=stream_conf, on_progress=on_progress)
+                if result is None:
+                    st.error("无法打开视频或摄像头")
+                else:
+                    st.session_state.stream_result = {**result, "stopped": False}
+            except Exception as e:
+                logger.exception("视频分析失败")
+                st.session_state.stream_result = None
+                st.error(f"视频分析出错：{str(e)}")
+            finally:
+                if temp_path:
+                    os.remove(temp_path)
+
+        result = st.session_state.get("stream_result")
+        if result:
+            if result["stopped"]:
+                st.warning("分析已停止，以下为停止前的结果")
+            st.caption(f"共读取 {result['frames']} 帧，检测 {result['analysed']} 帧，耗时 {result['seconds']:.1f} 秒")
+            st.write("#### 去重后的花粉统计")
+            st.table(pd.DataFrame([{
+                "类别": name,
+                "总数量": counts["total"],
+                "可育数量": counts["viable"],
+                "可育率": f"{counts['viable'] / counts['total'] * 100:.1f}%" if counts["total"] else "0%"
+            } for name, counts in result["counts"].items()]))
+            if result["series"]:
+                series = pd.DataFrame(result["series"])
+                fig = px.line(series, x="时间(秒)", y="活力率(%)", hover_data=["检测数"], title="活力率随时间变化")
+                st.plotly_chart(fig, use_container_width=True)
 
     elif nav_option == "知识科普":
         if role == "professional":
@@ -763,49 +953,128 @@ def main_app():
         st.title("数据管理")
         
         st.subheader("历史数据管理")
-        historical_data = load_historical_data()
+        # 只读取最近 1000 条记录用于展示，导出时再逐批读取全部历史
+        historical_data = analysis_history.latest_records(1000)
         if historical_data:
-            df = pd.DataFrame(historical_data)
-            st.dataframe(df)
+            # 按类别展开为平铺的列
+            st.dataframe(pd.DataFrame([flatten_record(record) for record in historical_data]))
             
+            export_format = st.selectbox("导出格式", available_formats())
             if st.button("导出所有数据"):
-                st.download_button(
-                    "下载CSV文件",
-                    data=df.to_csv(index=False),
-                    file_name=f"花粉分析数据_{datetime.now().strftime('%Y%m%d')}.csv",
-                    mime="text/csv"
-                )
+                with st.spinner("正在导出数据..."):
+                    # 逐批写入导出文件，不在内存中构造完整表格
+                    export_path, mime = export_history(analysis_history, export_format)
+                with open(export_path, 'rb') as f:
+                    st.download_button(
+                        f"下载{export_format.upper()}文件",
+                        data=f,
+                        file_name=os.path.basename(export_path),
+                        mime=mime
+                    )
         
+        st.subheader("主动学习标注队列")
+        queue = analysis_history.labeling_queue(limit=200)
+        if queue:
+            st.dataframe(pd.DataFrame([{
+                "文件名": entry["filename"],
+                "时间": entry["timestamp"],
+                "信息量": round(entry["score"], 3),
+                "低置信度比例": f"{entry['uncertainty']:.0%}",
+                "类别冲突比例": f"{entry['disagreement']:.0%}"
+            } for entry in queue]))
+            col1, col2 = st.columns(2)
+            with col1:
+                export_count = st.number_input("导出数量", min_value=1, max_value=len(queue), value=min(20, len(queue)))
+            with col2:
+                export_split = st.selectbox("导出到", ["train", "val"])
+            if st.button("导出为 YOLO 标注数据"):
+                exported = export_queue(analysis_history, export_count, export_split)
+                st.success(f"已导出 {len(exported)} 张图片到 datasets/flower/images/{export_split}，"
+                           "预填标注需人工校正后再用于训练")
+        else:
+            st.info("暂无待标注图片")
+
         st.subheader("数据备份")
         if st.button("创建数据备份"):
-            # 实现数据备份逻辑
-            st.success("数据备份成功！")
+            show_backup_report(backup_manager.run_backup())
 
     elif nav_option == "系统管理" and role == "admin":
         st.title("系统管理")
         
         # 用户管理
         st.subheader("用户管理")
-        users = user_mgmt.get_all_users()
+        
+        # 筛选条件（在数据库端筛选和分页）
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            user_search = st.text_input("搜索用户名/邮箱/手机号")
+        with col2:
+            role_filter = st.selectbox("用户类型", ["全部", "admin", "professional", "user"])
+        with col3:
+            status_filter = st.selectbox("账号状态", ["全部", "active", "disabled"])
+        page_size = 50
+        page = st.number_input("页码", min_value=1, value=1, step=1)
+        users, total_users = user_mgmt.get_users_page(
+            page=page,
+            page_size=page_size,
+            search=user_search or None,
+            role=None if role_filter == "全部" else role_filter,
+            status=None if status_filter == "全部" else status_filter
+        )
+        st.caption(f"共 {total_users} 个用户，第 {page} / {max(1, (total_users + page_size - 1) // page_size)} 页")
+        
         if users:
             user_df = pd.DataFrame(users)
             st.dataframe(user_df)
             
-            # 用户操作
-            selected_user = st.selectbox("选择用户", user_df['username'])
+            # 批量操作
+            selected_users = st.multiselect("选择用户", user_df['username'])
             col1, col2, col3 = st.columns(3)
             with col1:
-                if st.button("禁用用户"):
-                    user_mgmt.disable_user(selected_user)
-                    st.success(f"已禁用用户 {selected_user}")
+                if st.button("禁用用户") and selected_users:
+                    user_mgmt.set_users_status(selected_users, 'disabled')
+                    st.success(f"已禁用 {len(selected_users)} 个用户")
             with col2:
-                if st.button("启用用户"):
-                    user_mgmt.enable_user(selected_user)
-                    st.success(f"已启用用户 {selected_user}")
+                if st.button("启用用户") and selected_users:
+                    user_mgmt.set_users_status(selected_users, 'active')
+                    st.success(f"已启用 {len(selected_users)} 个用户")
             with col3:
-                if st.button("删除用户"):
-                    user_mgmt.delete_user(selected_user)
-                    st.success(f"已删除用户 {selected_user}")
+                if st.button("删除用户") and selected_users:
+                    user_mgmt.delete_users(selected_users)
+                    st.success(f"已删除 {len(selected_users)} 个用户")
+        
+        # 批量导入/导出
+        with st.expander("批量导入/导出用户"):
+            st.markdown("CSV 列：`username, password, email, phone, role`（email、phone、role 可选，role 为 user 或 professional）")
+            users_csv = st.file_uploader("上传用户CSV", type=['csv'])
+            if users_csv is not None and st.button("导入用户"):
+                try:
+                    with st.spinner("正在导入用户..."):
+                        imported, import_errors = user_mgmt.import_users_csv(users_csv.getvalue())
+                except Exception as e:
+                    logger.exception("导入用户失败")
+                    st.error(f"导入用户时出错：{str(e)}")
+                else:
+                    st.success(f"成功导入 {imported} 个用户")
+                    if import_errors:
+                        st.warning(f"{len(import_errors)} 行未导入（行号 0 表示整个文件）")
+                        st.table(pd.DataFrame(import_errors, columns=["行号", "原因"]))
+            
+            if st.button("导出用户CSV"):
+                # 逐块写入临时文件，不在内存中拼接完整 CSV
+                with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as temp:
+                    export_path = temp.name
+                try:
+                    user_mgmt.write_users_csv(export_path)
+                    with open(export_path, 'rb') as f:
+                        st.download_button(
+                            "下载用户CSV",
+                            data=f,
+                            file_name=f"users_{datetime.now().strftime('%Y%m%d')}.csv",
+                            mime="text/csv"
+                        )
+                finally:
+                    os.remove(export_path)
         
         # 系统设置
         st.subheader("系统设置")
@@ -818,23 +1087,92 @@ def main_app():
         # 数据库管理
         st.subheader("数据库管理")
         if st.button("备份数据库"):
-            # TODO: 实现数据库备份
-            st.success("数据库备份成功")
+            show_backup_report(backup_manager.run_backup())
+        backups = backup_manager.list_backups()
+        if backups:
+            st.caption(f"已有 {len(backups)} 份备份，最新：{backups[0]}（恢复请使用 python backup.py restore）")
         
         if st.button("清理历史数据"):
-            # TODO: 实现数据清理
-            st.success("历史数据清理成功")
+            with st.spinner("正在汇总并归档历史数据..."):
+                result = analysis_history.compact()
+            st.success(f"历史数据清理成功：{result['compacted']} 条早于 {result['cutoff']} 的记录已汇总为日数据"
+                       f"（当前原始记录 {result['raw']} 条，日汇总 {result['aggregated_days']} 天）")
+        
+        # 性能监控
+        st.subheader("性能监控")
+        stage_stats = tracer.summary()
+        if stage_stats:
+            st.dataframe(pd.DataFrame([
+                {
+                    "阶段": stage,
+                    "次数": stats["count"],
+                    "p50(ms)": round(stats["p50_ms"], 2),
+                    "p95(ms)": round(stats["p95_ms"], 2),
+                    "p99(ms)": round(stats["p99_ms"], 2),
+                    "总耗时(ms)": round(stats["total_ms"], 1)
+                }
+                for stage, stats in stage_stats.items()
+            ]))
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.download_button(
+                    "导出JSON",
+                    data=tracer.to_json(),
+                    file_name=f"stage_latency_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                    mime="application/json"
+                )
+            with col2:
+                st.download_button(
+                    "导出Prometheus",
+                    data=tracer.to_prometheus(),
+                    file_name="stage_latency.prom",
+                    mime="text/plain"
+                )
+            with col3:
+                if st.button("重置统计"):
+                    tracer.reset()
+                    st.experimental_rerun()
+        else:
+            st.info("暂无耗时统计数据")
         
         # 系统日志
         st.subheader("系统日志")
-        log_date = st.date_input("选择日期")
-        st.text_area("系统日志", value="这里显示系统日志...", height=200)
+        log_reader = LogReader()
+        col1, col2 = st.columns(2)
+        with col1:
+            log_date = st.date_input("选择日期")
+        with col2:
+            follow_log = st.checkbox("跟踪最新日志", help="勾选后每次刷新页面只追加新产生的日志")
+        
+        if follow_log:
+            # 跟踪模式：从上次读取的位置继续读取
+            if 'log_follow_position' not in st.session_state:
+                st.session_state.log_follow_position = None
+                st.session_state.log_follow_lines = log_reader.read_date(datetime.now().strftime("%Y-%m-%d"))[-200:]
+            new_lines, st.session_state.log_follow_position = log_reader.follow(st.session_state.log_follow_position)
+            st.session_state.log_follow_lines = (st.session_state.log_follow_lines + new_lines)[-1000:]
+            log_lines = st.session_state.log_follow_lines
+            st.button("刷新日志")
+        else:
+            st.session_state.pop('log_follow_position', None)
+            st.session_state.pop('log_follow_lines', None)
+            log_lines = log_reader.read_date(log_date.strftime("%Y-%m-%d"))
+        
+        log_text = "\n".join(format_log_line(line) for line in log_lines)
+        st.text_area("系统日志", value=log_text or "该日期暂无日志", height=300)
 
 def main():
     # 初始化session state
     if 'authenticated' not in st.session_state:
         st.session_state.authenticated = False
     
+    # 校验会话是否过期或账号是否已被禁用
+    if st.session_state.authenticated:
+        if user_mgmt.validate_session(st.session_state.user.get('session_token')) is None:
+            st.session_state.clear()
+            st.session_state.authenticated = False
+            st.warning("登录已过期，请重新登录")
+    
     # 根据认证状态显示不同页面
     if not st.session_state.authenticated:
         login_page()
@@ -0,0 +1,170 @@
+import time
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+
+class TTLCache:
+    """带过期时间的内存缓存（LRU 淘汰，线程安全）"""
+
+    def __init__(self, ttl, max_size=100000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if item[0] < now:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def touch(self, key):
+        """刷新过期时间（滑动过期）"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                self._data[key] = (time.monotonic() + self.ttl, item[1])
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[1] if item else default
+
+    def remove_where(self, predicate):
+        """删除满足条件的缓存项"""
+        with self._lock:
+            for key in [k for k, (_, v) in self._data.items() if predicate(k, v)]:
+                del self._data[key]
+
+class RateLimiter:
+    """令牌桶限流（内存实现）
+
+    每个 key 一个桶，容量为 capacity，每 period 秒补满。
+    长时间不活跃的桶按 LRU 淘汰，内存占用有上限。
+    """
+
+    def __init__(self, capacity, period, max_keys=100000):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, updated_at]
+        self._lock = threading.Lock()
+
+    def allow(self, key, cost=1):
+        """尝试消耗令牌，返回是否允许"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.capacity, now]
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+                self._buckets.move_to_end(key)
+
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return True
+            return False
+
+    def retry_after(self, key, cost=1):
+        """距离下次允许还需等待的秒数"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                return 0
+            tokens = min(self.capacity, bucket[0] + (time.monotonic() - bucket[1]) * self.rate)
+        return max(0.0, (cost - tokens) / self.rate)
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+def new_session_token():
+    """生成会话令牌"""
+    return secrets.token_urlsafe(32)
+
+def normalize_identifier(identifier):
+    """登录标识（用户名、邮箱或手机号）的规范形式：去掉首尾空白、转为小写"""
+    return (identifier or '').strip().lower()
+
+def identifier_digest(identifier):
+    """登录标识的摘要，写入日志时代替明文邮箱或手机号"""
+    return hashlib.sha256(normalize_identifier(identifier).encode('utf-8')).hexdigest()[:16]
+
+if __name__ == '__main__':
+    # 登录性能测试：100万用户，对比 OR 查询与 UNION 索引查询
+    import os
+    import random
+    import sqlite3
+    import tempfile
+    from user_management import UserManagement
+
+    user_count = 1000000
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench_users.db')
+    user_mgmt = UserManagement(db_path=db_path)
+    password = user_mgmt.hash_password("bench123")
+
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        'INSERT INTO users (username, password, email, phone, role, status) VALUES (?, ?, ?, ?, ?, ?)',
+        ((f"user{i}", password, f"user{i}@example.com", f"13{i:09d}", "user", "active") for i in range(user_count))
+    )
+    conn.commit()
+    conn.close()
+
+    identifiers = [random.choice([f"user{i}", f"user{i}@example.com", f"13{i:09d}"])
+                   for i in random.sample(range(user_count), 2000)]
+
+    conn = sqlite3.connect(db_path)
+    start = time.perf_counter()
+    for identifier in identifiers[:200]:
+        conn.execute('''
+        SELECT id, username, role, password, status FROM users
+        WHERE username = ? OR email = ? OR phone = ?
+        ''', (identifier, identifier, identifier)).fetchone()
+    or_rate = 200 / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for identifier in identifiers:
+        conn.execute('''
+        SELECT id, username, role, password, status FROM users WHERE username = ?
+        UNION ALL
+        SELECT id, username, role, password, status FROM users WHERE email = ?
+        UNION ALL
+        SELECT id, username, role, password, status FROM users WHERE phone = ?
+        LIMIT 1
+        ''', (identifier, identifier, identifier)).fetchone()
+    union_rate = len(identifiers) / (time.perf_counter() - start)
+    conn.close()
+
+    # 关闭限流，只测查询与校验开销
+    user_mgmt.identifier_limiter = None
+    user_mgmt.ip_limiter = None
+    start = time.perf_counter()
+    for identifier in identifiers[:200]:
+        success, _ = user_mgmt.login(identifier, "bench123")
+        assert success
+    login_rate = 200 / (time.perf_counter() - start)
+
+    print(f"用户数：{user_count}")
+    print(f"OR 查询：{or_rate:.0f} 次/秒")
+    print(f"UNION 索引查询：{union_rate:.0f} 次/秒")
+    print(f"login()（UNION 索引查询 + 密码校验 + 更新登录时间）：{login_rate:.0f} 次/秒")
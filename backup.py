@@ -0,0 +1,262 @@
+import os
+import sys
+import gzip
+import time
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime
+from config_loader import get_config
+from system_log import get_logger
+
+# 备份目录
+BACKUP_DIR = 'backups'
+
+# 在线备份每步复制的页数；每步之间让出数据库锁，保证业务查询不被长时间阻塞
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.005
+
+logger = get_logger('backup')
+
+class BackupManager:
+    """数据备份
+
+    SQLite 数据库（用户、案例、分析历史）使用在线备份 API 分步复制，
+    复制期间应用可以继续读写。备份经完整性校验后 gzip 压缩保存，
+    每个数据源只保留最近 retention 份。
+    """
+
+    def __init__(self, backup_dir=BACKUP_DIR, retention=None):
+        self.backup_dir = backup_dir
+        self.retention = retention or get_config('database', 'backup_retention', 7)
+        self._lock = threading.Lock()
+        os.makedirs(self.backup_dir, exist_ok=True)
+
+    def sources(self):
+        """需要备份的数据：(名称, 路径, 类型)"""
+        database_config = get_config('database', default={})
+        return [
+            ("users", database_config.get('users_db', 'users.db'), "sqlite"),
+            ("cases", database_config.get('cases_db', 'cases.db'), "sqlite"),
+            ("analysis", database_config.get('analysis_db', 'analysis.db'), "sqlite")
+        ]
+
+    def _compress(self, src_path, dst_path):
+        tmp_path = f"{dst_path}.tmp"
+        with open(src_path, 'rb') as src, gzip.open(tmp_path, 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(tmp_path, dst_path)
+
+    def backup_sqlite(self, name, db_path, timestamp):
+        """在线备份一个 SQLite 数据库"""
+        fd, tmp_path = tempfile.mkstemp(suffix='.db', dir=self.backup_dir)
+        os.close(fd)
+        try:
+            src = sqlite3.connect(db_path)
+            dst = sqlite3.connect(tmp_path)
+            try:
+                src.backup(dst, pages=BACKUP_PAGES_PER_STEP,
+                           progress=lambda status, remaining, total: time.sleep(BACKUP_STEP_SLEEP))
+            finally:
+                src.close()
+            try:
+                result = dst.execute('PRAGMA integrity_check').fetchone()[0]
+            finally:
+                dst.close()
+            if result != 'ok':
+                raise RuntimeError(f"备份完整性校验失败：{result}")
+
+            backup_path = os.path.join(self.backup_dir, f"{name}_{timestamp}.db.gz")
+            self._compress(tmp_path, backup_path)
+            return backup_path
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def backup_file(self, name, path, timestamp):
+        """备份普通文件"""
+        ext = os.path.splitext(path)[1]
+        backup_path = os.path.join(self.backup_dir, f"{name}_{timestamp}{ext}.gz")
+        self._compress(path, backup_path)
+        return backup_path
+
+    def run_backup(self):
+        """备份全部数据，返回每个数据源的结果"""
+        with self._lock:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            report = []
+            for name, path, kind in self.sources():
+                if not os.path.exists(path):
+                    continue
+                start = time.perf_counter()
+                try:
+                    if kind == "sqlite":
+                        backup_path = self.backup_sqlite(name, path, timestamp)
+                    else:
+                        backup_path = self.backup_file(name, path, timestamp)
+                    report.append({
+                        "name": name,
+                        "backup": backup_path,
+                        "source_bytes": os.path.getsize(path),
+                        "backup_bytes": os.path.getsize(backup_path),
+                        "seconds": time.perf_counter() - start,
+                        "success": True
+                    })
+                except Exception as e:
+                    logger.exception(f"备份 {path} 失败")
+                    report.append({"name": name, "backup": None, "seconds": time.perf_counter() - start,
+                                   "success": False, "error": str(e)})
+            self.prune()
+            logger.info("数据备份完成", extra={"fields": {"report": report}})
+            return report
+
+    def list_backups(self, name=None):
+        """列出备份文件（新的在前）"""
+        files = [f for f in os.listdir(self.backup_dir) if f.endswith('.gz')]
+        if name:
+            files = [f for f in files if f.startswith(f"{name}_")]
+        return sorted(files, key=lambda f: os.path.getmtime(os.path.join(self.backup_dir, f)), reverse=True)
+
+    def prune(self):
+        """每个数据源只保留最近 retention 份备份"""
+        for name, _, _ in self.sources():
+            for filename in self.list_backups(name)[self.retention:]:
+                os.remove(os.path.join(self.backup_dir, filename))
+
+    def restore(self, backup_file, target_path):
+        """从备份恢复，恢复前先解压并校验
+
+        SQLite 数据库通过在线备份 API 写回目标库（目标库可以正在使用），
+        其他文件解压后原子替换。
+        """
+        if not os.path.exists(backup_file):
+            backup_file = os.path.join(self.backup_dir, backup_file)
+        fd, tmp_path = tempfile.mkstemp(dir=self.backup_dir)
+        os.close(fd)
+        try:
+            with gzip.open(backup_file, 'rb') as src, open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+
+            if backup_file.endswith('.db.gz'):
+                src = sqlite3.connect(tmp_path)
+                try:
+                    result = src.execute('PRAGMA integrity_check').fetchone()[0]
+                    if result != 'ok':
+                        raise RuntimeError(f"备份文件已损坏：{result}")
+                    dst = sqlite3.connect(target_path)
+                    try:
+                        src.backup(dst, pages=BACKUP_PAGES_PER_STEP)
+                        tables = dst.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]
+                    finally:
+                        dst.close()
+                finally:
+                    src.close()
+                logger.info("数据库已恢复", extra={"fields": {"backup": backup_file, "target": target_path, "tables": tables}})
+            else:
+                os.replace(tmp_path, target_path)
+                logger.info("文件已恢复", extra={"fields": {"backup": backup_file, "target": target_path}})
+            return True
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+class BackupScheduler:
+    """后台定时备份（按 database.backup_interval 间隔执行）"""
+
+    def __init__(self, manager=None, interval=None):
+        self.manager = manager or BackupManager()
+        self.interval = interval or get_config('database', 'backup_interval', 86400)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _last_backup_time(self):
+        backups = self.manager.list_backups()
+        if not backups:
+            return 0
+        return os.path.getmtime(os.path.join(self.manager.backup_dir, backups[0]))
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = self._last_backup_time() + self.interval - time.time()
+            if wait <= 0:
+                try:
+                    self.manager.run_backup()
+                except Exception:
+                    logger.exception("定时备份失败")
+                wait = self.interval
+            self._stop.wait(min(wait, 3600))
+
+    def start(self):
+        if not get_config('database', 'backup_enabled', True) or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="backup-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+def benchmark_live_queries(db_path, manager, queries=2000):
+    """测量备份期间对业务查询延迟的影响"""
+    conn = sqlite3.connect(db_path)
+    max_id = conn.execute('SELECT MAX(id) FROM users').fetchone()[0] or 1
+    conn.close()
+
+    def query_latencies(stop_event=None):
+        conn = sqlite3.connect(db_path)
+        latencies = []
+        for _ in range(queries):
+            if stop_event is not None and stop_event.is_set() and len(latencies) > 100:
+                break
+            start = time.perf_counter()
+            conn.execute('SELECT * FROM users WHERE id = ?', (random.randint(1, max_id),)).fetchone()
+            latencies.append(time.perf_counter() - start)
+        conn.close()
+        return sorted(latencies)
+
+    baseline = query_latencies()
+
+    done = threading.Event()
+    during = []
+    worker = threading.Thread(target=lambda: during.extend(query_latencies(done)))
+    worker.start()
+    start = time.perf_counter()
+    manager.backup_sqlite("bench", db_path, datetime.now().strftime("%Y%m%d_%H%M%S"))
+    backup_seconds = time.perf_counter() - start
+    done.set()
+    worker.join()
+
+    p50 = lambda values: values[len(values) // 2] * 1000
+    p95 = lambda values: values[int(len(values) * 0.95)] * 1000
+    return {
+        "backup_seconds": backup_seconds,
+        "baseline_p50_ms": p50(baseline), "baseline_p95_ms": p95(baseline),
+        "during_p50_ms": p50(sorted(during)), "during_p95_ms": p95(sorted(during))
+    }
+
+if __name__ == '__main__':
+    manager = BackupManager()
+    command = sys.argv[1] if len(sys.argv) > 1 else "backup"
+
+    if command == "backup":
+        for item in manager.run_backup():
+            status = f"{item['backup_bytes']} 字节" if item["success"] else f"失败：{item['error']}"
+            print(f"{item['name']}: {item['seconds']:.2f} 秒，{status}")
+    elif command == "list":
+        for filename in manager.list_backups():
+            print(filename)
+    elif command == "restore":
+        # python backup.py restore backups/users_20250101_000000.db.gz users.db
+        manager.restore(sys.argv[2], sys.argv[3])
+        print(f"已从 {sys.argv[2]} 恢复到 {sys.argv[3]}")
+    elif command == "bench":
+        # python backup.py bench users.db
+        result = benchmark_live_queries(sys.argv[2] if len(sys.argv) > 2 else 'users.db', manager)
+        print(f"备份耗时：{result['backup_seconds']:.2f} 秒")
+        print(f"查询延迟 p50：{result['baseline_p50_ms']:.3f} ms -> {result['during_p50_ms']:.3f} ms（备份期间）")
+        print(f"查询延迟 p95：{result['baseline_p95_ms']:.3f} ms -> {result['during_p95_ms']:.3f} ms（备份期间）")
+        for filename in manager.list_backups("bench"):
+            os.remove(os.path.join(manager.backup_dir, filename))
+    else:
+        print("用法：python backup.py [backup|list|restore <备份文件> <目标>|bench <数据库>]")
@@ -0,0 +1,308 @@
+import os
+import io
+import sys
+import json
+import glob
+import time
+import shutil
+import sqlite3
+import argparse
+import platform
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import cv2
+import numpy as np
+import yaml
+
+# 仓库根目录（基准测试在临时目录中运行，数据集和配置从这里读取）
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 基准结果目录与默认基线文件
+BENCHMARK_DIR = os.path.join(REPO_DIR, 'benchmarks')
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, 'baseline.json')
+
+# 中位数比基线慢超过该比例视为性能回退
+REGRESSION_THRESHOLD = 0.15
+
+DATASET_GLOB = os.path.join(REPO_DIR, 'datasets', 'flower', 'images', '*', '*.jpg')
+
+class MockBoxes:
+    """与 ultralytics Boxes 接口一致的检测框（xyxy、conf、cls）"""
+
+    def __init__(self, detections):
+        detections = np.asarray(detections, dtype=np.float32).reshape(-1, 6)
+        self.xyxy = detections[:, :4]
+        self.conf = detections[:, 4]
+        self.cls = detections[:, 5]
+        self.data = detections
+
+    def __len__(self):
+        return len(self.data)
+
+class MockResults:
+    def __init__(self, detections, shape):
+        self.boxes = MockBoxes(detections)
+        self.orig_shape = shape[:2]
+        self.speed = {"preprocess": 0.0, "inference": 0.0, "postprocess": 0.0}
+
+class MockModel:
+    """固定输出的模型：后处理、绘制等环节的耗时不受推理波动影响"""
+
+    def __init__(self, detections):
+        self.detections = detections
+
+    def __call__(self, image):
+        # 与 ultralytics 一致：传入图片列表时按批次返回
+        if isinstance(image, list):
+            return [MockResults(self.detections, item.shape) for item in image]
+        return [MockResults(self.detections, image.shape)]
+
+def grid_detections(shape, count, seed=0):
+    """在图像上按网格生成 count 个检测框（类别、置信度固定随机种子）"""
+    height, width = shape[:2]
+    rng = np.random.default_rng(seed)
+    cols = int(np.ceil(np.sqrt(count * width / height)))
+    rows = int(np.ceil(count / cols))
+    cell_w, cell_h = width / cols, height / rows
+    size = 0.8 * min(cell_w, cell_h)
+    detections = []
+    for i in range(count):
+        cx, cy = (i % cols + 0.5) * cell_w, (i // cols + 0.5) * cell_h
+        detections.append((cx - size / 2, cy - size / 2, cx + size / 2, cy + size / 2,
+                           rng.uniform(0.3, 1.0), rng.integers(0, 3)))
+    return np.array(detections, dtype=np.float32)
+
+def synthetic_slide(width, height, grains, seed=0):
+    """合成的高密度花粉玻片：背景噪声上随机分布深浅不一的圆形花粉粒，返回 (图像, 检测框)"""
+    rng = np.random.default_rng(seed)
+    image = rng.normal(200, 8, (height, width, 3)).clip(0, 255).astype(np.uint8)
+    detections = grid_detections((height, width), grains, seed)
+    for x1, y1, x2, y2, _, _ in detections:
+        center = (int((x1 + x2) / 2), int((y1 + y2) / 2))
+        radius = int((x2 - x1) / 2 * rng.uniform(0.7, 1.0))
+        color = tuple(int(c) for c in rng.integers(40, 220, 3))
+        cv2.circle(image, center, radius, color, -1)
+        cv2.circle(image, center, max(1, radius // 3), tuple(int(c * 0.6) for c in color), -1)
+    return image, detections
+
+def encode_jpeg(image, quality=90):
+    return cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+def measure(func, repeat=20, warmup=2, min_seconds=0.0):
+    """多次运行 func，返回耗时统计（毫秒）"""
+    for _ in range(warmup):
+        func()
+    times = []
+    start = time.perf_counter()
+    while len(times) < repeat or time.perf_counter() - start < min_seconds:
+        t0 = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - t0) * 1000)
+    times = np.sort(np.array(times))
+    return {
+        "runs": int(len(times)),
+        "min_ms": float(times[0]),
+        "median_ms": float(np.median(times)),
+        "p95_ms": float(times[min(len(times) - 1, int(len(times) * 0.95))]),
+        "mean_ms": float(times.mean())
+    }
+
+def machine_info():
+    """运行环境信息，写入结果文件便于比较不同机器上的数据"""
+    info = {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__
+    }
+    for module_name in ("torch", "streamlit", "scipy", "plotly"):
+        module = sys.modules.get(module_name)
+        if module is not None:
+            info[module_name] = getattr(module, '__version__', None)
+    try:
+        info["git_commit"] = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        info["git_commit"] = None
+    return info
+
+@contextmanager
+def bench_workspace():
+    """在临时目录中运行：数据库、备份等文件不会写入仓库，定时备份关闭"""
+    workspace = tempfile.mkdtemp(prefix='pollen_bench_')
+    with open(os.path.join(REPO_DIR, 'config.yaml'), 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    config.setdefault('database', {})['backup_enabled'] = False
+    with open(os.path.join(workspace, 'config.yaml'), 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+    cwd = os.getcwd()
+    os.chdir(workspace)
+    try:
+        yield workspace
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+def fill_history(history, count, seed=0):
+    """向分析历史中写入 count 条合成记录（每分钟一条）"""
+    from analysis_history import CLASS_NAMES
+    rng = np.random.default_rng(seed)
+    totals = rng.integers(0, 300, size=(count, len(CLASS_NAMES)))
+    viable = rng.binomial(totals, [0.80, 0.72, 0.65])
+    start = datetime.now() - timedelta(minutes=count)
+    rows = []
+    for i in range(count):
+        data = {name: {"total": int(totals[i, j]), "viable": int(viable[i, j]),
+                       "non_viable": int(totals[i, j] - viable[i, j])} for j, name in enumerate(CLASS_NAMES)}
+        rows.append(((start + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"), f"{i}.jpg", json.dumps(data)))
+    conn = history.connect()
+    conn.executemany('INSERT INTO analysis_records (timestamp, filename, data) VALUES (?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+def fill_cases(cases, count, seed=0):
+    """写入 count 个案例，每个案例带图片和评论"""
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(cases.db_path)
+    conn.executemany(
+        'INSERT INTO cases (title, description, methods, results, conclusions, author, tags, likes) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        [(f"案例{i}", "描述" * 50, "方法", "结果", "结论", "bench", "水稻,花粉,活力", int(rng.integers(0, 500)))
+         for i in range(count)])
+    conn.executemany('INSERT INTO case_images (case_id, image_path) VALUES (?, ?)',
+                     [(i % count + 1, f"case_images/{i}.jpg") for i in range(count * 2)])
+    conn.executemany('INSERT INTO comments (case_id, user_id, content) VALUES (?, ?, ?)',
+                     [(i % count + 1, 1, "评论") for i in range(count * 5)])
+    conn.commit()
+    conn.close()
+
+def run_benchmarks(repeat=20, name_filter=None):
+    """运行全部基准，返回 {名称: 耗时统计}"""
+    # 导入应用模块（Streamlit 以无界面方式运行，页面代码不会执行）
+    import app_streamlit as app
+    from image_io import preprocess_image, decode_upload
+    from chart_data import build_trend_figure, detection_figures_json, figure_cache
+    from viability_stats import control_group_analysis, viability_vectors
+    from case_management import CaseManagement
+    from viability import score_grains
+    from morphology import measure_grains
+    from tta import predict_tta
+
+    results = {}
+
+    def bench(name, func, **kwargs):
+        if name_filter and name_filter not in name:
+            return
+        results[name] = measure(func, repeat=kwargs.pop('repeat', repeat), **kwargs)
+        print(f"{name:<45} median {results[name]['median_ms']:9.2f} ms   p95 {results[name]['p95_ms']:9.2f} ms")
+
+    # 输入数据：仓库自带的数据集图片 + 合成高密度玻片
+    dataset_paths = sorted(glob.glob(DATASET_GLOB))
+    dataset_bytes = open(dataset_paths[0], 'rb').read() if dataset_paths else encode_jpeg(synthetic_slide(1600, 1200, 60)[0])
+    dataset_image = cv2.imdecode(np.frombuffer(dataset_bytes, np.uint8), cv2.IMREAD_COLOR)
+    dataset_detections = grid_detections(dataset_image.shape, 60)
+    slide_300, slide_300_detections = synthetic_slide(1024, 768, 300, seed=1)
+    slide_1000, slide_1000_detections = synthetic_slide(2048, 1536, 1000, seed=2)
+    slide_4k_bytes = encode_jpeg(synthetic_slide(4000, 3000, 1000, seed=3)[0])
+
+    # 图像读取与预处理
+    bench("image.preprocess_image[dataset]", lambda: preprocess_image(dataset_image, 1024))
+    bench("image.decode_upload[dataset]", lambda: decode_upload(io.BytesIO(dataset_bytes)))
+    bench("image.decode_upload[slide_4000x3000]", lambda: decode_upload(io.BytesIO(slide_4k_bytes)))
+
+    # 模型调用包装与后处理（模拟模型）
+    mock_model = MockModel(slide_300_detections)
+    bench("model.run_model[mock_300]", lambda: app.run_model(mock_model, slide_300))
+    bench("model.predict_tta[mock_300]", lambda: predict_tta(mock_model, slide_300, fast_path=False))
+    crops = [slide_300[int(y1):int(y2), int(x1):int(x2)] for x1, y1, x2, y2, _, _ in slide_300_detections]
+    bench("viability.judge_pollen_viability[300]", lambda: [app.judge_pollen_viability(crop) for crop in crops])
+    bench("viability.score_grains[300]", lambda: score_grains(slide_300, slide_300_detections[:, :4]))
+    bench("morphology.measure_grains[300]", lambda: measure_grains(slide_300, slide_300_detections[:, :4]))
+    for name, image, detections in (("dataset_60", dataset_image, dataset_detections),
+                                    ("slide_300", slide_300, slide_300_detections),
+                                    ("slide_1000", slide_1000, slide_1000_detections)):
+        mock_results = MockResults(detections, image.shape)
+        bench(f"visualize_results[{name}]", lambda: app.visualize_results(image, mock_results))
+
+    # 分析历史
+    history = app.analysis_history
+    record = {"timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "filename": "bench.jpg",
+              "data": app.visualize_results(slide_300, MockResults(slide_300_detections, slide_300.shape))[1]}
+    bench("history.save_analysis_data", lambda: app.save_analysis_data(record))
+    fill_history(history, 10000)
+    bench("history.load_records[10k]", lambda: history.load_records(), repeat=max(3, repeat // 4))
+    bench("history.class_count_rows[10k]", lambda: history.class_count_rows(), repeat=max(3, repeat // 4))
+
+    # 图表与统计
+    class_counts = record["data"]
+    bench("charts.detection_figures[cold]",
+          lambda: (figure_cache.clear(), detection_figures_json(history, class_counts)))
+    bench("charts.detection_figures[cached]", lambda: detection_figures_json(history, class_counts))
+    records = history.load_records()
+    bench("charts.build_trend_figure[10k]", lambda: build_trend_figure(records, "bench"), repeat=max(3, repeat // 4))
+    vectors = viability_vectors(history.class_count_rows(include_aggregated=False))
+    bench("stats.control_group_analysis[10k]", lambda: control_group_analysis(vectors, "WT"),
+          repeat=max(3, repeat // 4))
+
+    # 案例列表
+    cases = CaseManagement()
+    fill_cases(cases, 1000)
+    bench("cases.get_cases[limit=10]", lambda: cases.get_cases(sort_by="最新发布", limit=10))
+    bench("cases.get_cases[limit=50,tags]", lambda: cases.get_cases(sort_by="最多点赞", tags=["花粉"], limit=50))
+    return results
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """与基线比较中位数，返回回退项列表 [(名称, 基线 ms, 当前 ms, 变化比例)]"""
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get("results", {}).get(name)
+        if reference is None:
+            print(f"{name:<45} 基线中无此项")
+            continue
+        change = current["median_ms"] / reference["median_ms"] - 1 if reference["median_ms"] > 0 else 0.0
+        status = "回退" if change > threshold else ("提升" if change < -threshold else "持平")
+        print(f"{name:<45} {reference['median_ms']:9.2f} -> {current['median_ms']:9.2f} ms  {change:+7.1%}  {status}")
+        if change > threshold:
+            regressions.append((name, reference["median_ms"], current["median_ms"], change))
+    return regressions
+
+if __name__ == '__main__':
+    # python benchmark.py [--repeat N] [--filter 名称] [--baseline 文件] [--save-baseline] [--threshold 0.15]
+    parser = argparse.ArgumentParser(description="花粉检测系统性能基准测试")
+    parser.add_argument('--repeat', type=int, default=20, help="每项的运行次数")
+    parser.add_argument('--filter', default=None, help="只运行名称包含该字符串的项")
+    parser.add_argument('--output', default=None, help="结果文件（默认 benchmarks/results/bench_<时间>.json）")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="用于比较的基线文件")
+    parser.add_argument('--save-baseline', action='store_true', help="把本次结果保存为基线")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help="判定回退的变慢比例")
+    args = parser.parse_args()
+
+    os.environ.setdefault('YOLO_SKIP_FONT_CHECK', 'TRUE')
+    sys.path.insert(0, REPO_DIR)
+    with bench_workspace():
+        results = run_benchmarks(repeat=args.repeat, name_filter=args.filter)
+
+    report = {"timestamp": datetime.now().isoformat(timespec='seconds'), "machine": machine_info(), "results": results}
+    output = args.output or os.path.join(BENCHMARK_DIR, 'results', f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存：{output}")
+
+    if args.save_baseline:
+        shutil.copyfile(output, args.baseline)
+        print(f"已保存为基线：{args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("machine", {}).get("processor") != report["machine"]["processor"]:
+            print("注意：基线来自不同的机器，比较结果仅供参考")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} 项性能回退（阈值 {args.threshold:.0%}）")
+            sys.exit(1)
+        print("未发现性能回退")
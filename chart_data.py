@@ -0,0 +1,239 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+from config_loader import get_config
+from analysis_history import CLASS_NAMES
+
+# 趋势图缓存的图表数量上限
+FIGURE_CACHE_SIZE = 32
+
+def lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets 降采样，返回保留点的下标
+
+    在保留曲线形状（峰值、谷值）的前提下把 n 个点降到 threshold 个。
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+def minmax_decimate(y, buckets):
+    """每个桶保留最小值和最大值的下标（适合噪声大的长序列）"""
+    n = len(y)
+    if buckets * 2 >= n:
+        return np.arange(n)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    indices = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        segment = y[start:end]
+        indices.extend(sorted((start + int(np.argmin(segment)), start + int(np.argmax(segment)))))
+    return np.unique(np.array(indices, dtype=np.int64))
+
+def target_points_for_width(width_px=None):
+    """按图表宽度确定目标点数：每个像素列约 2 个点，再多浏览器也画不出来"""
+    width_px = width_px or get_config('analysis', 'visualization', {}).get('chart_width_px', 1200)
+    return max(100, int(width_px) * 2)
+
+def viability_series(records):
+    """把分析记录转换为时间轴和各类别活力率数组（%）"""
+    timestamps = np.array([r["timestamp"].replace(' ', 'T') for r in records], dtype='datetime64[s]')
+    series = {}
+    for name in CLASS_NAMES:
+        totals = np.fromiter((r["data"][name]["total"] for r in records), dtype=np.float64, count=len(records))
+        viable = np.fromiter((r["data"][name]["viable"] for r in records), dtype=np.float64, count=len(records))
+        series[name] = np.divide(viable * 100, totals, out=np.zeros_like(totals), where=totals > 0)
+    return timestamps, series
+
+def build_trend_figure(records, title, target_points=None, webgl_threshold=None, method="lttb"):
+    """构建活力率趋势图：各类别序列分别降采样，点数多时使用 WebGL 渲染"""
+    visualization_config = get_config('analysis', 'visualization', {}) or {}
+    target_points = target_points or target_points_for_width()
+    webgl_threshold = webgl_threshold or visualization_config.get('webgl_threshold', 1000)
+
+    timestamps, series = viability_series(records)
+    x_numeric = timestamps.astype(np.int64).astype(np.float64)
+
+    fig = go.Figure()
+    for name, y in series.items():
+        if method == "minmax":
+            indices = minmax_decimate(y, target_points // 2)
+        else:
+            indices = lttb(x_numeric, y, target_points)
+        trace_type = go.Scattergl if len(indices) > webgl_threshold else go.Scatter
+        fig.add_trace(trace_type(
+            x=timestamps[indices].astype(datetime),
+            y=y[indices],
+            name=name,
+            mode="lines+markers" if len(indices) <= webgl_threshold else "lines"
+        ))
+
+    subtitle = f"（{len(records)} 条记录，已降采样）" if len(records) > target_points else ""
+    fig.update_layout(
+        title=f"{title}{subtitle}",
+        xaxis_title="时间",
+        yaxis_title="活力率(%)",
+        hovermode="x unified"
+    )
+    return fig
+
+def build_detection_figures(class_counts, recent_records):
+    """检测页图表：当前样本品种分布饼图、活力状态柱状图和最近记录趋势图"""
+    # 1. 当前样本品种分布饼图
+    fig_pie = px.pie(
+        values=[class_counts[name]["total"] for name in CLASS_NAMES],
+        names=CLASS_NAMES,
+        title="花粉品种分布",
+        hole=0.3
+    )
+
+    # 2. 当前样本活力状态堆叠柱状图
+    categories = [name for name in CLASS_NAMES if class_counts[name]["total"] > 0]
+    fig_bar = go.Figure(data=[
+        go.Bar(name="可育", x=categories, y=[class_counts[name]["viable"] for name in categories]),
+        go.Bar(name="不育", x=categories, y=[class_counts[name]["non_viable"] for name in categories])
+    ])
+    fig_bar.update_layout(
+        barmode='stack',
+        title="各品种活力状态分布",
+        xaxis_title="花粉品种",
+        yaxis_title="数量"
+    )
+
+    # 3. 历史趋势分析
+    fig_line = None
+    if recent_records:
+        timestamps, series = viability_series(recent_records)
+        fig_line = go.Figure()
+        for name, y in series.items():
+            fig_line.add_trace(go.Scatter(x=timestamps.astype(datetime), y=y, name=name))
+        fig_line.update_layout(
+            title="花粉活力率历史趋势",
+            xaxis_title="时间",
+            yaxis_title="活力率(%)"
+        )
+    return fig_pie, fig_bar, fig_line
+
+class FigureCache:
+    """图表 JSON 缓存（LRU）
+
+    键中包含 AnalysisHistory.data_version()，有新数据或执行汇总后自动失效；
+    命中时不读取数据库、不重新构建图表。
+    """
+
+    def __init__(self, max_size=FIGURE_CACHE_SIZE):
+        self.max_size = max_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        value = build()
+
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+# 全局图表缓存
+figure_cache = FigureCache()
+
+def trend_figure_json(history, days, title, target_points=None):
+    """数据趋势分析图（JSON），days 为 None 时为全部数据"""
+    target_points = target_points or target_points_for_width()
+
+    def build():
+        since = datetime.now() - timedelta(days=days) if days else None
+        records = history.load_records(since=since)
+        return build_trend_figure(records, title, target_points).to_json() if records else None
+
+    # 按天数截取的窗口随日期移动：没有新数据时也要在第二天重新生成
+    window_day = date.today() if days else None
+    return figure_cache.get_or_build(("trend", days, window_day, title, target_points, history.data_version()), build)
+
+def detection_figures_json(history, class_counts, recent=10):
+    """检测页图表和历史摘要，按 (当前计数, 数据版本) 缓存
+
+    返回 (饼图, 柱状图, 趋势图或 None, 历史摘要)，图表为 JSON 字符串。
+    """
+    counts_key = tuple((name, class_counts[name]["total"], class_counts[name]["viable"],
+                        class_counts[name]["non_viable"]) for name in CLASS_NAMES)
+
+    def build():
+        fig_pie, fig_bar, fig_line = build_detection_figures(class_counts, history.recent_records(recent))
+        return fig_pie.to_json(), fig_bar.to_json(), fig_line.to_json() if fig_line else None, history.summary()
+
+    return figure_cache.get_or_build(("detection", counts_key, recent, history.data_version()), build)
+
+if __name__ == '__main__':
+    # 检测页重绘耗时测试：100k 条历史记录下，旧流程（读取全部历史 + 重建图表）与缓存流程对比
+    import json
+    import random
+    import tempfile
+    import time
+    import plotly.io as pio
+    from analysis_history import AnalysisHistory
+
+    history = AnalysisHistory(db_path=tempfile.mktemp(suffix='.db'))
+    conn = history.connect()
+    rows = []
+    for i in range(100000):
+        data = {}
+        for name in CLASS_NAMES:
+            total = random.randint(0, 300)
+            viable = random.randint(0, total)
+            data[name] = {"total": total, "viable": viable, "non_viable": total - viable}
+        timestamp = datetime(2026, 1, 1) + timedelta(minutes=i)
+        rows.append((timestamp.strftime("%Y-%m-%d %H:%M:%S"), f"{i}.jpg", json.dumps(data)))
+    conn.executemany('INSERT INTO analysis_records (timestamp, filename, data) VALUES (?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+    class_counts = json.loads(rows[-1][2])
+
+    def legacy_rerun():
+        records = history.load_records()
+        build_detection_figures(class_counts, records[-10:])
+        return len(records), records[0]["timestamp"], records[-1]["timestamp"]
+
+    def cached_rerun():
+        pie, bar, line, _ = detection_figures_json(history, class_counts)
+        for figure_json in (pie, bar, line):
+            pio.from_json(figure_json)
+
+    for name, rerun in (("旧流程", legacy_rerun), ("缓存未命中", lambda: (figure_cache.clear(), cached_rerun())),
+                        ("缓存命中", cached_rerun)):
+        rerun()
+        latencies = []
+        for _ in range(10):
+            start = time.perf_counter()
+            rerun()
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        print(f"{name:<8} p50 {latencies[5] * 1000:8.1f} ms  max {latencies[-1] * 1000:8.1f} ms")
+    os.remove(history.db_path)
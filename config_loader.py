@@ -0,0 +1,34 @@
+import os
+import threading
+import yaml
+
+# 配置文件路径
+CONFIG_PATH = 'config.yaml'
+
+_config_cache = {"mtime": None, "config": {}}
+_config_lock = threading.Lock()
+
+def load_config(path=CONFIG_PATH):
+    """加载系统配置（按文件修改时间缓存，修改配置无需重启）"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+
+    with _config_lock:
+        if _config_cache["mtime"] != mtime:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    _config_cache["config"] = yaml.safe_load(f) or {}
+                _config_cache["mtime"] = mtime
+            except Exception as e:
+                print(f"加载配置文件失败：{e}")
+                return _config_cache["config"]
+        return _config_cache["config"]
+
+def get_config(section, key=None, default=None):
+    """读取配置项，例如 get_config('logging', 'level', 'INFO')"""
+    section_config = load_config().get(section) or {}
+    if key is None:
+        return section_config if section_config else default
+    return section_config.get(key, default)
@@ -0,0 +1,163 @@
+import io
+import os
+import csv
+import json
+import time
+import tracemalloc
+from datetime import datetime
+from config_loader import get_config
+from analysis_history import CLASS_NAMES
+
+# 导出文件目录
+EXPORT_DIR = 'exports'
+
+# 每批写出的记录数
+EXPORT_BATCH_SIZE = 5000
+
+# 扁平化后的列
+EXPORT_COLUMNS = ["timestamp", "filename", "aggregated"] + [
+    f"{name}_{field}" for name in CLASS_NAMES for field in ("total", "viable", "non_viable")
+]
+
+# 各导出格式的扩展名和 MIME 类型
+EXPORT_FORMATS = {
+    "csv": (".csv", "text/csv"),
+    "json": (".jsonl", "application/x-ndjson"),
+    "parquet": (".parquet", "application/octet-stream"),
+    "arrow": (".arrow", "application/vnd.apache.arrow.stream")
+}
+
+def flatten_record(record):
+    """把一条分析记录展开为每个类别 total/viable/non_viable 的平铺字段"""
+    row = {
+        "timestamp": record["timestamp"],
+        "filename": record.get("filename"),
+        "aggregated": bool(record.get("aggregated", False))
+    }
+    for name in CLASS_NAMES:
+        counts = record["data"].get(name, {})
+        row[f"{name}_total"] = counts.get("total", 0)
+        row[f"{name}_viable"] = counts.get("viable", 0)
+        row[f"{name}_non_viable"] = counts.get("non_viable", 0)
+    return row
+
+def iter_batches(records, batch_size=EXPORT_BATCH_SIZE):
+    """按批产出扁平化后的记录"""
+    batch = []
+    for record in records:
+        batch.append(flatten_record(record))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def available_formats():
+    """config.yaml 中配置、且当前环境可用的导出格式"""
+    formats = [f for f in get_config('analysis', 'export_formats', ["csv", "json"]) if f in EXPORT_FORMATS]
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        formats = [f for f in formats if f not in ("parquet", "arrow")]
+    return formats
+
+def iter_csv_chunks(records, batch_size=EXPORT_BATCH_SIZE):
+    """流式生成 CSV 文本块"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for batch in iter_batches(records, batch_size):
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _arrow_schema():
+    import pyarrow as pa
+    fields = [pa.field("timestamp", pa.string()), pa.field("filename", pa.string()), pa.field("aggregated", pa.bool_())]
+    fields += [pa.field(column, pa.int64()) for column in EXPORT_COLUMNS[3:]]
+    return pa.schema(fields)
+
+def _arrow_batches(records, schema, batch_size):
+    import pyarrow as pa
+    for batch in iter_batches(records, batch_size):
+        yield pa.RecordBatch.from_pylist(batch, schema=schema)
+
+def export_records(records, export_format, path, batch_size=EXPORT_BATCH_SIZE):
+    """把分析记录逐批写入文件，内存中最多只有一批数据"""
+    if export_format == "csv":
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            for chunk in iter_csv_chunks(records, batch_size):
+                f.write(chunk)
+    elif export_format == "json":
+        with open(path, 'w', encoding='utf-8') as f:
+            for batch in iter_batches(records, batch_size):
+                f.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in batch))
+    elif export_format == "parquet":
+        import pyarrow.parquet as pq
+        schema = _arrow_schema()
+        with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+            for record_batch in _arrow_batches(records, schema, batch_size):
+                writer.write_batch(record_batch)
+    elif export_format == "arrow":
+        import pyarrow as pa
+        schema = _arrow_schema()
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_stream(sink, schema) as writer:
+            for record_batch in _arrow_batches(records, schema, batch_size):
+                writer.write_batch(record_batch)
+    else:
+        raise ValueError(f"不支持的导出格式：{export_format}")
+    return path
+
+def cleanup_exports(export_dir=EXPORT_DIR, max_age_hours=None):
+    """删除超过保留时间的导出文件，返回删除的文件数"""
+    if max_age_hours is None:
+        max_age_hours = get_config('analysis', 'export_retention_hours', 24)
+    if not os.path.isdir(export_dir):
+        return 0
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for name in os.listdir(export_dir):
+        path = os.path.join(export_dir, name)
+        try:
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+def export_history(history, export_format, export_dir=EXPORT_DIR):
+    """导出全部分析历史，返回 (文件路径, MIME 类型)（同时清理过期的导出文件）"""
+    ext, mime = EXPORT_FORMATS[export_format]
+    os.makedirs(export_dir, exist_ok=True)
+    cleanup_exports(export_dir)
+    path = os.path.join(export_dir, f"花粉分析数据_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}")
+    export_records(history.iter_records(), export_format, path)
+    return path, mime
+
+if __name__ == '__main__':
+    # 导出内存峰值测试：历史长度增加时峰值应保持不变
+    import random
+    import tempfile
+
+    def synthetic_records(count):
+        for i in range(count):
+            data = {}
+            for name in CLASS_NAMES:
+                total = random.randint(0, 300)
+                viable = random.randint(0, total)
+                data[name] = {"total": total, "viable": viable, "non_viable": total - viable}
+            yield {"timestamp": f"2025-01-01 00:00:{i % 60:02d}", "filename": f"{i}.jpg", "data": data}
+
+    out_dir = tempfile.mkdtemp()
+    for export_format in available_formats():
+        for count in (10000, 100000):
+            path = os.path.join(out_dir, f"bench_{count}{EXPORT_FORMATS[export_format][0]}")
+            tracemalloc.start()
+            export_records(synthetic_records(count), export_format, path)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{export_format:<8} {count:>7} 条：峰值 {peak / 1e6:.2f} MB，文件 {os.path.getsize(path) / 1e6:.2f} MB")
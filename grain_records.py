@@ -0,0 +1,98 @@
+import hashlib
+import numpy as np
+from analysis_history import CLASS_NAMES
+
+# 单粒花粉记录（每粒 29 字节）：检测框、置信度、类别、可育概率、面积（像素）
+GRAIN_DTYPE = np.dtype([
+    ("x1", "<f4"), ("y1", "<f4"), ("x2", "<f4"), ("y2", "<f4"),
+    ("conf", "<f4"), ("cls", "u1"), ("score", "<f4"), ("area", "<f4")
+])
+
+def content_hash(data):
+    """图片内容哈希（与 image_variants 中原图的命名一致）"""
+    return hashlib.sha256(data).hexdigest()
+
+def make_grains(xyxy, confs, classes, scores):
+    """由检测结果构造花粉记录数组"""
+    xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+    grains = np.zeros(len(xyxy), dtype=GRAIN_DTYPE)
+    grains["x1"], grains["y1"], grains["x2"], grains["y2"] = xyxy.T
+    grains["conf"] = confs
+    grains["cls"] = classes
+    grains["score"] = scores
+    grains["area"] = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    return grains
+
+def pack(grains):
+    return np.ascontiguousarray(grains, dtype=GRAIN_DTYPE).tobytes()
+
+def unpack(blob):
+    return np.frombuffer(blob, dtype=GRAIN_DTYPE)
+
+def select(grains, confidence_threshold=0.5, min_area=0, max_area=None):
+    """按置信度和面积筛选花粉"""
+    mask = (grains["conf"] >= confidence_threshold) & (grains["area"] >= min_area)
+    if max_area:
+        mask &= grains["area"] <= max_area
+    return mask
+
+def aggregate(grains, confidence_threshold=0.5, viability_threshold=0.5, min_area=0, max_area=None):
+    """按规则统计各类别的总数、可育数和不育数（与 visualize_results 返回的 class_counts 格式一致）"""
+    kept = grains[select(grains, confidence_threshold, min_area, max_area)]
+    classes = kept["cls"].astype(np.int64)
+    totals = np.bincount(classes, minlength=len(CLASS_NAMES))
+    viable = np.bincount(classes, weights=kept["score"] >= viability_threshold, minlength=len(CLASS_NAMES))
+    return {
+        name: {"total": int(totals[i]), "viable": int(viable[i]), "non_viable": int(totals[i] - viable[i])}
+        for i, name in enumerate(CLASS_NAMES)
+    }
+
+def aggregate_many(blobs, confidence_threshold=0.5, viability_threshold=0.5, min_area=0, max_area=None):
+    """对多张图片的花粉记录一次性重新统计，返回 (N, 类别数, 2) 的 [总数, 可育数] 数组"""
+    arrays = [unpack(blob) for blob in blobs]
+    counts = np.zeros((len(arrays), len(CLASS_NAMES), 2), dtype=np.int64)
+    if not arrays:
+        return counts
+    grains = np.concatenate(arrays)
+    image_idx = np.repeat(np.arange(len(arrays)), [len(a) for a in arrays])
+    mask = select(grains, confidence_threshold, min_area, max_area)
+    bins = image_idx[mask] * len(CLASS_NAMES) + grains["cls"][mask]
+    size = len(arrays) * len(CLASS_NAMES)
+    counts[:, :, 0] = np.bincount(bins, minlength=size).reshape(len(arrays), -1)
+    counts[:, :, 1] = np.bincount(bins, weights=grains["score"][mask] >= viability_threshold,
+                                  minlength=size).reshape(len(arrays), -1)
+    return counts
+
+def rescore_history(history, confidence_threshold=0.5, viability_threshold=0.5, min_area=0, max_area=None):
+    """用新的规则重新统计全部已保存的检测结果（不重新推理）
+
+    返回与分析记录格式一致的列表：[{"timestamp", "image_hash", "data"}]。
+    逐粒结果以图片内容哈希为主键，同一张图片多次分析只保留最近一次，
+    因此每张图片只计一次，而分析记录中每次分析各占一条。
+    """
+    rows = history.load_grain_rows()
+    counts = aggregate_many([row[2] for row in rows], confidence_threshold, viability_threshold, min_area, max_area)
+    return [
+        {
+            "timestamp": timestamp,
+            "image_hash": image_hash,
+            "data": {name: {"total": int(c[i, 0]), "viable": int(c[i, 1]), "non_viable": int(c[i, 0] - c[i, 1])}
+                     for i, name in enumerate(CLASS_NAMES)}
+        }
+        for (image_hash, timestamp, _), c in zip(rows, counts)
+    ]
+
+if __name__ == '__main__':
+    # 重新统计耗时测试：10000 张图片、每张 300 粒花粉
+    import time
+    rng = np.random.default_rng(0)
+    blobs = []
+    for _ in range(10000):
+        corners = rng.uniform(0, 1000, (300, 2))
+        blobs.append(pack(make_grains(np.hstack([corners, corners + rng.uniform(20, 60, (300, 2))]),
+                                      rng.uniform(0.2, 1.0, 300), rng.integers(0, 3, 300), rng.uniform(0, 1, 300))))
+    print(f"每粒花粉 {GRAIN_DTYPE.itemsize} 字节，共 {sum(len(b) for b in blobs) / 1e6:.1f} MB")
+    for conf in (0.3, 0.5, 0.7):
+        start = time.perf_counter()
+        counts = aggregate_many(blobs, confidence_threshold=conf, viability_threshold=0.6, min_area=500)
+        print(f"置信度阈值 {conf}：{(time.perf_counter() - start) * 1000:.1f} ms，保留 {counts[:, :, 0].sum()} 粒")
@@ -0,0 +1,276 @@
+import os
+import json
+import math
+import time
+import random
+import sqlite3
+import argparse
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import yaml
+from train import current_dir, local_data_yaml, apply_hyperparameters
+
+# 搜索结果（SQLite 研究文件）、试验输出和最终超参数文件
+HYP_DIR = os.path.join(current_dir, "hyps")
+STUDY_PATH = os.path.join(HYP_DIR, "study.db")
+HYP_PATH = os.path.join(HYP_DIR, "hyp.scratch.yaml")
+
+# 搜索空间：名称 -> (分布, 参数)；log 为对数均匀分布，choice 为离散取值
+SEARCH_SPACE = {
+    "lr0": ("log", 1e-4, 1e-2),
+    "lrf": ("uniform", 0.01, 0.3),
+    "momentum": ("uniform", 0.8, 0.98),
+    "weight_decay": ("log", 1e-5, 1e-3),
+    "warmup_epochs": ("uniform", 0.0, 3.0),
+    "hsv_h": ("uniform", 0.0, 0.05),
+    "hsv_s": ("uniform", 0.0, 0.9),
+    "hsv_v": ("uniform", 0.0, 0.9),
+    "degrees": ("uniform", 0.0, 30.0),
+    "scale": ("uniform", 0.0, 0.9),
+    "fliplr": ("uniform", 0.0, 0.5),
+    "flipud": ("uniform", 0.0, 0.5),
+    "mosaic": ("uniform", 0.0, 1.0),
+    "imgsz": ("choice", [320, 480, 640]),
+}
+
+def sample_params(rng):
+    params = {}
+    for name, (kind, *args) in SEARCH_SPACE.items():
+        if kind == "log":
+            params[name] = float(math.exp(rng.uniform(math.log(args[0]), math.log(args[1]))))
+        elif kind == "uniform":
+            params[name] = float(rng.uniform(args[0], args[1]))
+        else:
+            params[name] = rng.choice(args[0])
+    return params
+
+def rung_epochs(min_epochs, max_epochs, eta):
+    """各级的训练轮数：min_epochs × eta^k，不超过 max_epochs"""
+    epochs = [min_epochs]
+    while epochs[-1] * eta <= max_epochs:
+        epochs.append(epochs[-1] * eta)
+    return epochs
+
+class Study:
+    """保存在 SQLite 中的超参数搜索记录（中断后重新运行会继续之前的搜索）
+
+    trials 表保存每组超参数；results 表保存每组超参数在各级（rung）的训练结果。
+    """
+
+    def __init__(self, path=STUDY_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self.connect()
+        try:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS trials (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                params TEXT NOT NULL,
+                created TEXT NOT NULL
+            )
+            ''')
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                trial_id INTEGER NOT NULL,
+                rung INTEGER NOT NULL,
+                epochs INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                fitness REAL,
+                map50 REAL,
+                map50_95 REAL,
+                seconds REAL,
+                PRIMARY KEY (trial_id, rung)
+            )
+            ''')
+            # 上次中断时仍在运行的任务重新排队
+            conn.execute("DELETE FROM results WHERE status = 'running'")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def add_trial(self, params):
+        conn = self.connect()
+        try:
+            cursor = conn.execute('INSERT INTO trials (params, created) VALUES (?, ?)',
+                                  (json.dumps(params), datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+    def params(self, trial_id):
+        conn = self.connect()
+        try:
+            return json.loads(conn.execute('SELECT params FROM trials WHERE id = ?', (trial_id,)).fetchone()[0])
+        finally:
+            conn.close()
+
+    def trial_ids(self):
+        conn = self.connect()
+        try:
+            return [row[0] for row in conn.execute('SELECT id FROM trials ORDER BY id')]
+        finally:
+            conn.close()
+
+    def count_trials(self):
+        conn = self.connect()
+        try:
+            return conn.execute('SELECT COUNT(*) FROM trials').fetchone()[0]
+        finally:
+            conn.close()
+
+    def start(self, trial_id, rung, epochs):
+        conn = self.connect()
+        try:
+            conn.execute("INSERT OR REPLACE INTO results (trial_id, rung, epochs, status) VALUES (?, ?, ?, 'running')",
+                         (trial_id, rung, epochs))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def finish(self, trial_id, rung, result):
+        conn = self.connect()
+        try:
+            if result is None:
+                conn.execute("UPDATE results SET status = 'failed' WHERE trial_id = ? AND rung = ?", (trial_id, rung))
+            else:
+                conn.execute(
+                    "UPDATE results SET status = 'done', fitness = ?, map50 = ?, map50_95 = ?, seconds = ? "
+                    "WHERE trial_id = ? AND rung = ?",
+                    (result["fitness"], result["map50"], result["map50_95"], result["seconds"], trial_id, rung))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def results(self):
+        """[(trial_id, rung, status, fitness)]"""
+        conn = self.connect()
+        try:
+            return conn.execute('SELECT trial_id, rung, status, fitness FROM results').fetchall()
+        finally:
+            conn.close()
+
+    def best(self):
+        """到达最高级的试验中 fitness 最高的一组：(trial_id, rung, fitness, params)，没有结果时返回 None"""
+        conn = self.connect()
+        try:
+            row = conn.execute(
+                "SELECT trial_id, rung, fitness FROM results WHERE status = 'done' "
+                "ORDER BY rung DESC, fitness DESC LIMIT 1").fetchone()
+        finally:
+            conn.close()
+        return (*row, self.params(row[0])) if row else None
+
+def next_job(study, rungs, eta, max_trials, seed=0):
+    """ASHA：先重新运行中断的第 0 级试验，再把某一级中排名前 1/eta、尚未晋级的试验提升到下一级，
+    否则开始新试验
+
+    返回 (trial_id, rung) 或 None（暂时没有可运行的任务）。
+    """
+    results = study.results()
+    started = {(trial_id, rung) for trial_id, rung, _, _ in results}
+    # 已创建但第 0 级没有结果的试验（上次运行中断时其 running 行已被删除）
+    for trial_id in study.trial_ids():
+        if (trial_id, 0) not in started:
+            return trial_id, 0
+    for rung in reversed(range(len(rungs) - 1)):
+        done = sorted(((fitness, trial_id) for trial_id, r, status, fitness in results
+                       if r == rung and status == 'done'), reverse=True)
+        for _, trial_id in done[:len(done) // eta]:
+            if (trial_id, rung + 1) not in started:
+                return trial_id, rung + 1
+    count = study.count_trials()
+    if count < max_trials:
+        return study.add_trial(sample_params(random.Random(seed * 100003 + count))), 0
+    return None
+
+def run_trial(trial_id, rung, epochs, params, weights, data_yaml, threads):
+    """在子进程中训练一次（CPU），返回验证集指标；失败时返回 None"""
+    try:
+        import torch
+        from ultralytics import YOLO
+        torch.set_num_threads(threads)
+        start = time.perf_counter()
+        model = YOLO(weights)
+        train_args = apply_hyperparameters({"data": data_yaml, "epochs": epochs, "imgsz": 640, "batch": 4}, params)
+        train_args.update(device="cpu", workers=0, plots=False, verbose=False,
+                          project=os.path.join(HYP_DIR, "trials"), name=f"trial{trial_id}_rung{rung}", exist_ok=True)
+        model.train(**train_args)
+        metrics = model.trainer.metrics
+        map50, map50_95 = float(metrics["metrics/mAP50(B)"]), float(metrics["metrics/mAP50-95(B)"])
+        # 与 ultralytics 选择 best.pt 的 fitness 一致
+        return {"fitness": 0.1 * map50 + 0.9 * map50_95, "map50": map50, "map50_95": map50_95,
+                "seconds": time.perf_counter() - start}
+    except Exception as e:
+        print(f"试验 {trial_id}（第 {rung} 级）失败：{e}")
+        return None
+
+def write_hyp(study, path=HYP_PATH):
+    """把最好的一组超参数写入 train.py 读取的超参数文件"""
+    best = study.best()
+    if best is None:
+        return None
+    trial_id, rung, fitness, params = best
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"# 由 hyp_search.py 生成：试验 {trial_id}，第 {rung} 级，fitness {fitness:.4f}\n")
+        yaml.safe_dump(params, f, allow_unicode=True, sort_keys=False)
+    return best
+
+def search(trials=16, workers=2, min_epochs=1, max_epochs=9, eta=3, weights="yolov8n.pt", study_path=STUDY_PATH,
+           seed=0):
+    """用 ASHA 调度并行运行短训练试验，结束后写出最好的超参数"""
+    study = Study(study_path)
+    rungs = rung_epochs(min_epochs, max_epochs, eta)
+    data_yaml = local_data_yaml(os.path.join(HYP_DIR, "flower_search.yaml"))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"各级训练轮数：{rungs}，最多 {trials} 组超参数，{workers} 个并行进程")
+
+    # spawn：子进程不继承父进程的 torch 线程池状态
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        running = {}
+        while True:
+            while len(running) < workers:
+                job = next_job(study, rungs, eta, trials, seed)
+                if job is None:
+                    break
+                trial_id, rung = job
+                study.start(trial_id, rung, rungs[rung])
+                future = pool.submit(run_trial, trial_id, rung, rungs[rung], study.params(trial_id), weights,
+                                     data_yaml, threads)
+                running[future] = job
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                trial_id, rung = running.pop(future)
+                result = future.result()
+                study.finish(trial_id, rung, result)
+                if result:
+                    print(f"试验 {trial_id} 第 {rung} 级（{rungs[rung]} 轮）：fitness {result['fitness']:.4f}，"
+                          f"mAP50 {result['map50']:.3f}，耗时 {result['seconds']:.0f} 秒")
+    return write_hyp(study)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="超参数搜索（ASHA）")
+    parser.add_argument("--trials", type=int, default=16, help="最多尝试的超参数组数")
+    parser.add_argument("--workers", type=int, default=2, help="并行训练进程数")
+    parser.add_argument("--min-epochs", type=int, default=1, help="第 0 级的训练轮数")
+    parser.add_argument("--max-epochs", type=int, default=9, help="最高一级的训练轮数上限")
+    parser.add_argument("--eta", type=int, default=3, help="每一级只有前 1/eta 的试验晋级")
+    parser.add_argument("--weights", default="yolov8n.pt", help="试验使用的预训练模型（CPU 上建议用小模型）")
+    parser.add_argument("--study", default=STUDY_PATH, help="SQLite 研究文件，重新运行时继续之前的搜索")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    best = search(args.trials, args.workers, args.min_epochs, args.max_epochs, args.eta, args.weights,
+                  args.study, args.seed)
+    if best is None:
+        print("没有成功完成的试验")
+    else:
+        print(f"最好的超参数（试验 {best[0]}，fitness {best[2]:.4f}）已写入 {HYP_PATH}，train.py 会自动读取")
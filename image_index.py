@@ -0,0 +1,232 @@
+import threading
+import cv2
+import numpy as np
+from config_loader import get_config
+
+# 感知哈希：缩放到 32x32 灰度图，取 DCT 左上角 8x8 低频系数与中位数比较，得到 64 位哈希
+PHASH_SIZE = 32
+PHASH_LOW = 8
+
+# 查询时同时检查的翻转变体（花粉玻片经常被翻转后重新上传）
+FLIP_VARIANTS = {
+    "原图": None,
+    "水平翻转": 1,
+    "垂直翻转": 0,
+    "旋转180°": -1
+}
+
+# 入库时额外保存的中心裁剪哈希（保留的边长比例）：裁掉边缘后重新上传的图片与其中之一接近
+CROP_RATIOS = (0.95, 0.9, 0.85)
+
+_INT64_OFFSET = 1 << 64
+
+def _hash_from_small(small):
+    dct = cv2.dct(small)[:PHASH_LOW, :PHASH_LOW].flatten()
+    bits = dct[1:] > np.median(dct[1:])  # 不含直流分量
+    return int(np.packbits(np.concatenate([[False], bits])).view('>u8')[0])
+
+def _small(gray):
+    return cv2.resize(gray, (PHASH_SIZE, PHASH_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+def _gray(image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+def phash_variants(image):
+    """计算图片及其翻转变体的感知哈希 {变体名: 哈希}（只缩放一次，翻转在 32x32 小图上进行）"""
+    small = _small(_gray(image))
+    return {name: _hash_from_small(small if flip is None else np.ascontiguousarray(cv2.flip(small, flip)))
+            for name, flip in FLIP_VARIANTS.items()}
+
+def crop_hashes(image, ratios=CROP_RATIOS):
+    """图片中心裁剪（按 ratios 保留边长）后的感知哈希列表，入库时与原图哈希一起保存"""
+    gray = _gray(image)
+    height, width = gray.shape[:2]
+    hashes = []
+    for ratio in ratios:
+        dy, dx = int(height * (1 - ratio) / 2), int(width * (1 - ratio) / 2)
+        hashes.append(_hash_from_small(_small(gray[dy:height - dy, dx:width - dx])))
+    return hashes
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(values):
+        return np.bitwise_count(values)
+else:
+    _M1, _M2, _M4, _H01 = (np.uint64(v) for v in (0x5555555555555555, 0x3333333333333333, 0x0f0f0f0f0f0f0f0f,
+                                                   0x0101010101010101))
+
+    def popcount(values):
+        """uint64 数组逐元素的置位数（SWAR 位运算，NumPy 2.0 之前没有 bitwise_count）"""
+        values = values - ((values >> np.uint64(1)) & _M1)
+        values = (values & _M2) + ((values >> np.uint64(2)) & _M2)
+        values = (values + (values >> np.uint64(4))) & _M4
+        return ((values * _H01) >> np.uint64(56)).astype(np.uint8)
+
+def to_signed(value):
+    """SQLite INTEGER 为有符号 64 位"""
+    return value - _INT64_OFFSET if value >= 1 << 63 else value
+
+def to_unsigned(value):
+    return value % _INT64_OFFSET
+
+def pack_hashes(hashes):
+    return np.asarray(hashes, dtype='<u8').tobytes()
+
+def unpack_hashes(blob):
+    return [int(v) for v in np.frombuffer(blob, dtype='<u8')] if blob else []
+
+class MultiIndexHash:
+    """按汉明距离查询的 64 位哈希表（多索引哈希）
+
+    64 位分成 max_distance + 1 段，每段一个字典（段值 -> 槽位）。距离不超过 max_distance 的两个哈希
+    至少有一段完全相同（抽屉原理），查询时只取出与查询某一段相同的候选，再按置位数核对距离。
+    """
+
+    def __init__(self, max_distance, capacity=1024):
+        count = min(max_distance + 1, 64)
+        edges = [64 * i // count for i in range(count + 1)]
+        self.max_distance = max_distance
+        self.blocks = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(edges[:-1], edges[1:])]
+        self.tables = [{} for _ in self.blocks]
+        self._arrays = [{} for _ in self.blocks]   # 段值 -> 槽位数组（查询时按需生成，增删时失效）
+        self.values = np.zeros(capacity, dtype=np.uint64)
+        self.owners = []
+        self.slots = {}
+        self.size = 0
+
+    def _buckets(self, value):
+        return [(i, (value >> lo) & mask) for i, (lo, mask) in enumerate(self.blocks)]
+
+    def add(self, values, key):
+        """values 为同一 key 的一组哈希（原图及中心裁剪）"""
+        needed = self.size + len(values)
+        if needed > len(self.values):
+            self.values = np.concatenate([self.values, np.zeros(max(needed, 2 * len(self.values)) - len(self.values),
+                                                                dtype=np.uint64)])
+        slots = self.slots.setdefault(key, [])
+        for value in values:
+            slot = self.size
+            self.values[slot] = value
+            self.owners.append(key)
+            slots.append(slot)
+            for i, block in self._buckets(value):
+                self.tables[i].setdefault(block, []).append(slot)
+                self._arrays[i].pop(block, None)
+            self.size += 1
+
+    def remove(self, key):
+        """删除 key 的全部哈希（槽位不再复用）"""
+        for slot in self.slots.pop(key, []):
+            self.owners[slot] = None
+            for i, block in self._buckets(int(self.values[slot])):
+                bucket = self.tables[i][block]
+                bucket.remove(slot)
+                if not bucket:
+                    del self.tables[i][block]
+                self._arrays[i].pop(block, None)
+
+    def _candidates(self, value):
+        arrays = []
+        for i, block in self._buckets(value):
+            array = self._arrays[i].get(block)
+            if array is None:
+                bucket = self.tables[i].get(block)
+                if bucket is None:
+                    continue
+                array = self._arrays[i][block] = np.array(bucket, dtype=np.int64)
+            arrays.append(array)
+        return np.concatenate(arrays) if arrays else None
+
+    def nearest(self, queries):
+        """多个查询哈希中距离最近的一个匹配：(距离, key, 查询序号)，超过 max_distance 时返回 None"""
+        best = None
+        for i, query in enumerate(queries):
+            candidates = self._candidates(query)
+            if candidates is None:
+                continue
+            distances = popcount(self.values[candidates] ^ np.uint64(query))
+            j = int(np.argmin(distances))
+            if distances[j] <= self.max_distance and (best is None or distances[j] < best[0]):
+                best = (int(distances[j]), self.owners[candidates[j]], i)
+        return best
+
+class ImageHashIndex:
+    """已分析图片的重复检测索引
+
+    内容哈希（SHA-256）完全一致为完全重复，可直接复用之前保存的逐粒检测结果；
+    感知哈希在汉明距离阈值内（含翻转变体和入库时保存的中心裁剪）为近似重复。
+    """
+
+    def __init__(self, history, max_distance=None):
+        self.history = history
+        self.max_distance = max_distance if max_distance is not None else \
+            (get_config('dedup', default={}) or {}).get('max_distance', 8)
+        self._lock = threading.Lock()
+        self._index = MultiIndexHash(self.max_distance)
+        self._entries = {}
+        for image_hash, phash, filename, timestamp, crops in history.load_image_hashes():
+            self._insert(image_hash, to_unsigned(phash), filename, timestamp, unpack_hashes(crops))
+
+    def _insert(self, image_hash, phash, filename, timestamp, crops):
+        self._entries[image_hash] = {"image_hash": image_hash, "phash": phash, "filename": filename, "timestamp": timestamp}
+        self._index.add([phash] + list(crops), image_hash)
+
+    def _alive(self, image_hash):
+        """数据库中是否仍有该图片（历史压缩会删除过期图片的哈希），已删除的同时移出内存索引"""
+        if self.history.has_image_hash(image_hash):
+            return True
+        del self._entries[image_hash]
+        self._index.remove(image_hash)
+        return False
+
+    def find(self, image_hash, variants):
+        """查找重复图片，返回 None 或 {"exact", "distance", "variant", "image_hash", "filename", "timestamp"}"""
+        with self._lock:
+            entry = self._entries.get(image_hash)
+            if entry is not None and self._alive(image_hash):
+                return {**entry, "exact": True, "distance": 0, "variant": "原图"}
+            names = list(variants)
+            while True:
+                match = self._index.nearest([variants[name] for name in names])
+                if match is None:
+                    return None
+                distance, key, i = match
+                if self._alive(key):
+                    return {**self._entries[key], "exact": False, "distance": distance, "variant": names[i]}
+
+    def add(self, image_hash, phash, filename, timestamp, crops=()):
+        """记录一张已分析的图片（同时写入数据库），crops 为 crop_hashes 的结果"""
+        with self._lock:
+            if image_hash in self._entries and self._alive(image_hash):
+                return
+            self.history.add_image_hash(image_hash, to_signed(phash), filename, timestamp, pack_hashes(crops))
+            self._insert(image_hash, phash, filename, timestamp, crops)
+
+if __name__ == '__main__':
+    # 查询耗时测试：10 万张图片（每张含中心裁剪共 4 个哈希），每次查询 4 个翻转变体
+    import time
+    rng = np.random.default_rng(0)
+    values = [int(v) for v in rng.integers(0, np.iinfo(np.uint64).max, 400000, dtype=np.uint64, endpoint=True)]
+    for max_distance in (4, 8):
+        index = MultiIndexHash(max_distance)
+        for i in range(100000):
+            index.add(values[4 * i:4 * i + 4], i)
+        queries = [[v ^ 0b101, v ^ 0b11 << 40, v ^ 1 << 63, v ^ 0b1111 << 20] for v in values[:4000:20]]
+        for query in queries:   # 预热：生成各段的槽位数组
+            index.nearest(query)
+        start = time.perf_counter()
+        for query in queries:
+            index.nearest(query)
+        print(f"阈值 {max_distance}：{(time.perf_counter() - start) / len(queries) * 1000:.3f} ms / 次查询（4 个变体）")
+
+    image = rng.integers(0, 255, (600, 800, 3), dtype=np.uint8)
+    image = cv2.GaussianBlur(image, (31, 31), 0)
+    original = phash_variants(image)["原图"]
+    crops = crop_hashes(image)
+    for name, variant in (("水平翻转", cv2.flip(image, 1)), ("裁剪 5%", image[15:-15, 20:-20]),
+                          ("JPEG 压缩", cv2.imdecode(cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 60])[1], 1))):
+        distance = min(hamming(stored, value) for stored in [original] + crops
+                       for value in phash_variants(variant).values())
+        print(f"{name}：最小汉明距离 {distance}")
@@ -0,0 +1,149 @@
+import io
+import os
+import tracemalloc
+import cv2
+import numpy as np
+from PIL import Image
+from config_loader import get_config
+from tracing import tracer
+
+# 降分辨率解码：缩小倍数 -> OpenCV 读取标志
+REDUCED_DECODE_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2)
+]
+
+# 图像预处理
+def preprocess_image(image, max_size=1024):
+    # 转换为numpy数组
+    if not isinstance(image, np.ndarray):
+        image = np.array(image)
+
+    # 获取图片尺寸
+    height, width = image.shape[:2]
+
+    # 如果图片太大，进行缩放
+    if height > max_size or width > max_size:
+        # 计算缩放比例
+        scale = max_size / max(height, width)
+        new_height = int(height * scale)
+        new_width = int(width * scale)
+        # 缩放图片
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
+
+    return image
+
+def get_file_size(file):
+    """获取上传文件大小（不复制文件内容）"""
+    size = getattr(file, 'size', None)
+    if size is None:
+        pos = file.tell()
+        size = file.seek(0, io.SEEK_END)
+        file.seek(pos)
+    return size
+
+def get_image_size(file):
+    """仅读取图片文件头获取宽高（不做完整解码）"""
+    pos = file.tell()
+    try:
+        file.seek(0)
+        with Image.open(file) as img:
+            return img.size
+    finally:
+        file.seek(pos)
+
+def choose_decode_flag(width, height, max_size):
+    """选择解码标志：图片反正要缩放到 max_size 时，直接按 1/2、1/4、1/8 分辨率解码"""
+    longest = max(width, height)
+    for factor, flag in REDUCED_DECODE_FLAGS:
+        if longest / factor >= max_size:
+            return factor, flag
+    return 1, cv2.IMREAD_COLOR
+
+def decode_upload(uploaded_file, max_size=None):
+    """校验并解码上传的图片
+
+    先根据文件大小和文件头中的宽高做校验，再直接在上传缓冲区上解码
+    （不调用 getvalue()/read() 复制字节），需要缩放时使用降分辨率解码。
+    检测、活力判断和形态测量都在返回的图像上进行：长边超过 max_size 时会缩小，
+    max_size 默认取 image.preprocessing.max_size；preprocessing.resize 为 false
+    或 max_size 为 0 时按原始分辨率解码（高密度玻片上小花粉的检测更准确，但更慢、占用内存更多）。
+    返回 (True, {"image", "width", "height", "scale"}) 或 (False, 错误信息)。
+    """
+    image_config = get_config('image', default={})
+    max_file_size = image_config.get('max_file_size', 5 * 1024 * 1024)
+    max_width, max_height = image_config.get('max_resolution', [4000, 3000])
+    if max_size is None:
+        preprocessing = image_config.get('preprocessing') or {}
+        max_size = preprocessing.get('max_size', 1024) if preprocessing.get('resize', True) else 0
+
+    # 检查文件大小
+    if get_file_size(uploaded_file) > max_file_size:
+        return False, f"文件大小超过{max_file_size / (1024 * 1024):.0f}MB限制，请选择更小的文件。"
+
+    # 检查图片分辨率（仅读取文件头）
+    try:
+        width, height = get_image_size(uploaded_file)
+    except Exception:
+        return False, "无法识别的图片格式"
+    if width * height > max_width * max_height:
+        return False, f"图片分辨率过高，请使用更小的图片（建议不超过{max_width}x{max_height}）。"
+
+    # 在上传缓冲区上直接解码（不缩放时按原始分辨率）
+    _, flag = choose_decode_flag(width, height, max_size) if max_size else (1, cv2.IMREAD_COLOR)
+    with tracer.span("image.decode"):
+        if hasattr(uploaded_file, 'getbuffer'):
+            buffer = np.frombuffer(uploaded_file.getbuffer(), np.uint8)
+        else:
+            buffer = np.frombuffer(uploaded_file.read(), np.uint8)
+        image = cv2.imdecode(buffer, flag)
+        del buffer
+    if image is None:
+        return False, "图片解码失败"
+
+    if max_size:
+        with tracer.span("image.preprocess"):
+            image = preprocess_image(image, max_size)
+    return True, {
+        "image": image,
+        "width": width,
+        "height": height,
+        "scale": image.shape[1] / width
+    }
+
+def measure_peak_memory(func, *args, **kwargs):
+    """使用 tracemalloc 统计一次调用的内存峰值（字节）"""
+    tracemalloc.start()
+    try:
+        result = func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+def _legacy_decode(uploaded_file):
+    """旧的解码路径（用于对比内存峰值）"""
+    file_size = len(uploaded_file.getvalue())
+    image_bytes = uploaded_file.read()
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    image_with_boxes = image.copy()
+    img_pil = Image.fromarray(image_with_boxes)
+    image_with_boxes = np.array(img_pil)
+    display = cv2.cvtColor(image_with_boxes, cv2.COLOR_BGR2RGB)
+    return file_size, image, image_with_boxes, display
+
+def _streaming_decode(uploaded_file):
+    """新的解码路径（用于对比内存峰值）"""
+    success, result = decode_upload(uploaded_file)
+    return result
+
+if __name__ == '__main__':
+    image_dir = os.path.join('datasets', 'flower', 'images', 'train')
+    print(f"{'文件名':<20} {'旧路径峰值(MB)':>14} {'新路径峰值(MB)':>14}")
+    for name in sorted(os.listdir(image_dir))[:10]:
+        with open(os.path.join(image_dir, name), 'rb') as f:
+            data = f.read()
+        _, legacy_peak = measure_peak_memory(_legacy_decode, io.BytesIO(data))
+        _, streaming_peak = measure_peak_memory(_streaming_decode, io.BytesIO(data))
+        print(f"{name:<20} {legacy_peak / 1e6:>14.2f} {streaming_peak / 1e6:>14.2f}")
@@ -0,0 +1,180 @@
+import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from system_log import get_logger
+
+# 案例图片存储目录
+CASE_IMAGES_DIR = 'case_images'
+
+logger = get_logger('image_variants')
+
+# 图片规格：名称 -> 最长边像素
+VARIANT_SIZES = {
+    "thumb": 320,
+    "medium": 1024
+}
+
+class ImageVariantService:
+    """案例图片多规格服务
+
+    原图按内容哈希存放在 case_images/originals/ 下（相同内容只存一份），
+    缩略图和中图在后台线程中生成，存放在 case_images/variants/ 下。
+    页面按需取对应规格，尚未生成时回退到原图。
+    """
+
+    def __init__(self, base_dir=CASE_IMAGES_DIR, image_format="WEBP", quality=80):
+        self.base_dir = base_dir
+        self.originals_dir = os.path.join(base_dir, 'originals')
+        self.variants_dir = os.path.join(base_dir, 'variants')
+        self.image_format = image_format
+        self.quality = quality
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-variants")
+        self._pending = set()
+        self._digests = {}  # 旧路径 -> (mtime, 内容哈希)
+        self._failed = set()  # 生成失败的 (原图路径, mtime)，文件未改变时不再重试
+        self._lock = threading.Lock()
+        os.makedirs(self.originals_dir, exist_ok=True)
+        os.makedirs(self.variants_dir, exist_ok=True)
+
+    @property
+    def variant_ext(self):
+        return ".webp" if self.image_format == "WEBP" else ".jpg"
+
+    def content_hash(self, data):
+        """计算图片内容哈希"""
+        return hashlib.sha256(data).hexdigest()
+
+    def save_original(self, data, filename):
+        """按内容哈希保存原图（重复内容不再写盘），并在后台生成各规格图片"""
+        digest = self.content_hash(data)
+        ext = os.path.splitext(filename)[1].lower() or ".jpg"
+        path = os.path.join(self.originals_dir, f"{digest}{ext}")
+        if not os.path.exists(path):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        self.schedule_variants(path, digest)
+        return path
+
+    def _digest_for_path(self, image_path):
+        """从原图路径得到内容哈希（兼容旧的非内容寻址路径）"""
+        name = os.path.splitext(os.path.basename(image_path))[0]
+        if os.path.dirname(os.path.abspath(image_path)) == os.path.abspath(self.originals_dir):
+            return name
+        mtime = os.path.getmtime(image_path)
+        with self._lock:
+            cached = self._digests.get(image_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(image_path, 'rb') as f:
+            digest = self.content_hash(f.read())
+        with self._lock:
+            self._digests[image_path] = (mtime, digest)
+        return digest
+
+    def variant_path(self, digest, variant):
+        return os.path.join(self.variants_dir, f"{digest}_{variant}{self.variant_ext}")
+
+    def schedule_variants(self, image_path, digest=None):
+        """提交后台任务生成缩略图和中图（之前生成失败且原图未改变时跳过）"""
+        try:
+            failed_key = (image_path, os.path.getmtime(image_path))
+        except OSError:
+            return
+        with self._lock:
+            if image_path in self._pending or failed_key in self._failed:
+                return
+            self._pending.add(image_path)
+        self._executor.submit(self._generate_variants, image_path, digest)
+
+    def _generate_variants(self, image_path, digest=None):
+        try:
+            digest = digest or self._digest_for_path(image_path)
+            targets = [(name, size) for name, size in VARIANT_SIZES.items()
+                       if not os.path.exists(self.variant_path(digest, name))]
+            if not targets:
+                return
+
+            with Image.open(image_path) as img:
+                # JPEG 可直接按目标尺寸降采样解码，避免解出全分辨率图像
+                img.draft("RGB", (max(size for _, size in targets),) * 2)
+                img = ImageOps.exif_transpose(img).convert("RGB")
+                for name, size in sorted(targets, key=lambda t: -t[1]):
+                    img.thumbnail((size, size), Image.LANCZOS)
+                    out_path = self.variant_path(digest, name)
+                    tmp_path = f"{out_path}.tmp"
+                    img.save(tmp_path, format=self.image_format, quality=self.quality)
+                    os.replace(tmp_path, out_path)
+        except Exception:
+            logger.exception("生成图片缩略图失败 %s", image_path)
+            try:
+                with self._lock:
+                    self._failed.add((image_path, os.path.getmtime(image_path)))
+            except OSError:
+                pass
+        finally:
+            with self._lock:
+                self._pending.discard(image_path)
+
+    def get_image(self, image_path, variant="thumb"):
+        """获取指定规格的图片路径，尚未生成时返回原图并在后台补生成"""
+        if not os.path.exists(image_path):
+            return None
+        try:
+            digest = self._digest_for_path(image_path)
+        except OSError:
+            return image_path
+        path = self.variant_path(digest, variant)
+        if os.path.exists(path):
+            return path
+        self.schedule_variants(image_path, digest)
+        return image_path
+
+    def wait(self):
+        """等待后台任务完成（用于命令行报告）"""
+        self._executor.submit(lambda: None).result()
+
+def report_case_page_bytes(cases, service, variant="thumb"):
+    """统计案例页面发送的图片字节数（原图 vs 指定规格）"""
+    report = []
+    for case in cases:
+        original_bytes = 0
+        variant_bytes = 0
+        for img_path in case['images']:
+            if not os.path.exists(img_path):
+                continue
+            original_bytes += os.path.getsize(img_path)
+            variant_bytes += os.path.getsize(service.get_image(img_path, variant))
+        report.append({
+            "id": case['id'],
+            "title": case['title'],
+            "images": len(case['images']),
+            "original_bytes": original_bytes,
+            "variant_bytes": variant_bytes
+        })
+    return report
+
+# 全局图片服务实例
+image_variant_service = ImageVariantService()
+
+if __name__ == '__main__':
+    from case_management import CaseManagement
+
+    cases = CaseManagement().get_cases(sort_by="最新发布", limit=1000)
+    # 先为所有图片生成缩略图，再统计
+    for case in cases:
+        for img_path in case['images']:
+            if os.path.exists(img_path):
+                image_variant_service.schedule_variants(img_path)
+    image_variant_service.wait()
+
+    report = report_case_page_bytes(cases, image_variant_service)
+    total_before = sum(r["original_bytes"] for r in report)
+    total_after = sum(r["variant_bytes"] for r in report)
+    print(f"{'案例ID':>6} {'图片数':>6} {'原图字节':>12} {'缩略图字节':>12}")
+    for r in report:
+        print(f"{r['id']:>6} {r['images']:>6} {r['original_bytes']:>12} {r['variant_bytes']:>12}")
+    print(f"案例页面总计：原图 {total_before} 字节 -> 缩略图 {total_after} 字节")
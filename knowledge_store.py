@@ -0,0 +1,103 @@
+import os
+import threading
+import yaml
+
+# 知识库文章目录
+KNOWLEDGE_DIR = 'knowledge'
+
+class KnowledgeStore:
+    """知识库内容存储
+
+    文章为带元数据头的 Markdown 文件，例如：
+
+        ---
+        title: 水稻花粉的形态特征
+        category: 基础知识
+        order: 1
+        ---
+        正文……
+
+    每篇文章只解析一次，按文件修改时间失效；每个分类的页面内容
+    预先拼接为一段 Markdown 并缓存，页面切换时直接从缓存渲染。
+    新增或修改文章无需重启应用。
+    """
+
+    def __init__(self, content_dir=KNOWLEDGE_DIR):
+        self.content_dir = content_dir
+        self._documents = {}  # path -> document
+        self._rendered = {}   # category -> (signature, markdown)
+        self._lock = threading.Lock()
+
+    def _parse_document(self, path, mtime):
+        """解析单篇文章（元数据头 + 正文）"""
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+
+        metadata = {}
+        body = text
+        if text.startswith('---'):
+            parts = text.split('---', 2)
+            if len(parts) == 3:
+                metadata = yaml.safe_load(parts[1]) or {}
+                body = parts[2]
+
+        return {
+            "path": path,
+            "mtime": mtime,
+            "title": metadata.get("title", os.path.splitext(os.path.basename(path))[0]),
+            "category": metadata.get("category", "其他"),
+            "order": metadata.get("order", 0),
+            "metadata": metadata,
+            "body": body.strip()
+        }
+
+    def _scan(self):
+        """扫描文章目录，仅重新解析修改过的文件"""
+        seen = set()
+        if os.path.isdir(self.content_dir):
+            for entry in os.scandir(self.content_dir):
+                if not entry.is_file() or not entry.name.endswith('.md'):
+                    continue
+                seen.add(entry.path)
+                mtime = entry.stat().st_mtime
+                cached = self._documents.get(entry.path)
+                if cached and cached["mtime"] == mtime:
+                    continue
+                try:
+                    self._documents[entry.path] = self._parse_document(entry.path, mtime)
+                except Exception as e:
+                    print(f"解析知识库文章 {entry.path} 失败：{e}")
+
+        # 移除已删除的文章
+        for path in list(self._documents):
+            if path not in seen:
+                del self._documents[path]
+
+    def get_documents(self, category):
+        """获取某一分类下的文章（按 order 排序）"""
+        with self._lock:
+            self._scan()
+            docs = [doc for doc in self._documents.values() if doc["category"] == category]
+        return sorted(docs, key=lambda doc: (doc["order"], doc["title"]))
+
+    def render_category(self, category):
+        """获取某一分类预渲染好的 Markdown"""
+        docs = self.get_documents(category)
+        signature = tuple((doc["path"], doc["mtime"]) for doc in docs)
+
+        with self._lock:
+            cached = self._rendered.get(category)
+            if cached and cached[0] == signature:
+                return cached[1]
+
+        sections = []
+        for idx, doc in enumerate(docs, 1):
+            sections.append(f"### {idx}. {doc['title']}\n\n{doc['body']}")
+        markdown = "\n\n".join(sections)
+
+        with self._lock:
+            self._rendered[category] = (signature, markdown)
+        return markdown
+
+# 全局知识库实例（模块缓存，Streamlit 重新运行脚本时复用）
+knowledge_store = KnowledgeStore()
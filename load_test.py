@@ -0,0 +1,251 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import threading
+from collections import defaultdict
+from datetime import datetime
+import numpy as np
+from config_loader import get_config
+from case_management import CaseManagement
+from benchmark import (REPO_DIR, BENCHMARK_DIR, MockModel, bench_workspace, synthetic_slide, encode_jpeg,
+                       fill_cases, machine_info)
+
+class InFlightCounter:
+    """统计同时进行中的调用数（不加锁串行化，与应用中直接调用共享模型的行为一致）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.calls = 0
+
+    def __enter__(self):
+        with self._lock:
+            self.in_flight += 1
+            self.calls += 1
+            self.peak = max(self.peak, self.in_flight)
+        return self
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.in_flight -= 1
+
+class SlowMockModel(MockModel):
+    """模拟推理耗时的模型（sleep 期间释放 GIL，与 torch 推理时的行为一致）"""
+
+    def __init__(self, detections, inference_ms):
+        super().__init__(detections)
+        self.inference_seconds = inference_ms / 1000
+
+    def __call__(self, image):
+        time.sleep(self.inference_seconds)
+        return super().__call__(image)
+
+class LoadStats:
+    """按操作汇总延迟和错误"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    def record(self, op, seconds, error=None):
+        with self._lock:
+            if error is None:
+                self.latencies[op].append(seconds)
+            else:
+                self.errors[op][error] += 1
+
+    def summary(self, elapsed, timeout):
+        report = {}
+        for op in sorted(set(self.latencies) | set(self.errors)):
+            values = np.sort(np.array(self.latencies[op])) * 1000
+            errors = sum(self.errors[op].values())
+            total = len(values) + errors
+            report[op] = {
+                "requests": total,
+                "throughput_per_s": total / elapsed,
+                "error_rate": errors / total if total else 0.0,
+                "errors": dict(self.errors[op]),
+                "p50_ms": float(np.percentile(values, 50)) if len(values) else None,
+                "p95_ms": float(np.percentile(values, 95)) if len(values) else None,
+                "p99_ms": float(np.percentile(values, 99)) if len(values) else None,
+                "max_ms": float(values[-1]) if len(values) else None,
+                "over_timeout": int((values > timeout * 1000).sum())
+            }
+        return report
+
+def classify_error(error):
+    """把异常归类，便于区分锁冲突、超时和其他错误"""
+    message = str(error)
+    if isinstance(error, sqlite3.OperationalError) and "locked" in message:
+        return "sqlite_locked"
+    if "请求过多" in message or "频繁" in message:
+        return "rejected"
+    return type(error).__name__
+
+class SimulatedSession(threading.Thread):
+    """一个模拟用户会话：登录后在检测页和案例页之间切换，每次操作之间有思考时间"""
+
+    def __init__(self, index, app, model, inference_counter, upload_bytes, stats, deadline, think_seconds):
+        super().__init__(name=f"session-{index}", daemon=True)
+        self.index = index
+        self.app = app
+        self.model = model
+        self.inference_counter = inference_counter
+        self.upload_bytes = upload_bytes
+        self.stats = stats
+        self.deadline = deadline
+        self.think_seconds = think_seconds
+        self.rng = random.Random(index)
+        self.session_token = None
+
+    def timed(self, op, func):
+        start = time.perf_counter()
+        try:
+            result = func()
+        except Exception as e:
+            self.stats.record(op, time.perf_counter() - start, classify_error(e))
+            return None
+        self.stats.record(op, time.perf_counter() - start)
+        return result
+
+    def login(self):
+        success, result = self.app.user_mgmt.login(f"load{self.index}", "Load@123456",
+                                                   client_ip=f"10.0.{self.index // 250}.{self.index % 250 + 1}")
+        if not success:
+            raise RuntimeError(result)
+        self.session_token = result['session_token']
+
+    def detect(self):
+        from image_io import decode_upload
+        from chart_data import detection_figures_json
+        # 每次脚本重跑都会校验会话
+        if self.app.user_mgmt.validate_session(self.session_token) is None:
+            raise RuntimeError("session expired")
+        success, decoded = decode_upload(io.BytesIO(self.upload_bytes))
+        if not success:
+            raise RuntimeError(decoded)
+        image = decoded["image"]
+        # 应用中所有会话直接调用同一个共享模型实例（没有模型锁），这里同样并发调用
+        with self.inference_counter:
+            results = self.app.run_model(self.model, image)
+        _, class_counts = self.app.visualize_results(image, results[0], copy=False)
+        self.app.analysis_history.add_record({
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "filename": f"load_{self.index}.jpg",
+            "data": class_counts
+        })
+        detection_figures_json(self.app.analysis_history, class_counts)
+
+    def case_feed(self):
+        if self.app.user_mgmt.validate_session(self.session_token) is None:
+            raise RuntimeError("session expired")
+        return CaseManagement().get_cases(sort_by="最新发布", limit=10)
+
+    def run(self):
+        self.timed("login", self.login)
+        if self.session_token is None:
+            return
+        while time.time() < self.deadline:
+            if self.rng.random() < 0.6:
+                self.timed("detection", self.detect)
+            else:
+                self.timed("case_feed", self.case_feed)
+            time.sleep(self.rng.uniform(0, 2 * self.think_seconds))
+
+def run_load_test(users, duration, think_seconds, ramp_seconds, model_kind, inference_ms, grains):
+    """启动 users 个并发会话运行 duration 秒，返回统计结果"""
+    import app_streamlit as app
+
+    image, detections = synthetic_slide(1600, 1200, grains, seed=7)
+    upload_bytes = encode_jpeg(image)
+    if model_kind == "cpu":
+        from ultralytics import YOLO
+        model = YOLO(os.path.join(REPO_DIR, get_config('model', 'path', 'runs/train7/weights/best.pt')))
+        model.to('cpu')
+    else:
+        model = SlowMockModel(detections, inference_ms)
+
+    # 准备账号和案例数据（账号批量导入，密码哈希在线程池中计算）
+    print(f"准备 {users} 个测试账号...")
+    csv_data = "username,password,email,phone,role\n" + "".join(
+        f"load{i},Load@123456,,,user\n" for i in range(users))
+    app.user_mgmt.import_users_csv(io.StringIO(csv_data))
+    fill_cases(CaseManagement(), 200)
+
+    stats = LoadStats()
+    inference_counter = InFlightCounter()
+    start = time.time()
+    deadline = start + duration
+    sessions = []
+    for i in range(users):
+        session = SimulatedSession(i, app, model, inference_counter, upload_bytes, stats, deadline, think_seconds)
+        session.start()
+        sessions.append(session)
+        time.sleep(ramp_seconds / users)
+    for session in sessions:
+        session.join()
+    elapsed = time.time() - start
+
+    timeout = get_config('performance', 'request_timeout', 30)
+    return {
+        "operations": stats.summary(elapsed, timeout),
+        "contention": {
+            "inference_calls": inference_counter.calls,
+            "inference_peak_in_flight": inference_counter.peak,
+            "sqlite_locked_errors": sum(ops.get("sqlite_locked", 0) for ops in stats.errors.values())
+        },
+        "elapsed_seconds": elapsed
+    }
+
+if __name__ == '__main__':
+    # python load_test.py --users 100 --duration 60
+    parser = argparse.ArgumentParser(description="花粉检测系统并发负载测试")
+    parser.add_argument('--users', type=int, default=get_config('performance', 'max_concurrent_users', 100),
+                        help="并发会话数（默认取 performance.max_concurrent_users）")
+    parser.add_argument('--duration', type=float, default=60, help="测试时长（秒）")
+    parser.add_argument('--think', type=float, default=2.0, help="操作之间的平均思考时间（秒）")
+    parser.add_argument('--ramp', type=float, default=10, help="全部会话启动完成所用的时间（秒）")
+    parser.add_argument('--model', choices=["mock", "cpu"], default="mock", help="模拟模型或 CPU 上的真实模型")
+    parser.add_argument('--inference-ms', type=float, default=150, help="模拟模型的单次推理耗时")
+    parser.add_argument('--grains', type=int, default=150, help="每张图片的花粉数量")
+    parser.add_argument('--output', default=None, help="结果文件（默认 benchmarks/results/load_<时间>.json）")
+    args = parser.parse_args()
+
+    os.environ.setdefault('YOLO_SKIP_FONT_CHECK', 'TRUE')
+    sys.path.insert(0, REPO_DIR)
+    with bench_workspace():
+        result = run_load_test(args.users, args.duration, args.think, args.ramp, args.model,
+                               args.inference_ms, args.grains)
+
+    timeout = get_config('performance', 'request_timeout', 30)
+    print(f"\n{args.users} 个并发会话，{result['elapsed_seconds']:.0f} 秒：")
+    for op, item in result["operations"].items():
+        latency = (f"p50 {item['p50_ms']:8.1f}  p95 {item['p95_ms']:8.1f}  p99 {item['p99_ms']:8.1f} ms"
+                   if item["p50_ms"] is not None else "无成功请求")
+        print(f"{op:<10} {item['requests']:>6} 次  {item['throughput_per_s']:7.2f} 次/秒  {latency}  "
+              f"错误率 {item['error_rate']:.1%} {item['errors'] or ''}")
+    contention = result["contention"]
+    if contention["inference_calls"]:
+        print(f"模型推理：{contention['inference_calls']} 次，最多 {contention['inference_peak_in_flight']} 个同时进行")
+    print(f"SQLite 锁冲突：{contention['sqlite_locked_errors']} 次")
+
+    over_timeout = sum(item["over_timeout"] for item in result["operations"].values())
+    errors = sum(sum(item["errors"].values()) for item in result["operations"].values())
+    verdict = "满足" if over_timeout == 0 and errors == 0 else "不满足"
+    print(f"结论：{args.users} 并发下{verdict} request_timeout={timeout} 秒的要求"
+          f"（超时 {over_timeout} 次，错误 {errors} 次）")
+
+    report = {"timestamp": datetime.now().isoformat(timespec='seconds'), "machine": machine_info(),
+              "args": vars(args), **result}
+    output = args.output or os.path.join(BENCHMARK_DIR, 'results', f"load_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存：{output}")
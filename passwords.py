@@ -0,0 +1,131 @@
+import hmac
+import hashlib
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config_loader import get_config
+
+# 默认密码哈希参数（可在 config.yaml 的 security.password_hashing 中覆盖）
+DEFAULT_HASHING = {
+    "algorithm": "scrypt",       # scrypt 或 pbkdf2_sha256
+    "scrypt_n": 16384,
+    "scrypt_r": 8,
+    "scrypt_p": 1,
+    "pbkdf2_iterations": 200000,
+    "workers": 2,                # 密码计算线程数上限
+    "max_pending": 64            # 排队中的密码计算任务上限
+}
+
+def get_hashing_config():
+    config = dict(DEFAULT_HASHING)
+    config.update(get_config('security', 'password_hashing', {}) or {})
+    return config
+
+def _legacy_sha256(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+def hash_password(password, salt=None):
+    """计算密码哈希，结果包含算法、参数和盐
+
+    scrypt$n$r$p$salt$hash
+    pbkdf2_sha256$iterations$salt$hash
+    """
+    config = get_hashing_config()
+    salt = salt or secrets.token_bytes(16)
+    if config["algorithm"] == "pbkdf2_sha256":
+        iterations = config["pbkdf2_iterations"]
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+        return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+    n, r, p = config["scrypt_n"], config["scrypt_r"], config["scrypt_p"]
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                            maxmem=256 * n * r + 1024 * 1024, dklen=32)
+    return f"scrypt${n}${r}${p}${salt.hex()}${digest.hex()}"
+
+def needs_rehash(stored):
+    """哈希是否为旧格式或参数与当前配置不一致"""
+    config = get_hashing_config()
+    parts = stored.split('$')
+    if config["algorithm"] == "pbkdf2_sha256":
+        return parts[0] != "pbkdf2_sha256" or int(parts[1]) != config["pbkdf2_iterations"]
+    return parts[0] != "scrypt" or [int(x) for x in parts[1:4]] != [config["scrypt_n"], config["scrypt_r"], config["scrypt_p"]]
+
+def verify_password(password, stored):
+    """校验密码，返回 (是否匹配, 是否需要重新计算哈希)"""
+    parts = stored.split('$')
+    if parts[0] == "scrypt" and len(parts) == 6:
+        n, r, p = (int(x) for x in parts[1:4])
+        salt, expected = bytes.fromhex(parts[4]), bytes.fromhex(parts[5])
+        digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                                maxmem=256 * n * r + 1024 * 1024, dklen=len(expected))
+    elif parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+        iterations = int(parts[1])
+        salt, expected = bytes.fromhex(parts[2]), bytes.fromhex(parts[3])
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    else:
+        # 旧版本的无盐 SHA-256
+        matched = hmac.compare_digest(_legacy_sha256(password), stored)
+        return matched, matched
+
+    matched = hmac.compare_digest(digest, expected)
+    return matched, matched and needs_rehash(stored)
+
+class PasswordHasher:
+    """在有界线程池中执行密码哈希
+
+    scrypt/PBKDF2 计算期间会释放 GIL，放到固定大小的线程池中执行，
+    登录高峰最多占用 workers 个核心，不会挤占检测请求；排队任务超过
+    max_pending 时直接拒绝。
+    """
+
+    def __init__(self, workers=None, max_pending=None):
+        config = get_hashing_config()
+        self.workers = workers or config["workers"]
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password")
+        self._slots = threading.BoundedSemaphore(max_pending or config["max_pending"])
+
+    def submit(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise RuntimeError("登录请求过多，请稍后再试")
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def hash(self, password, timeout=None):
+        return self.submit(hash_password, password).result(timeout)
+
+    def verify(self, password, stored, timeout=None):
+        return self.submit(verify_password, password, stored).result(timeout)
+
+    def hash_many(self, passwords):
+        """批量计算哈希（每次只提交 workers 个任务，不占满排队槽位）"""
+        hashed = []
+        for i in range(0, len(passwords), self.workers):
+            futures = [self.submit(hash_password, password) for password in passwords[i:i + self.workers]]
+            hashed.extend(future.result() for future in futures)
+        return hashed
+
+# 全局密码计算线程池
+password_hasher = PasswordHasher()
+
+if __name__ == '__main__':
+    # 密码哈希吞吐量测试
+    import time
+
+    config = get_hashing_config()
+    stored = hash_password("bench123")
+    start = time.perf_counter()
+    for _ in range(20):
+        verify_password("bench123", stored)
+    single = (time.perf_counter() - start) / 20
+    print(f"算法：{config['algorithm']}，单次校验耗时：{single * 1000:.1f} ms")
+
+    for workers in (1, 2, 4):
+        hasher = PasswordHasher(workers=workers, max_pending=1000)
+        count = 100
+        start = time.perf_counter()
+        futures = [hasher.submit(verify_password, "bench123", stored) for _ in range(count)]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - start
+        print(f"线程数 {workers}：{count / elapsed:.1f} 次/秒")
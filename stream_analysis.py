@@ -0,0 +1,197 @@
+import time
+import cv2
+import numpy as np
+from config_loader import get_config
+from analysis_history import CLASS_NAMES
+
+def get_stream_config():
+    config = {"stride": 5, "iou_threshold": 0.3, "max_age": 3, "min_hits": 2, "max_points": 500, "max_side": 1024}
+    config.update(get_config('stream', default={}) or {})
+    return config
+
+def iou_matrix(a, b):
+    """两组检测框 (N,4)、(M,4) 的 IoU 矩阵"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+class IoUTracker:
+    """按 IoU 贪心匹配的轻量跟踪器，保证每粒花粉只计数一次
+
+    活跃轨迹保存在定长数组中；超过 max_age 个检测帧未匹配的轨迹结束，
+    只把结果累加到各类别计数中，内存占用只与画面中同时出现的花粉数有关。
+    """
+
+    def __init__(self, iou_threshold=0.3, max_age=3, min_hits=2, viability_threshold=0.5):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.viability_threshold = viability_threshold
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+        self.classes = np.zeros(0, dtype=np.int64)
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.score_sum = np.zeros(0, dtype=np.float64)
+        self.age = np.zeros(0, dtype=np.int64)
+        # 已结束轨迹的计数：[类别, (总数, 可育数)]
+        self.finished = np.zeros((len(CLASS_NAMES), 2), dtype=np.int64)
+
+    def update(self, grains):
+        """用一帧的逐粒检测结果（grain_records.GRAIN_DTYPE）更新轨迹"""
+        boxes = np.stack([grains["x1"], grains["y1"], grains["x2"], grains["y2"]], axis=1).astype(np.float32)
+        matched_tracks = np.zeros(len(self.boxes), dtype=bool)
+        matched_dets = np.zeros(len(boxes), dtype=bool)
+
+        if len(self.boxes) and len(boxes):
+            ious = iou_matrix(self.boxes, boxes)
+            # 贪心：按 IoU 从大到小依次匹配
+            order = np.argsort(ious, axis=None)[::-1]
+            for flat in order:
+                t, d = divmod(int(flat), len(boxes))
+                if ious[t, d] < self.iou_threshold:
+                    break
+                if matched_tracks[t] or matched_dets[d]:
+                    continue
+                matched_tracks[t] = matched_dets[d] = True
+                self.boxes[t] = boxes[d]
+                self.hits[t] += 1
+                self.score_sum[t] += grains["score"][d]
+                self.age[t] = 0
+
+        self.age[~matched_tracks] += 1
+
+        # 结束过期轨迹
+        expired = self.age > self.max_age
+        if expired.any():
+            self._finish(expired)
+
+        # 未匹配的检测新建轨迹
+        new = ~matched_dets
+        self.boxes = np.concatenate([self.boxes, boxes[new]])
+        self.classes = np.concatenate([self.classes, grains["cls"][new].astype(np.int64)])
+        self.hits = np.concatenate([self.hits, np.ones(int(new.sum()), dtype=np.int64)])
+        self.score_sum = np.concatenate([self.score_sum, grains["score"][new].astype(np.float64)])
+        self.age = np.concatenate([self.age, np.zeros(int(new.sum()), dtype=np.int64)])
+
+    def _finish(self, mask):
+        confirmed = mask & (self.hits >= self.min_hits)
+        viable = (self.score_sum / np.maximum(self.hits, 1)) >= self.viability_threshold
+        np.add.at(self.finished[:, 0], self.classes[confirmed], 1)
+        np.add.at(self.finished[:, 1], self.classes[confirmed & viable], 1)
+        keep = ~mask
+        self.boxes, self.classes = self.boxes[keep], self.classes[keep]
+        self.hits, self.score_sum, self.age = self.hits[keep], self.score_sum[keep], self.age[keep]
+
+    def counts(self, include_active=True):
+        """各类别去重后的计数（与 class_counts 格式一致）"""
+        totals = self.finished.copy()
+        if include_active and len(self.boxes):
+            confirmed = self.hits >= self.min_hits
+            viable = (self.score_sum / np.maximum(self.hits, 1)) >= self.viability_threshold
+            np.add.at(totals[:, 0], self.classes[confirmed], 1)
+            np.add.at(totals[:, 1], self.classes[confirmed & viable], 1)
+        return {name: {"total": int(totals[i, 0]), "viable": int(totals[i, 1]),
+                       "non_viable": int(totals[i, 0] - totals[i, 1])} for i, name in enumerate(CLASS_NAMES)}
+
+    def flush(self):
+        self._finish(np.ones(len(self.boxes), dtype=bool))
+
+class BoundedSeries:
+    """定长时间序列：点数达到上限时相邻两点合并，分辨率减半，长录像的内存占用不变
+
+    每个点累计所含检测帧的花粉数和可育数，输出时按帧数取平均，合并前后的检测数可以直接比较。
+    """
+
+    def __init__(self, max_points=500):
+        self.max_points = max_points
+        self.points = []   # [时间(秒), 花粉数, 可育数, 检测帧数]
+        self.merge = 1     # 每个点代表的检测帧数
+        self._pending = None
+
+    def add(self, seconds, total, viable):
+        if self._pending is None:
+            self._pending = [seconds, 0, 0, 0]
+        self._pending[1] += total
+        self._pending[2] += viable
+        self._pending[3] += 1
+        if self._pending[3] >= self.merge:
+            self.points.append(self._pending)
+            self._pending = None
+        if len(self.points) >= self.max_points:
+            self.points = [[a[0], a[1] + b[1], a[2] + b[2], a[3] + b[3]]
+                           for a, b in zip(self.points[::2], self.points[1::2])] \
+                + (self.points[-1:] if len(self.points) % 2 else [])
+            self.merge *= 2
+
+    def rows(self):
+        points = self.points + ([self._pending] if self._pending else [])
+        return [{"时间(秒)": round(t, 1), "检测数": round(total / frames, 1),
+                 "活力率(%)": viable / total * 100 if total else 0.0}
+                for t, total, viable, frames in points]
+
+def open_source(source):
+    """打开视频文件或摄像头（整数设备号）"""
+    capture = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+    if not capture.isOpened():
+        return None
+    return capture
+
+def analyze_stream(source, detect, stride=None, max_frames=None, confidence_threshold=0.5, on_progress=None,
+                   should_stop=None):
+    """逐帧分析视频或摄像头
+
+    每 stride 帧运行一次 detect(frame) -> 逐粒检测结果，跳过的帧只 grab 不解码；
+    检测结果经 IoU 跟踪去重后累计。返回 {"counts", "series", "frames", "analysed", "seconds"}。
+    on_progress(帧号, 当前帧, 当前结果) 每个检测帧调用一次，当前结果与返回值格式相同（轨迹尚未结束），
+    调用方可以保存下来，在分析被中断时展示；should_stop() 返回 True 时提前结束。
+    """
+    config = get_stream_config()
+    stride = max(1, int(stride or config["stride"]))
+    capture = open_source(source)
+    if capture is None:
+        return None
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    tracker = IoUTracker(config["iou_threshold"], config["max_age"], config["min_hits"],
+                         get_config('viability', 'threshold', 0.5))
+    series = BoundedSeries(config["max_points"])
+    frame_idx = analysed = 0
+    start = time.perf_counter()
+
+    def snapshot():
+        return {"counts": tracker.counts(), "series": series.rows(), "frames": frame_idx, "analysed": analysed,
+                "seconds": time.perf_counter() - start}
+
+    try:
+        while max_frames is None or frame_idx < max_frames:
+            if should_stop and should_stop():
+                break
+            if frame_idx % stride:
+                if not capture.grab():
+                    break
+                frame_idx += 1
+                continue
+            ok, frame = capture.read()
+            if not ok:
+                break
+            # 大分辨率帧先缩小，与单张图片的预处理一致
+            height, width = frame.shape[:2]
+            if max(height, width) > config["max_side"]:
+                factor = config["max_side"] / max(height, width)
+                frame = cv2.resize(frame, (int(width * factor), int(height * factor)), interpolation=cv2.INTER_AREA)
+            grains = detect(frame)
+            grains = grains[grains["conf"] >= confidence_threshold]
+            tracker.update(grains)
+            viable = int((grains["score"] >= tracker.viability_threshold).sum())
+            series.add(frame_idx / fps, len(grains), viable)
+            analysed += 1
+            frame_idx += 1
+            if on_progress:
+                on_progress(frame_idx - 1, frame, snapshot())
+    finally:
+        capture.release()
+    tracker.flush()
+    return snapshot()
@@ -0,0 +1,207 @@
+import os
+import json
+import queue
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config_loader import get_config
+
+# 系统日志记录器名称
+LOGGER_NAME = 'pollen'
+
+_listener = None
+_setup_lock = threading.Lock()
+
+class JsonFormatter(logging.Formatter):
+    """结构化 JSON 日志格式（每行一条，time 字段固定在行首以便按日期定位）"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).strftime("%Y-%m-%d %H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        # logger.info("...", extra={"fields": {...}}) 附带的结构化字段
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def setup_logging():
+    """按 config.yaml 的 logging 配置初始化日志（可重复调用）
+
+    业务线程只把日志记录放进队列，由后台 QueueListener 线程写文件，
+    文件按大小滚动（max_file_size / backup_count）。
+    """
+    global _listener
+    logger = logging.getLogger(LOGGER_NAME)
+    with _setup_lock:
+        if _listener is not None:
+            return logger
+
+        log_config = get_config('logging', default={})
+        logger.setLevel(log_config.get('level', 'INFO'))
+        logger.propagate = False
+
+        handlers = []
+        if log_config.get('file_enabled', True):
+            file_handler = RotatingFileHandler(
+                log_config.get('log_file', 'system.log'),
+                maxBytes=log_config.get('max_file_size', 10 * 1024 * 1024),
+                backupCount=log_config.get('backup_count', 5),
+                encoding='utf-8'
+            )
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+        else:
+            stream_handler = logging.StreamHandler()
+            stream_handler.setFormatter(JsonFormatter())
+            handlers.append(stream_handler)
+
+        log_queue = queue.Queue(-1)
+        logger.addHandler(QueueHandler(log_queue))
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+    return logger
+
+def get_logger(name=None):
+    """获取系统日志记录器"""
+    setup_logging()
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+def _line_date(line):
+    """取日志行的日期（YYYY-MM-DD），无法解析时返回 None"""
+    # 行格式固定为 {"time": "YYYY-MM-DD HH:MM:SS", ...}
+    if line.startswith(b'{"time": "'):
+        return line[10:20].decode('ascii', errors='ignore')
+    return None
+
+class LogReader:
+    """系统日志读取
+
+    日志按时间顺序追加，因此每个文件可以按日期二分查找字节偏移，
+    直接 seek 到某一天，而不用从头扫描。偏移量缓存在内存索引中：
+    已滚动的历史文件内容不再变化，按 inode 缓存；当前文件按大小失效。
+    """
+
+    def __init__(self, log_file=None, backup_count=None):
+        log_config = get_config('logging', default={})
+        self.log_file = log_file or log_config.get('log_file', 'system.log')
+        self.backup_count = backup_count if backup_count is not None else log_config.get('backup_count', 5)
+        self._index = {}  # (dev, inode, size, date) -> offset
+        self._lock = threading.Lock()
+
+    def log_files(self):
+        """按时间从旧到新排列的日志文件"""
+        files = [f"{self.log_file}.{i}" for i in range(self.backup_count, 0, -1)]
+        files.append(self.log_file)
+        return [path for path in files if os.path.exists(path)]
+
+    def _date_at(self, f, offset):
+        """从 offset 之后的第一个完整行开始，返回 (行起始偏移, 日期)"""
+        f.seek(offset)
+        if offset > 0:
+            f.readline()
+        while True:
+            pos = f.tell()
+            line = f.readline()
+            if not line:
+                return pos, None
+            date = _line_date(line)
+            if date:
+                return pos, date
+
+    def find_offset(self, path, date):
+        """二分查找文件中第一条日期 >= date 的日志行偏移"""
+        stat = os.stat(path)
+        key = (stat.st_dev, stat.st_ino, stat.st_size, date)
+        with self._lock:
+            if key in self._index:
+                return self._index[key]
+
+        with open(path, 'rb') as f:
+            low, high = 0, stat.st_size
+            while low < high:
+                mid = (low + high) // 2
+                pos, line_date = self._date_at(f, mid)
+                if line_date is None or line_date >= date:
+                    high = mid
+                else:
+                    low = mid + 1
+            offset, _ = self._date_at(f, low)
+
+        with self._lock:
+            # 当前文件大小变化后旧的缓存项自然失效，只保留最近的条目
+            if len(self._index) > 1024:
+                self._index.clear()
+            self._index[key] = offset
+        return offset
+
+    def read_date(self, date, max_lines=1000):
+        """读取某一天最后 max_lines 行日志（date 为 YYYY-MM-DD 字符串）"""
+        lines = deque(maxlen=max_lines)
+        for path in self.log_files():
+            offset = self.find_offset(path, date)
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    line_date = _line_date(line)
+                    if line_date and line_date > date:
+                        break
+                    lines.append(line.decode('utf-8', errors='replace').rstrip('\n'))
+        return list(lines)
+
+    def follow(self, position=None, max_lines=1000):
+        """读取当前日志文件 position 之后新增的内容，返回 (行列表, 新位置)
+
+        position 为 None 时从文件末尾开始；文件滚动后先读完滚动出去的文件（.1）剩余的内容，
+        再从头读取新文件。
+        """
+        if not os.path.exists(self.log_file):
+            return [], None
+        stat = os.stat(self.log_file)
+        if position is None:
+            return [], (stat.st_ino, stat.st_size)
+
+        inode, offset = position
+        lines = []
+        if inode != stat.st_ino:
+            rotated = f"{self.log_file}.1"
+            if os.path.exists(rotated) and os.stat(rotated).st_ino == inode:
+                _read_complete_lines(rotated, offset, lines, complete_only=False)
+            offset = 0
+        elif offset > stat.st_size:
+            offset = 0
+
+        offset = _read_complete_lines(self.log_file, offset, lines)
+        return lines[-max_lines:], (stat.st_ino, offset)
+
+def _read_complete_lines(path, offset, lines, complete_only=True):
+    """从 offset 开始读取各行追加到 lines，返回读到的位置（complete_only 时不读未写完的最后一行）"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if complete_only and not line.endswith(b'\n'):
+                break
+            lines.append(line.decode('utf-8', errors='replace').rstrip('\n'))
+            offset += len(line)
+    return offset
+
+def format_log_line(line):
+    """把 JSON 日志行格式化为便于阅读的文本"""
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return line
+    extra = {k: v for k, v in entry.items() if k not in ("time", "level", "logger", "message")}
+    text = f"{entry.get('time', '')} [{entry.get('level', '')}] {entry.get('logger', '')}: {entry.get('message', '')}"
+    if extra:
+        text += " " + json.dumps(extra, ensure_ascii=False)
+    return text
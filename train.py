@@ -1,6 +1,11 @@
 import yaml
 from ultralytics import YOLO
 import os
+import glob
+import json
+import time
+import random
+import argparse
 
 # 设置环境变量
 os.environ['KMP_DUPLICATE_LIB_OK']='TRUE'
@@ -9,6 +14,15 @@ os.environ['YOLO_SKIP_FONT_CHECK'] = 'TRUE'  # 跳过字体检查
 # 获取当前目录的绝对路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
+# 增量训练：冻结的前若干层（YOLOv8 的 0-9 层为骨干网络）
+BACKBONE_LAYERS = 10
+
+# 增量训练的数据列表、数据配置和对比结果目录
+INCREMENTAL_DIR = os.path.join(current_dir, "runs", "incremental")
+
+# 已在增量训练中用过的新数据（之后只作为回放数据）
+CONSUMED_LIST = os.path.join(INCREMENTAL_DIR, "consumed.txt")
+
 # 加载自定义超参数
 def load_hyperparameters(path):
     try:
@@ -19,37 +33,165 @@ def load_hyperparameters(path):
         print(f"警告：超参数文件 {path} 不存在，使用默认参数")
         return {}
 
-# 应用超参数到模型
-def apply_hyperparameters(model, hyp):
-    for k, v in hyp.items():
-        setattr(model, k, v)
+# 应用超参数：合并到 model.train 的参数中（超参数文件中的值优先，如 imgsz）
+def apply_hyperparameters(train_args, hyp):
+    return {**train_args, **(hyp or {})}
+
+# 当前线上使用的模型权重（config.yaml 中的 model.path）
+def active_weights():
+    with open(os.path.join(current_dir, "config.yaml"), 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f) or {}
+    return os.path.join(current_dir, config.get('model', {}).get('path', "runs/train7/weights/best.pt"))
+
+def read_image_list(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [os.path.join(current_dir, line.strip()) for line in f if line.strip()]
+
+# 已用于增量训练的图片
+def read_consumed():
+    if not os.path.exists(CONSUMED_LIST):
+        return []
+    return read_image_list(CONSUMED_LIST)
+
+# 增量训练完成后记录用过的新数据，下次不再作为新数据
+def mark_consumed(images):
+    consumed = {os.path.normpath(p) for p in read_consumed()}
+    os.makedirs(INCREMENTAL_DIR, exist_ok=True)
+    with open(CONSUMED_LIST, 'a', encoding='utf-8') as f:
+        for path in images:
+            if os.path.normpath(path) not in consumed:
+                try:
+                    path = os.path.relpath(path, current_dir)
+                except ValueError:
+                    pass  # Windows 上不同盘符的路径保留绝对路径
+                f.write(path.replace(os.sep, '/') + '\n')
+
+# 增量训练数据：新数据 + 按比例抽样的旧数据（回放，防止遗忘）
+def build_incremental_dataset(new_list=None, replay_ratio=1.0, min_replay=4, seed=0):
+    """返回 (数据配置文件路径, 新数据图片列表, 回放图片数)
+
+    新数据默认为主动学习导出的 datasets/flower/images/train/al_*（见 active_learning.py）中
+    尚未用于增量训练的图片（用过的记录在 runs/incremental/consumed.txt），
+    也可以用 new_list 指定图片列表文件；旧数据来自 datasets/train.txt 和已用过的新数据，
+    抽取 max(新数据数 × replay_ratio, min_replay) 张一起训练。验证集与完整训练相同。
+    """
+    consumed = read_consumed()
+    consumed_set = {os.path.normpath(p) for p in consumed}
+    if new_list:
+        new_images = read_image_list(new_list)
+    else:
+        new_images = [p for p in sorted(glob.glob(os.path.join(current_dir, "datasets", "flower", "images", "train", "al_*")))
+                      if os.path.normpath(p) not in consumed_set]
+    new_set = {os.path.normpath(p) for p in new_images}
+    old_images, seen = [], set()
+    for p in read_image_list(os.path.join(current_dir, "datasets", "train.txt")) + consumed:
+        key = os.path.normpath(p)
+        if key not in new_set and key not in seen and os.path.exists(p):
+            seen.add(key)
+            old_images.append(p)
+    replay_count = min(len(old_images), max(int(len(new_images) * replay_ratio), min_replay))
+    replay = random.Random(seed).sample(old_images, replay_count)
+
+    os.makedirs(INCREMENTAL_DIR, exist_ok=True)
+    train_list = os.path.join(INCREMENTAL_DIR, "train_incremental.txt")
+    with open(train_list, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(p.replace(os.sep, '/') for p in new_images + replay) + '\n')
+
+    data_yaml = local_data_yaml(os.path.join(INCREMENTAL_DIR, "flower_incremental.yaml"), train_list)
+    print(f"增量训练数据：新数据 {len(new_images)} 张，回放旧数据 {len(replay)} 张")
+    return data_yaml, new_images, len(replay)
+
+# 以本仓库目录为数据根目录的数据配置（flower.yaml 中的 path 为开发机上的绝对路径）
+def local_data_yaml(out_path, train=None):
+    with open(os.path.join(current_dir, "flower.yaml"), 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f)
+    data.update({
+        "path": current_dir.replace(os.sep, '/'),
+        "train": train.replace(os.sep, '/') if train else "datasets/flower/images/train",
+        "val": "datasets/flower/images/val",
+        "test": "datasets/flower/images/val"
+    })
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(data, f, allow_unicode=True)
+    return out_path
+
+# 完整训练：从预训练模型开始训练全部数据
+def train_full(hyp, data_yaml, epochs=100, imgsz=640, batch=1, name="train8"):
+    model = YOLO("yolov8x.pt")
+    model.train(**apply_hyperparameters(
+        {"data": data_yaml, "epochs": epochs, "imgsz": imgsz, "batch": batch, "project": current_dir, "name": name}, hyp))
+    return model
+
+# 增量训练：从线上权重开始，冻结骨干网络，验证集指标不再提升时提前停止
+def train_incremental(hyp, data_yaml, epochs=30, patience=5, imgsz=640, batch=4, freeze=BACKBONE_LAYERS,
+                      weights=None, name="incremental"):
+    model = YOLO(weights or active_weights())
+    train_args = apply_hyperparameters({"data": data_yaml, "epochs": epochs, "imgsz": imgsz, "batch": batch}, hyp)
+    # 微调使用较小的固定学习率、不预热（超参数文件中的学习率是针对从头训练搜索的）
+    train_args.update(patience=patience, freeze=freeze, lr0=0.001, warmup_epochs=0,
+                      project=os.path.join(current_dir, "runs"), name=name, exist_ok=True)
+    model.train(**train_args)
+    return model
+
+# 在同一验证集上评估
+def evaluate(model, data_yaml, imgsz=640):
+    metrics = model.val(data=data_yaml, imgsz=imgsz, batch=1, plots=False)
+    return {"map50": float(metrics.box.map50), "map50_95": float(metrics.box.map)}
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="花粉检测模型训练")
+    parser.add_argument("--mode", choices=["full", "incremental", "compare"], default="full",
+                        help="full：从预训练模型完整训练；incremental：从线上权重增量微调；compare：两者都运行并对比")
+    parser.add_argument("--new", help="增量训练的新数据图片列表（默认 datasets/flower/images/train/al_*）")
+    parser.add_argument("--replay-ratio", type=float, default=1.0, help="回放旧数据与新数据的数量比")
+    parser.add_argument("--epochs", type=int, help="训练轮数（完整训练默认 100，增量训练默认 30）")
+    parser.add_argument("--patience", type=int, default=5, help="增量训练：验证集指标连续多少轮不提升后停止")
+    parser.add_argument("--freeze", type=int, default=BACKBONE_LAYERS, help="增量训练：冻结的前若干层")
+    args = parser.parse_args()
+
     # 设置超参数文件路径
     hyp_path = os.path.join(current_dir, "hyps", "hyp.scratch.yaml")
-    
+
     # 加载超参数
     hyp = load_hyperparameters(hyp_path)
-    
-    # 加载预训练模型
-    model = YOLO("yolov8x.pt")
-    
-    # 应用超参数
-    if hyp:
-        apply_hyperparameters(model, hyp)
-    
+
     # 设置数据配置文件路径
     data_yaml = os.path.join(current_dir, "flower.yaml")
-    
-    # 开始训练
-    results = model.train(
-        data=data_yaml,
-        epochs=100,
-        imgsz=640,
-        batch=1,
-        project=current_dir,
-        name="train8"  # 新的训练记录名称
-    )
+
+    if args.mode == "full":
+        # 开始训练
+        train_full(hyp, data_yaml, epochs=args.epochs or 100)
+    else:
+        incremental_yaml, new_images, replay_count = build_incremental_dataset(args.new, args.replay_ratio)
+        new_count = len(new_images)
+        if new_count == 0:
+            print("没有新数据（用过的图片记录在 runs/incremental/consumed.txt）：先用 python active_learning.py export "
+                  "导出并校正标注，或用 --new 指定图片列表")
+            raise SystemExit(1)
+
+        report = {"new_images": new_count, "replay_images": replay_count}
+        start = time.perf_counter()
+        model = train_incremental(hyp, incremental_yaml, epochs=args.epochs or 30, patience=args.patience,
+                                  freeze=args.freeze)
+        report["incremental"] = {"seconds": time.perf_counter() - start, **evaluate(model, incremental_yaml)}
+        mark_consumed(new_images)
+
+        if args.mode == "compare":
+            # 完整训练使用全部训练数据（含新数据），在同一验证集上评估
+            # flower.yaml 中的 path 是开发机上的绝对路径，改用以本仓库为根目录的数据配置
+            full_yaml = local_data_yaml(os.path.join(INCREMENTAL_DIR, "flower_full.yaml"))
+            start = time.perf_counter()
+            model = train_full(hyp, full_yaml, epochs=args.epochs or 100, name="train_full_compare")
+            report["full"] = {"seconds": time.perf_counter() - start, **evaluate(model, incremental_yaml)}
+
+        for mode in ("incremental", "full"):
+            if mode in report:
+                result = report[mode]
+                print(f"{mode:<12} 耗时 {result['seconds'] / 60:7.1f} 分钟  "
+                      f"mAP50 {result['map50']:.3f}  mAP50-95 {result['map50_95']:.3f}")
+        with open(os.path.join(INCREMENTAL_DIR, "compare.json"), 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
 
 
 
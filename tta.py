@@ -0,0 +1,214 @@
+import time
+import cv2
+import numpy as np
+from config_loader import get_config
+from tracing import tracer
+from stream_analysis import iou_matrix
+
+# 测试时增强（TTA）视图：名称 -> (变换, 检测框逆变换)
+# 逆变换参数为增强视图上的检测框 (N,4) 以及原图宽高，返回原图坐标的检测框
+TTA_VIEWS = {
+    "水平翻转": (lambda image: cv2.flip(image, 1),
+               lambda b, w, h: np.stack([w - b[:, 2], b[:, 1], w - b[:, 0], b[:, 3]], axis=1)),
+    "垂直翻转": (lambda image: cv2.flip(image, 0),
+               lambda b, w, h: np.stack([b[:, 0], h - b[:, 3], b[:, 2], h - b[:, 1]], axis=1)),
+    "旋转90°": (lambda image: cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE),
+               lambda b, w, h: np.stack([b[:, 1], h - b[:, 2], b[:, 3], h - b[:, 0]], axis=1)),
+    "旋转270°": (lambda image: cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE),
+                lambda b, w, h: np.stack([w - b[:, 3], b[:, 0], w - b[:, 1], b[:, 2]], axis=1)),
+}
+
+def get_tta_config():
+    config = {"enabled": False, "views": list(TTA_VIEWS), "iou_threshold": 0.55, "skip_threshold": 0.05,
+              "fast_path_conf": 0.8}
+    config.update(get_config('tta', default={}) or {})
+    return config
+
+class FusedBoxes:
+    """融合后的检测框，接口与 ultralytics Boxes 一致（xyxy、conf、cls）"""
+
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        self.conf = np.asarray(conf, dtype=np.float32)
+        self.cls = np.asarray(cls, dtype=np.float32)
+        self.data = np.hstack([self.xyxy, self.conf[:, None], self.cls[:, None]])
+
+    def __len__(self):
+        return len(self.xyxy)
+
+class FusedResults:
+    def __init__(self, boxes, shape, speed):
+        self.boxes = boxes
+        self.orig_shape = shape[:2]
+        self.speed = speed
+
+def _to_numpy(t):
+    return t.cpu().numpy() if hasattr(t, 'cpu') else np.asarray(t)
+
+def _arrays(result):
+    boxes = result.boxes
+    if boxes is None or not len(boxes):
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+    return _to_numpy(boxes.xyxy), _to_numpy(boxes.conf), _to_numpy(boxes.cls).astype(np.int64)
+
+def weighted_boxes_fusion(boxes, scores, labels, n_views, iou_threshold=0.55, skip_threshold=0.0):
+    """加权框融合（WBF）
+
+    各视图的检测框按类别、置信度从高到低聚类（与聚类当前融合框 IoU 超过阈值即归入），
+    融合框坐标为成员按置信度加权的平均，置信度为成员平均置信度乘以 min(成员数, 视图数) / 视图数，
+    只在少数视图中出现的框置信度随之降低。返回 (xyxy, conf, cls)。
+    """
+    keep = scores >= skip_threshold
+    boxes, scores, labels = boxes[keep], scores[keep], labels[keep]
+    fused_boxes, fused_scores, fused_labels = [], [], []
+    for label in np.unique(labels):
+        idx = np.where(labels == label)[0]
+        idx = idx[np.argsort(-scores[idx], kind='stable')]
+        cluster_boxes = np.zeros((0, 4), dtype=np.float64)
+        weighted = []   # 每个聚类：[置信度加权的坐标和, 置信度和, 成员数]
+        for i in idx:
+            if len(cluster_boxes):
+                ious = iou_matrix(boxes[i:i + 1], cluster_boxes)[0]
+                j = int(np.argmax(ious))
+                if ious[j] > iou_threshold:
+                    weighted[j][0] += boxes[i] * scores[i]
+                    weighted[j][1] += scores[i]
+                    weighted[j][2] += 1
+                    cluster_boxes[j] = weighted[j][0] / weighted[j][1]
+                    continue
+            cluster_boxes = np.vstack([cluster_boxes, boxes[i]])
+            weighted.append([boxes[i].astype(np.float64) * scores[i], float(scores[i]), 1])
+        for box, (_, score_sum, count) in zip(cluster_boxes, weighted):
+            fused_boxes.append(box)
+            fused_scores.append(score_sum / count * min(count, n_views) / n_views)
+            fused_labels.append(label)
+    if not fused_boxes:
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+    return np.array(fused_boxes, dtype=np.float32), np.array(fused_scores, dtype=np.float32), np.array(fused_labels)
+
+def is_confident(conf, fast_path_conf):
+    """快速通道：原图 90% 以上的检测框置信度都不低于阈值时不再做 TTA"""
+    return len(conf) > 0 and float(np.percentile(conf, 10)) >= fast_path_conf
+
+def predict_tta(model, image, views=None, fast_path=True):
+    """带测试时增强的推理，返回 ([结果], 信息)，结果接口与 model(image) 一致
+
+    先对原图推理；置信度足够高时直接返回（快速通道），否则把全部增强视图作为一个批次推理，
+    检测框逆变换回原图坐标后与原图结果一起做加权框融合。
+    信息：{"tta": 是否使用了 TTA, "views": 视图数, "seconds": 总耗时}
+    """
+    config = get_tta_config()
+    views = views or config["views"]
+    start = time.perf_counter()
+    with tracer.span("model.total"):
+        results = model(image)
+    xyxy, conf, cls = _arrays(results[0])
+    if fast_path and is_confident(conf, config["fast_path_conf"]):
+        return results, {"tta": False, "views": 1, "seconds": time.perf_counter() - start}
+
+    height, width = image.shape[:2]
+    with tracer.span("model.tta"):
+        batch = model([TTA_VIEWS[name][0](image) for name in views])
+    all_boxes, all_conf, all_cls = [xyxy], [conf], [cls]
+    for name, result in zip(views, batch):
+        view_xyxy, view_conf, view_cls = _arrays(result)
+        all_boxes.append(TTA_VIEWS[name][1](view_xyxy, width, height))
+        all_conf.append(view_conf)
+        all_cls.append(view_cls)
+
+    with tracer.span("model.wbf"):
+        fused = weighted_boxes_fusion(np.concatenate(all_boxes).astype(np.float32), np.concatenate(all_conf),
+                                      np.concatenate(all_cls), len(views) + 1,
+                                      config["iou_threshold"], config["skip_threshold"])
+    speed = getattr(results[0], 'speed', None) or {}
+    return [FusedResults(FusedBoxes(*fused), image.shape, speed)], \
+        {"tta": True, "views": len(views) + 1, "seconds": time.perf_counter() - start}
+
+def load_yolo_labels(image_path, width, height):
+    """读取图片对应的 YOLO 标注（images/ -> labels/），返回 (xyxy, cls)；无标注文件返回 None"""
+    label_path = image_path.replace('/images/', '/labels/').rsplit('.', 1)[0] + '.txt'
+    try:
+        rows = np.loadtxt(label_path, ndmin=2)
+    except (OSError, ValueError):
+        return None
+    if not len(rows):
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.int64)
+    cx, cy, w, h = rows[:, 1] * width, rows[:, 2] * height, rows[:, 3] * width, rows[:, 4] * height
+    xyxy = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    return xyxy, rows[:, 0].astype(np.int64)
+
+def average_precision(samples, iou_threshold=0.5):
+    """各类别 AP@0.5 的平均值（mAP50）
+
+    samples 为 [(预测 xyxy, conf, cls, 标注 xyxy, cls)]，AP 取全点插值的 PR 曲线面积。
+    """
+    aps = []
+    classes = np.unique(np.concatenate([s[4] for s in samples] + [s[2] for s in samples]))
+    for label in classes:
+        confs, hits, n_truth = [], [], 0
+        for pred_xyxy, pred_conf, pred_cls, truth_xyxy, truth_cls in samples:
+            pred = pred_cls == label
+            truth = truth_xyxy[truth_cls == label]
+            n_truth += len(truth)
+            order = np.argsort(-pred_conf[pred])
+            p_boxes, p_conf = pred_xyxy[pred][order], pred_conf[pred][order]
+            matched = np.zeros(len(truth), dtype=bool)
+            ious = iou_matrix(p_boxes, truth) if len(p_boxes) and len(truth) else np.zeros((len(p_boxes), 0))
+            for i in range(len(p_boxes)):
+                candidates = np.where(~matched & (ious[i] >= iou_threshold))[0] if ious.shape[1] else []
+                hit = len(candidates) > 0
+                if hit:
+                    matched[candidates[np.argmax(ious[i, candidates])]] = True
+                confs.append(p_conf[i])
+                hits.append(hit)
+        if n_truth == 0:
+            continue
+        order = np.argsort(-np.array(confs))
+        tp = np.cumsum(np.array(hits, dtype=np.float64)[order])
+        recall = np.concatenate([[0], tp / n_truth])
+        precision = np.concatenate([[1], tp / np.arange(1, len(tp) + 1)])
+        precision = np.maximum.accumulate(precision[::-1])[::-1]
+        aps.append(float(np.sum((recall[1:] - recall[:-1]) * precision[1:])))
+    return float(np.mean(aps)) if aps else 0.0
+
+def evaluate(model, image_paths, fast_path=True):
+    """对比 TTA 与普通推理的 mAP50 和平均耗时（需要 labels/ 下的 YOLO 标注）"""
+    plain, fused, plain_times, tta_times, used = [], [], [], [], 0
+    for path in image_paths:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        labels = load_yolo_labels(path, image.shape[1], image.shape[0])
+        if labels is None:
+            continue
+        start = time.perf_counter()
+        results = model(image)
+        plain_times.append(time.perf_counter() - start)
+        plain.append((*_arrays(results[0]), *labels))
+        results, info = predict_tta(model, image, fast_path=fast_path)
+        tta_times.append(info["seconds"])
+        used += info["tta"]
+        fused.append((*_arrays(results[0]), *labels))
+    if not plain:
+        return None
+    return {"images": len(plain), "tta_used": used,
+            "map50_plain": average_precision(plain), "map50_tta": average_precision(fused),
+            "ms_plain": float(np.mean(plain_times)) * 1000, "ms_tta": float(np.mean(tta_times)) * 1000}
+
+if __name__ == '__main__':
+    # 用验证集对比 TTA 的精度提升与额外耗时：python tta.py [权重] [图片列表]
+    import sys
+    from ultralytics import YOLO
+    weights = sys.argv[1] if len(sys.argv) > 1 else "runs/train7/weights/best.pt"
+    list_path = sys.argv[2] if len(sys.argv) > 2 else "datasets/val.txt"
+    with open(list_path, 'r', encoding='utf-8') as f:
+        paths = [line.strip() for line in f if line.strip()]
+    model = YOLO(weights)
+    for fast_path in (False, True):
+        report = evaluate(model, paths, fast_path=fast_path)
+        if report is None:
+            print("没有找到带标注的验证图片（datasets/flower/labels/...）")
+            break
+        print(f"{'含快速通道' if fast_path else '全部 TTA'}：{report['images']} 张（{report['tta_used']} 张使用 TTA），"
+              f"mAP50 {report['map50_plain']:.3f} -> {report['map50_tta']:.3f}，"
+              f"耗时 {report['ms_plain']:.0f} ms -> {report['ms_tta']:.0f} ms")
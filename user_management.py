@@ -1,12 +1,39 @@
 import sqlite3
-import hashlib
 import re
+import io
+import csv
 from datetime import datetime
 import os
+from auth import TTLCache, RateLimiter, new_session_token, normalize_identifier
+from passwords import password_hasher
+from config_loader import get_config
+
+# 用户字段的中文名称（用于错误提示）
+FIELD_LABELS = {"username": "用户名", "email": "邮箱", "phone": "手机号"}
 
 class UserManagement:
-    def __init__(self):
-        self.db_path = 'users.db'
+    def __init__(self, db_path='users.db'):
+        self.db_path = db_path
+        
+        # 会话与角色缓存（session_timeout 内有效）
+        session_timeout = get_config('user_management', 'session_timeout', 3600)
+        self.session_cache = TTLCache(ttl=session_timeout)
+        self.role_cache = TTLCache(ttl=session_timeout)
+        
+        # 登录限流：每个账号 max_login_attempts 次 / lockout 窗口，每个 IP max_requests_per_minute 次 / 分钟
+        if get_config('security', 'rate_limiting', True):
+            self.identifier_limiter = RateLimiter(
+                capacity=get_config('user_management', 'max_login_attempts', 5),
+                period=get_config('user_management', 'login_lockout_window', 300)
+            )
+            self.ip_limiter = RateLimiter(
+                capacity=get_config('security', 'max_requests_per_minute', 60),
+                period=60
+            )
+        else:
+            self.identifier_limiter = None
+            self.ip_limiter = None
+        
         self.init_database()
         self.create_admin_if_not_exists()
     
@@ -30,6 +57,9 @@ class UserManagement:
         )
         ''')
         
+        # username/email/phone 已有 UNIQUE 索引；role 用于启动时检查管理员账号
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_role ON users (role)')
+        
         conn.commit()
         conn.close()
     
@@ -57,8 +87,12 @@ class UserManagement:
             print(f"创建管理员账号时出错：{e}")
     
     def hash_password(self, password):
-        """密码加密"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        """密码加密（加盐 KDF，在密码计算线程池中执行）"""
+        return password_hasher.hash(password)
+    
+    def verify_password(self, password, stored):
+        """校验密码，返回 (是否匹配, 是否需要升级哈希)"""
+        return password_hasher.verify(password, stored)
     
     def validate_email(self, email):
         """验证邮箱格式"""
@@ -84,32 +118,18 @@ class UserManagement:
             if phone and not self.validate_phone(phone):
                 return False, "手机号格式不正确"
             
+            # 将空字符串转换为 None
+            email = email if email and email.strip() else None
+            phone = phone if phone and phone.strip() else None
+            
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
-            # 检查用户名是否已存在
-            cursor.execute('SELECT COUNT(*) FROM users WHERE username = ?', (username,))
-            if cursor.fetchone()[0] > 0:
+            # 一次查询同时检查用户名、邮箱、手机号是否已存在
+            conflict = self._find_conflict(cursor, username, email, phone)
+            if conflict:
                 conn.close()
-                return False, "用户名已存在"
-            
-            # 检查邮箱是否已存在（如果提供了邮箱）
-            if email:
-                cursor.execute('SELECT COUNT(*) FROM users WHERE email = ? AND email IS NOT NULL', (email,))
-                if cursor.fetchone()[0] > 0:
-                    conn.close()
-                    return False, "邮箱已被注册"
-            
-            # 检查手机号是否已存在（如果提供了手机号）
-            if phone:
-                cursor.execute('SELECT COUNT(*) FROM users WHERE phone = ? AND phone IS NOT NULL', (phone,))
-                if cursor.fetchone()[0] > 0:
-                    conn.close()
-                    return False, "手机号已被注册"
-            
-            # 将空字符串转换为 None
-            email = email if email and email.strip() else None
-            phone = phone if phone and phone.strip() else None
+                return False, conflict
             
             hashed_password = self.hash_password(password)
             cursor.execute('''
@@ -124,57 +144,293 @@ class UserManagement:
         except Exception as e:
             return False, f"注册失败：{str(e)}"
     
-    def login(self, identifier, password):
-        """用户登录"""
+    def _find_conflict(self, cursor, username, email, phone):
+        """检查用户名/邮箱/手机号是否已被占用，返回错误信息或 None"""
+        cursor.execute('''
+        SELECT 'username' FROM users WHERE username = ?
+        UNION ALL
+        SELECT 'email' FROM users WHERE email = ?
+        UNION ALL
+        SELECT 'phone' FROM users WHERE phone = ?
+        LIMIT 1
+        ''', (username, email, phone))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return {"username": "用户名已存在", "email": "邮箱已被注册", "phone": "手机号已被注册"}[row[0]]
+    
+    def _find_existing(self, cursor, column, values, chunk_size=500):
+        """批量查询某列中已存在的值"""
+        values = list(values)
+        existing = set()
+        for i in range(0, len(values), chunk_size):
+            chunk = values[i:i + chunk_size]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f'SELECT {column} FROM users WHERE {column} IN ({placeholders})', chunk)
+            existing.update(row[0] for row in cursor.fetchall())
+        return existing
+    
+    def import_users_csv(self, csv_file, default_role='user'):
+        """从CSV批量导入用户（管理员使用）
+        
+        CSV 列：username, password, email, phone, role（email/phone/role 可选）。
+        在内存中完成格式校验和去重后，一个事务内批量插入。
+        文件编码依次尝试 UTF-8 和 GB18030（Excel 导出的中文 CSV）；无法解码或格式错误时不导入。
+        返回 (导入数量, 错误列表[(行号, 错误信息)])，行号 0 表示整个文件的错误。
+        """
+        if not isinstance(csv_file, (bytes, bytearray)):
+            csv_file = csv_file.read()
+        if isinstance(csv_file, (bytes, bytearray)):
+            for encoding in ('utf-8-sig', 'gb18030'):
+                try:
+                    csv_file = csv_file.decode(encoding)
+                    break
+                except UnicodeDecodeError:
+                    continue
+            else:
+                return 0, [(0, "无法识别文件编码，请保存为 UTF-8 编码的 CSV")]
+        
+        rows = []
+        errors = []
+        seen = {"username": set(), "email": set(), "phone": set()}
+        try:
+            parsed = list(enumerate(csv.DictReader(io.StringIO(csv_file)), start=2))
+        except csv.Error as e:
+            return 0, [(0, f"CSV 格式错误：{e}")]
+        for line_no, row in parsed:
+            username = (row.get('username') or '').strip()
+            password = row.get('password') or ''
+            email = (row.get('email') or '').strip() or None
+            phone = (row.get('phone') or '').strip() or None
+            role = (row.get('role') or '').strip() or default_role
+            
+            if not username or not password:
+                errors.append((line_no, "用户名和密码为必填项"))
+                continue
+            if email and not self.validate_email(email):
+                errors.append((line_no, "邮箱格式不正确"))
+                continue
+            if phone and not self.validate_phone(phone):
+                errors.append((line_no, "手机号格式不正确"))
+                continue
+            if role not in ('user', 'professional'):
+                errors.append((line_no, f"不支持的用户类型：{role}"))
+                continue
+            
+            # 文件内去重
+            duplicate = next((field for field, value in (("username", username), ("email", email), ("phone", phone))
+                              if value and value in seen[field]), None)
+            if duplicate:
+                errors.append((line_no, f"文件中{FIELD_LABELS[duplicate]}重复"))
+                continue
+            for field, value in (("username", username), ("email", email), ("phone", phone)):
+                if value:
+                    seen[field].add(value)
+            rows.append((line_no, username, password, email, phone, role))
+        
+        if not rows:
+            return 0, errors
+        
+        conn = sqlite3.connect(self.db_path)
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
-            # 支持使用用户名、邮箱或手机号登录
-            cursor.execute('''
-            SELECT id, username, role, password, status FROM users 
-            WHERE username = ? OR email = ? OR phone = ?
-            ''', (identifier, identifier, identifier))
+            # 与数据库中已有用户去重
+            existing = {field: self._find_existing(cursor, field, seen[field]) for field in seen}
+            to_insert = []
+            for line_no, username, password, email, phone, role in rows:
+                conflict = next((field for field, value in (("username", username), ("email", email), ("phone", phone))
+                                 if value and value in existing[field]), None)
+                if conflict:
+                    errors.append((line_no, f"{FIELD_LABELS[conflict]}已存在"))
+                    continue
+                to_insert.append((line_no, username, password, email, phone, role))
             
-            user = cursor.fetchone()
-            if not user:
-                return False, "用户不存在"
+            # 密码哈希在线程池中计算
+            hashed_passwords = password_hasher.hash_many([row[2] for row in to_insert])
             
-            if user[4] != 'active':
-                return False, "账号已被禁用"
+            # 逐行插入（同一事务）：查重之后其他会话并发写入的冲突只影响该行
+            imported = 0
+            for (line_no, username, _, email, phone, role), hashed in zip(to_insert, hashed_passwords):
+                try:
+                    cursor.execute('''
+                    INSERT INTO users (username, password, email, phone, role, status)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ''', (username, hashed, email, phone, role, 'active'))
+                    imported += 1
+                except sqlite3.IntegrityError:
+                    errors.append((line_no, "用户名、邮箱或手机号已存在"))
+            conn.commit()
+            return imported, sorted(errors)
+        except sqlite3.Error as e:
+            conn.rollback()
+            return 0, sorted(errors + [(0, f"写入数据库失败：{e}")])
+        finally:
+            conn.close()
+    
+    def iter_users_csv(self, chunk_size=1000):
+        """以CSV格式流式导出用户（不导出密码），逐块生成文本"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT id, username, email, phone, role, status, created_at, last_login
+            FROM users ORDER BY id
+            ''')
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(["id", "username", "email", "phone", "role", "status", "created_at", "last_login"])
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+        finally:
+            conn.close()
+    
+    def write_users_csv(self, path, chunk_size=1000):
+        """把用户CSV逐块写入文件，返回文件路径"""
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            for chunk in self.iter_users_csv(chunk_size):
+                f.write(chunk)
+        return path
+    
+    def login(self, identifier, password, client_ip=None):
+        """用户登录"""
+        try:
+            # 按 IP 限流
+            if self.ip_limiter and client_ip and not self.ip_limiter.allow(client_ip):
+                return False, "请求过于频繁，请稍后再试"
             
-            if user and user[3] == self.hash_password(password):
-                # 更新最后登录时间
+            conn = sqlite3.connect(self.db_path)
+            try:
+                cursor = conn.cursor()
+                
+                # 支持使用用户名、邮箱或手机号登录
+                # 拆成三个走各自唯一索引的查询再 UNION，避免 OR 条件导致全表扫描
                 cursor.execute('''
-                UPDATE users SET last_login = ? WHERE id = ?
-                ''', (datetime.now(), user[0]))
-                conn.commit()
+                SELECT id, username, role, password, status FROM users WHERE username = ?
+                UNION ALL
+                SELECT id, username, role, password, status FROM users WHERE email = ?
+                UNION ALL
+                SELECT id, username, role, password, status FROM users WHERE phone = ?
+                LIMIT 1
+                ''', (identifier, identifier, identifier))
+                
+                user = cursor.fetchone()
+                
+                # 按账号限流：找到账号时按用户 ID（用户名、邮箱、手机号共用一个配额），否则按规范化的标识
+                limit_key = f"user:{user[0]}" if user else f"id:{normalize_identifier(identifier)}"
+                if self.identifier_limiter and not self.identifier_limiter.allow(limit_key):
+                    wait_seconds = self.identifier_limiter.retry_after(limit_key)
+                    return False, f"登录失败次数过多，请在{int(wait_seconds) + 1}秒后重试"
+                
+                if not user:
+                    return False, "用户不存在"
+                
+                if user[4] != 'active':
+                    return False, "账号已被禁用"
+                
+                matched, needs_rehash = self.verify_password(password, user[3])
+                if matched:
+                    # 更新最后登录时间
+                    cursor.execute('''
+                    UPDATE users SET last_login = ? WHERE id = ?
+                    ''', (datetime.now(), user[0]))
+                    
+                    # 旧版 SHA-256 或参数过期的哈希在登录时透明升级
+                    if needs_rehash:
+                        cursor.execute('UPDATE users SET password = ? WHERE id = ?',
+                                       (self.hash_password(password), user[0]))
+                    conn.commit()
+                    
+                    if self.identifier_limiter:
+                        self.identifier_limiter.reset(limit_key)
+                    
+                    # 创建会话
+                    session_token = new_session_token()
+                    user_info = {"id": user[0], "username": user[1], "role": user[2], "session_token": session_token}
+                    self.session_cache.set(session_token, user_info)
+                    self.role_cache.set(user[0], user[2])
+                    return True, user_info
+                
+                return False, "用户名或密码错误"
+            finally:
                 conn.close()
-                return True, {"id": user[0], "username": user[1], "role": user[2]}
-            
-            conn.close()
-            return False, "用户名或密码错误"
         except Exception as e:
             return False, f"登录失败：{str(e)}"
     
+    def validate_session(self, session_token):
+        """校验会话，返回用户信息；会话过期或账号被禁用时返回 None"""
+        user_info = self.session_cache.get(session_token)
+        if user_info is not None:
+            # 滑动过期：活跃会话自动续期
+            self.session_cache.touch(session_token)
+        return user_info
+    
+    def logout(self, session_token):
+        """注销会话"""
+        self.session_cache.pop(session_token)
+    
+    def invalidate_user(self, username):
+        """使某个用户的全部会话和角色缓存失效（禁用/删除用户时调用）"""
+        self.session_cache.remove_where(lambda token, info: info["username"] == username)
+        self.role_cache.remove_where(lambda user_id, role: True)
+    
     def get_user_role(self, user_id):
         """获取用户角色"""
+        role = self.role_cache.get(user_id)
+        if role is not None:
+            return role
+        
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         cursor.execute('SELECT role FROM users WHERE id = ?', (user_id,))
         role = cursor.fetchone()
         conn.close()
+        if role:
+            self.role_cache.set(user_id, role[0])
         return role[0] if role else None
     
     def get_all_users(self):
         """获取所有用户信息（管理员使用）"""
+        users, _ = self.get_users_page(page=1, page_size=-1)
+        return users
+    
+    def get_users_page(self, page=1, page_size=50, search=None, role=None, status=None):
+        """分页获取用户（管理员使用），筛选在数据库端完成
+        
+        返回 (当前页用户列表, 满足条件的用户总数)。page_size 为 -1 时不分页。
+        """
         try:
+            conditions = []
+            params = []
+            if search:
+                conditions.append("(username LIKE ? OR email LIKE ? OR phone LIKE ?)")
+                params.extend([f"%{search}%"] * 3)
+            if role:
+                conditions.append("role = ?")
+                params.append(role)
+            if status:
+                conditions.append("status = ?")
+                params.append(status)
+            where = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+            
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
-            cursor.execute('''
+            cursor.execute(f'SELECT COUNT(*) FROM users{where}', params)
+            total = cursor.fetchone()[0]
+            cursor.execute(f'''
             SELECT id, username, email, phone, role, status, created_at, last_login 
-            FROM users
-            ''')
+            FROM users{where}
+            ORDER BY id
+            LIMIT ? OFFSET ?
+            ''', params + [page_size, max(0, (page - 1) * page_size) if page_size > 0 else 0])
             users = cursor.fetchall()
             conn.close()
             
@@ -187,46 +443,52 @@ class UserManagement:
                 "status": user[5],
                 "created_at": user[6],
                 "last_login": user[7] or ""
-            } for user in users]
+            } for user in users], total
         except Exception as e:
             print(f"获取用户列表失败：{e}")
-            return []
+            return [], 0
     
-    def disable_user(self, username):
-        """禁用用户（管理员使用）"""
+    def set_users_status(self, usernames, status):
+        """批量设置用户状态（管理员使用），一个事务完成"""
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
-            cursor.execute('UPDATE users SET status = "disabled" WHERE username = ?', (username,))
+            cursor.executemany('UPDATE users SET status = ? WHERE username = ?',
+                               [(status, username) for username in usernames])
             conn.commit()
             conn.close()
+            if status != 'active':
+                for username in usernames:
+                    self.invalidate_user(username)
             return True
         except Exception as e:
-            print(f"禁用用户失败：{e}")
+            print(f"更新用户状态失败：{e}")
             return False
     
-    def enable_user(self, username):
-        """启用用户（管理员使用）"""
+    def delete_users(self, usernames):
+        """批量删除用户（管理员使用），管理员账号不会被删除"""
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
-            cursor.execute('UPDATE users SET status = "active" WHERE username = ?', (username,))
+            cursor.executemany('DELETE FROM users WHERE username = ? AND role != "admin"',
+                               [(username,) for username in usernames])
             conn.commit()
             conn.close()
+            for username in usernames:
+                self.invalidate_user(username)
             return True
         except Exception as e:
-            print(f"启用用户失败：{e}")
+            print(f"删除用户失败：{e}")
             return False
     
+    def disable_user(self, username):
+        """禁用用户（管理员使用）"""
+        return self.set_users_status([username], 'disabled')
+    
+    def enable_user(self, username):
+        """启用用户（管理员使用）"""
+        return self.set_users_status([username], 'active')
+    
     def delete_user(self, username):
         """删除用户（管理员使用）"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM users WHERE username = ? AND role != "admin"', (username,))
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            print(f"删除用户失败：{e}")
-            return False 
\ No newline at end of file
+        return self.delete_users([username])
@@ -0,0 +1,287 @@
+import os
+import sys
+import glob
+import time
+import threading
+import cv2
+import numpy as np
+from config_loader import get_config
+
+# 花粉裁剪图统一缩放到的边长
+FEATURE_SIZE = 32
+
+FEATURE_NAMES = (
+    [f"{space}_{channel}_{moment}" for space, channels in (("hsv", "HSV"), ("lab", "Lab"))
+     for channel in channels for moment in ("mean", "std", "skew")]
+    + ["circularity", "fill_ratio", "gradient_mean", "laplacian_var", "core_contrast", "dark_ratio"]
+)
+
+def _inscribed_masks(size):
+    """内切椭圆（花粉区域）和中心区域的掩码"""
+    yy, xx = np.mgrid[:size, :size]
+    r2 = ((xx - (size - 1) / 2) ** 2 + (yy - (size - 1) / 2) ** 2) / ((size / 2) ** 2)
+    return r2 <= 1.0, r2 <= 0.25
+
+def clip_boxes(boxes, shape):
+    """把检测框裁剪到图像范围内，并保证宽高至少 1 像素"""
+    height, width = shape[:2]
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    x1 = np.clip(np.floor(boxes[:, 0]), 0, width - 1).astype(np.int32)
+    y1 = np.clip(np.floor(boxes[:, 1]), 0, height - 1).astype(np.int32)
+    x2 = np.clip(np.ceil(boxes[:, 2]).astype(np.int32), x1 + 1, width)
+    y2 = np.clip(np.ceil(boxes[:, 3]).astype(np.int32), y1 + 1, height)
+    return np.stack([x1, y1, x2, y2], axis=1)
+
+def crop_stack(image, boxes, size=FEATURE_SIZE):
+    """把所有花粉裁剪并缩放为 (N, size, size, 3) 的数组，后续特征都在这个数组上批量计算"""
+    boxes = clip_boxes(boxes, image.shape)
+    stack = np.empty((len(boxes), size, size, 3), dtype=np.uint8)
+    for i, (x1, y1, x2, y2) in enumerate(boxes):
+        stack[i] = cv2.resize(image[y1:y2, x1:x2], (size, size), interpolation=cv2.INTER_AREA)
+    return stack
+
+def _color_moments(pixels, mask):
+    """掩码内各通道的均值、标准差和偏度，pixels 为 (N, H, W, C)"""
+    values = pixels[:, mask].astype(np.float32)           # (N, P, C)
+    mean = values.mean(axis=1)
+    centered = values - mean[:, None, :]
+    # 用乘法代替 ** 2 / ** 3：负数的浮点幂会走 NumPy 很慢的通用 pow 路径
+    squared = centered * centered
+    std = np.sqrt(squared.mean(axis=1))
+    skew = (squared * centered).mean(axis=1) / np.maximum(std, 1e-3) ** 3
+    return np.stack([mean, std, skew], axis=2).reshape(len(pixels), -1)
+
+def crofton_perimeter(masks):
+    """批量估计二值区域的周长（像素），masks 为 (N, H, W) 布尔数组
+
+    按 Crofton 公式统计水平、垂直和两个对角方向上穿过区域边界的次数：
+    周长 ≈ π/8 × (n0 + n90 + (n45 + n135) / √2)。
+    对圆的估计无偏；数边界像素的方法会明显低估周长，使圆度饱和在 1 附近。
+    """
+    padded = np.pad(masks, ((0, 0), (1, 1), (1, 1)))
+    n0 = (padded[:, :, 1:] != padded[:, :, :-1]).sum(axis=(1, 2))
+    n90 = (padded[:, 1:, :] != padded[:, :-1, :]).sum(axis=(1, 2))
+    n45 = (padded[:, 1:, 1:] != padded[:, :-1, :-1]).sum(axis=(1, 2))
+    n135 = (padded[:, 1:, :-1] != padded[:, :-1, 1:]).sum(axis=(1, 2))
+    return (np.pi / 8 * (n0 + n90 + (n45 + n135) / np.sqrt(2))).astype(np.float32)
+
+def extract_features(stack):
+    """批量提取特征向量 (N, len(FEATURE_NAMES))
+
+    颜色：HSV、Lab 各通道的均值/标准差/偏度；
+    形状：按每粒花粉自身灰度均值分割后的圆度（4πA/P²）和填充率；
+    纹理：梯度均值、拉普拉斯方差、中心与边缘的对比度、暗像素比例。
+    """
+    n, size = len(stack), stack.shape[1]
+    if n == 0:
+        return np.empty((0, len(FEATURE_NAMES)), dtype=np.float32)
+    grain_mask, core_mask = _inscribed_masks(size)
+
+    # 把整个数组当成一张高图做颜色空间转换，只调用一次 OpenCV
+    tall = stack.reshape(n * size, size, 3)
+    hsv = cv2.cvtColor(tall, cv2.COLOR_BGR2HSV).reshape(stack.shape)
+    lab = cv2.cvtColor(tall, cv2.COLOR_BGR2LAB).reshape(stack.shape)
+    gray = cv2.cvtColor(tall, cv2.COLOR_BGR2GRAY).reshape(n, size, size).astype(np.float32)
+
+    color = np.concatenate([_color_moments(hsv, grain_mask), _color_moments(lab, grain_mask)], axis=1)
+
+    # 形状：花粉通常比背景暗，按每粒自身的均值阈值分割
+    thresholds = gray.reshape(n, -1).mean(axis=1)[:, None, None]
+    foreground = gray < thresholds
+    area = foreground.sum(axis=(1, 2)).astype(np.float32)
+    perimeter = crofton_perimeter(foreground)
+    circularity = np.clip(4 * np.pi * area / np.maximum(perimeter, 1) ** 2, 0, 1)
+    fill_ratio = area / (size * size)
+
+    # 纹理
+    gx = np.abs(np.diff(gray, axis=2))[:, :-1, :]
+    gy = np.abs(np.diff(gray, axis=1))[:, :, :-1]
+    gradient_mean = (gx + gy).mean(axis=(1, 2))
+    laplacian = (gray[:, 1:-1, :-2] + gray[:, 1:-1, 2:] + gray[:, :-2, 1:-1] + gray[:, 2:, 1:-1]
+                 - 4 * gray[:, 1:-1, 1:-1])
+    laplacian_var = laplacian.reshape(n, -1).var(axis=1)
+    core_contrast = gray[:, ~grain_mask].mean(axis=1) - gray[:, core_mask].mean(axis=1)
+    dark_ratio = (gray[:, grain_mask] < 100).mean(axis=1)
+
+    shape_texture = np.stack([circularity, fill_ratio, gradient_mean, laplacian_var, core_contrast, dark_ratio], axis=1)
+    return np.concatenate([color, shape_texture], axis=1).astype(np.float32)
+
+def threshold_rule_crops(crops, mean_threshold=None, std_threshold=None):
+    """原有的灰度阈值规则（灰度均值 > 100 且标准差 > 20 判为可育），作为对照和无模型时的回退
+
+    与原来的 judge_pollen_viability 一样在原始分辨率的裁剪图上计算
+    （缩放后的裁剪图标准差偏小，规则的结果会不同）。crops 为 BGR 或灰度裁剪图列表。
+    """
+    viability_config = get_config('viability', default={}) or {}
+    mean_threshold = mean_threshold if mean_threshold is not None else viability_config.get('rule_mean', 100)
+    std_threshold = std_threshold if std_threshold is not None else viability_config.get('rule_std', 20)
+    viable = np.zeros(len(crops), dtype=bool)
+    for i, crop in enumerate(crops):
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        mean, std = cv2.meanStdDev(gray)
+        viable[i] = mean[0, 0] > mean_threshold and std[0, 0] > std_threshold
+    return viable
+
+def threshold_rule(image, boxes, mean_threshold=None, std_threshold=None):
+    """在原图的检测框内按阈值规则判断（灰度图只转换一次）"""
+    boxes = clip_boxes(boxes, image.shape)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    return threshold_rule_crops([gray[y1:y2, x1:x2] for x1, y1, x2, y2 in boxes], mean_threshold, std_threshold)
+
+class ViabilityClassifier:
+    """标准化 + L2 正则逻辑回归（牛顿法训练），输出可育概率"""
+
+    def __init__(self, mean=None, scale=None, coef=None, intercept=0.0):
+        self.mean = mean
+        self.scale = scale
+        self.coef = coef
+        self.intercept = intercept
+
+    def fit(self, features, labels, l2=1e-2, iterations=30):
+        features = np.asarray(features, dtype=np.float64)
+        labels = np.asarray(labels, dtype=np.float64)
+        self.mean = features.mean(axis=0)
+        self.scale = features.std(axis=0) + 1e-6
+        x = np.hstack([(features - self.mean) / self.scale, np.ones((len(features), 1))])
+        weights = np.zeros(x.shape[1])
+        penalty = l2 * len(x) * np.eye(x.shape[1])
+        penalty[-1, -1] = 0  # 截距不做正则化
+        for _ in range(iterations):
+            p = 1 / (1 + np.exp(-x @ weights))
+            gradient = x.T @ (p - labels) + penalty @ weights
+            hessian = (x * (p * (1 - p))[:, None]).T @ x + penalty
+            step = np.linalg.solve(hessian, gradient)
+            weights -= step
+            if np.abs(step).max() < 1e-6:
+                break
+        self.coef = weights[:-1].astype(np.float32)
+        self.intercept = float(weights[-1])
+        return self
+
+    def predict_proba(self, features):
+        z = ((features - self.mean) / self.scale).astype(np.float32) @ self.coef + self.intercept
+        return 1 / (1 + np.exp(-z))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(path, mean=self.mean, scale=self.scale, coef=self.coef, intercept=self.intercept,
+                 feature_names=np.array(FEATURE_NAMES))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        if list(data["feature_names"]) != FEATURE_NAMES:
+            raise ValueError("活力分类器的特征与当前版本不一致，请重新训练")
+        return cls(data["mean"], data["scale"], data["coef"], float(data["intercept"]))
+
+_classifier_lock = threading.Lock()
+_classifier_cache = {}
+
+def get_classifier():
+    """按 viability.model_path 加载分类器（文件更新后自动重新加载），文件不存在时返回 None"""
+    path = (get_config('viability', default={}) or {}).get('model_path', 'models/viability.npz')
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    with _classifier_lock:
+        cached = _classifier_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            try:
+                cached = (mtime, ViabilityClassifier.load(path))
+            except Exception as e:
+                print(f"加载活力分类器失败：{e}")
+                cached = (mtime, None)
+            _classifier_cache[path] = cached
+        return cached[1]
+
+def score_grains(image, boxes):
+    """计算每粒花粉的可育概率，返回 (分数, 是否可育)
+
+    有训练好的分类器时使用分类器；否则使用灰度阈值规则（分数为 0 或 1）。
+    """
+    classifier = get_classifier()
+    if classifier is None:
+        viable = threshold_rule(image, boxes)
+        return viable.astype(np.float32), viable
+    scores = classifier.predict_proba(extract_features(crop_stack(image, boxes)))
+    threshold = (get_config('viability', default={}) or {}).get('threshold', 0.5)
+    return scores.astype(np.float32), scores >= threshold
+
+def load_labelled_crops(data_dir, size=FEATURE_SIZE):
+    """读取标注好的花粉裁剪图：data_dir/viable/*.jpg 与 data_dir/non_viable/*.jpg
+
+    返回 (缩放后的数组, 标签, 原始分辨率的裁剪图列表)。
+    """
+    stacks, labels, crops = [], [], []
+    for label, folder in ((1, "viable"), (0, "non_viable")):
+        for path in sorted(glob.glob(os.path.join(data_dir, folder, "*"))):
+            crop = cv2.imread(path, cv2.IMREAD_COLOR)
+            if crop is None:
+                continue
+            stacks.append(cv2.resize(crop, (size, size), interpolation=cv2.INTER_AREA))
+            labels.append(label)
+            crops.append(crop)
+    return np.array(stacks, dtype=np.uint8).reshape(-1, size, size, 3), np.array(labels, dtype=np.int32), crops
+
+def accuracy_report(labels, predicted):
+    """准确率、可育类的精确率/召回率"""
+    labels, predicted = np.asarray(labels, dtype=bool), np.asarray(predicted, dtype=bool)
+    tp = int((labels & predicted).sum())
+    return {
+        "accuracy": float((labels == predicted).mean()) if len(labels) else 0.0,
+        "precision": tp / max(int(predicted.sum()), 1),
+        "recall": tp / max(int(labels.sum()), 1),
+        "predicted_viable_ratio": float(predicted.mean()) if len(predicted) else 0.0
+    }
+
+def train(data_dir, output_path, test_ratio=0.2, seed=0):
+    """训练分类器，并在留出集上与阈值规则比较"""
+    stack, labels, crops = load_labelled_crops(data_dir)
+    if len(labels) == 0 or len(np.unique(labels)) < 2:
+        print(f"{data_dir} 中需要同时有 viable 和 non_viable 两类样本")
+        return None
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(labels))
+    split = int(len(labels) * (1 - test_ratio))
+    train_idx, test_idx = order[:split], order[split:]
+
+    features = extract_features(stack)
+    classifier = ViabilityClassifier().fit(features[train_idx], labels[train_idx])
+    threshold = (get_config('viability', default={}) or {}).get('threshold', 0.5)
+    model_report = accuracy_report(labels[test_idx], classifier.predict_proba(features[test_idx]) >= threshold)
+    rule_report = accuracy_report(labels[test_idx], threshold_rule_crops([crops[i] for i in test_idx]))
+    classifier.save(output_path)
+
+    print(f"训练样本 {len(train_idx)}，测试样本 {len(test_idx)}（可育比例 {labels.mean():.1%}）")
+    for name, report in (("分类器", model_report), ("阈值规则", rule_report)):
+        print(f"{name:<6} 准确率 {report['accuracy']:.1%}  精确率 {report['precision']:.1%}  "
+              f"召回率 {report['recall']:.1%}  判为可育 {report['predicted_viable_ratio']:.1%}")
+    print(f"模型已保存：{output_path}")
+    return model_report, rule_report
+
+if __name__ == '__main__':
+    # python viability.py train <标注目录> [输出文件]
+    # python viability.py bench
+    command = sys.argv[1] if len(sys.argv) > 1 else "bench"
+    if command == "train" and len(sys.argv) > 2:
+        default_path = (get_config('viability', default={}) or {}).get('model_path', 'models/viability.npz')
+        train(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else default_path)
+    elif command == "bench":
+        # 单核吞吐量：300 粒花粉的 1024x768 合成图像
+        cv2.setNumThreads(1)
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 255, (768, 1024, 3), dtype=np.uint8)
+        corners = rng.uniform(0, 960, (300, 2))
+        boxes = np.hstack([corners, corners + rng.uniform(25, 60, (300, 2))])
+        features = extract_features(crop_stack(image, boxes))
+        classifier = ViabilityClassifier().fit(features, rng.integers(0, 2, 300))
+        for name, func in (("裁剪", lambda: crop_stack(image, boxes)),
+                           ("裁剪+特征+分类", lambda: classifier.predict_proba(extract_features(crop_stack(image, boxes)))),
+                           ("阈值规则", lambda: threshold_rule(image, boxes))):
+            start = time.perf_counter()
+            for _ in range(50):
+                func()
+            elapsed = (time.perf_counter() - start) / 50
+            print(f"{name:<10} {elapsed * 1000:6.2f} ms / 300 粒，{300 / elapsed:,.0f} 粒/秒")
+    else:
+        print("用法：python viability.py [train <标注目录> [输出文件]|bench]")
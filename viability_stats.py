@@ -0,0 +1,151 @@
+from functools import lru_cache
+import numpy as np
+from scipy import stats
+from analysis_history import CLASS_NAMES
+
+# 自助法重采样次数
+BOOTSTRAP_RESAMPLES = 10000
+
+# 自助法中活力率的分辨率（百分点）；取值先按该精度归并（最多约 200 个取值），重采样计算量与记录数无关
+BOOTSTRAP_RESOLUTION = 0.5
+
+# 样本数达到该值时使用泊松自助法，更少时用多项分布（泊松权重之和可能为 0）
+POISSON_MIN_N = 30
+
+# 每块重采样矩阵的元素上限，控制内存占用
+BOOTSTRAP_CHUNK_ELEMENTS = 4_000_000
+
+def viability_vectors(rows):
+    """把 class_count_rows() 的结果转换为各类别活力率向量（%），该类别计数为 0 的记录不参与统计"""
+    counts = np.asarray(rows, dtype=np.float64).reshape(-1, len(CLASS_NAMES) * 2)
+    vectors = {}
+    for i, name in enumerate(CLASS_NAMES):
+        totals, viable = counts[:, 2 * i], counts[:, 2 * i + 1]
+        mask = totals > 0
+        vectors[name] = viable[mask] * 100 / totals[mask]
+    return vectors
+
+def bootstrap_means(values, n_resamples=BOOTSTRAP_RESAMPLES, rng=None):
+    """均值的自助法分布
+
+    有放回抽样的均值只取决于各取值被抽中的次数：取值按 BOOTSTRAP_RESOLUTION
+    归并后，每个取值的抽中次数服从泊松分布（泊松自助法），一次生成
+    重采样次数 × 不同取值个数 的计数矩阵，计算量与记录数无关。
+    归并只影响分布形状的细节，结果按原始均值平移，中心不受影响。
+    """
+    rng = rng or np.random.default_rng()
+    binned = np.round(values / BOOTSTRAP_RESOLUTION) * BOOTSTRAP_RESOLUTION
+    unique, counts = np.unique(binned, return_counts=True)
+    n = len(values)
+    chunk = max(1, BOOTSTRAP_CHUNK_ELEMENTS // len(unique))
+    means = np.empty(n_resamples)
+    for start in range(0, n_resamples, chunk):
+        size = min(chunk, n_resamples - start)
+        if n >= POISSON_MIN_N:
+            weights = rng.poisson(counts, size=(size, len(unique)))
+            means[start:start + size] = weights @ unique / np.maximum(weights.sum(axis=1), 1)
+        else:
+            means[start:start + size] = rng.multinomial(n, counts / n, size=size) @ unique / n
+    return means - binned.mean() + values.mean()
+
+def percentile_interval(samples, confidence=0.95):
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(samples, [alpha, 1 - alpha])
+    return float(low), float(high)
+
+def holm_adjust(p_values):
+    """Holm 多重比较校正"""
+    p_values = np.asarray(p_values, dtype=np.float64)
+    order = np.argsort(p_values)
+    m = len(p_values)
+    adjusted = np.maximum.accumulate((m - np.arange(m)) * p_values[order])
+    result = np.empty(m)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
+
+def describe(values, boot_means):
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    return {
+        "n": int(len(values)),
+        "mean": float(values.mean()),
+        "std": float(values.std(ddof=1)) if len(values) > 1 else 0.0,
+        "ci": percentile_interval(boot_means),
+        "q1": float(q1), "median": float(median), "q3": float(q3),
+        "lower_fence": float(inside.min()), "upper_fence": float(inside.max())
+    }
+
+def control_group_analysis(vectors, control_group, n_resamples=BOOTSTRAP_RESAMPLES, seed=0):
+    """对照组与各实验组的比较
+
+    各类别：均值、标准差、均值的自助法置信区间、箱线图分位数；
+    三个类别：单因素方差分析；
+    对照组与每个实验组：Welch t 检验、Mann-Whitney U 检验（Holm 校正）、
+    均值差及其自助法置信区间。每个类别只重采样一次，置信区间和均值差共用。
+    """
+    rng = np.random.default_rng(seed)
+    groups = {name: values for name, values in vectors.items() if len(values) > 0}
+    boot = {name: bootstrap_means(values, n_resamples, rng) for name, values in groups.items()}
+    result = {"control": control_group, "classes": {}, "anova": None, "pairs": []}
+    for name, values in groups.items():
+        result["classes"][name] = describe(values, boot[name])
+
+    testable = [values for values in groups.values() if len(values) > 1]
+    if len(testable) >= 2:
+        f_stat, p_value = stats.f_oneway(*testable)
+        result["anova"] = {"f": float(f_stat), "p": float(p_value), "groups": len(testable)}
+
+    control = groups.get(control_group)
+    if control is None or len(control) < 2:
+        return result
+
+    control_means = boot[control_group]
+    for name, values in groups.items():
+        if name == control_group or len(values) < 2:
+            continue
+        welch = stats.ttest_ind(values, control, equal_var=False)
+        mann_whitney = stats.mannwhitneyu(values, control, alternative='two-sided')
+        result["pairs"].append({
+            "group": name,
+            "diff": float(values.mean() - control.mean()),
+            "diff_ci": percentile_interval(boot[name] - control_means),
+            "welch_t": float(welch.statistic), "welch_p": float(welch.pvalue),
+            "mw_u": float(mann_whitney.statistic), "mw_p": float(mann_whitney.pvalue)
+        })
+
+    if result["pairs"]:
+        welch_holm = holm_adjust([pair["welch_p"] for pair in result["pairs"]])
+        mw_holm = holm_adjust([pair["mw_p"] for pair in result["pairs"]])
+        for pair, welch_p, mw_p in zip(result["pairs"], welch_holm, mw_holm):
+            pair["welch_p_holm"] = float(welch_p)
+            pair["mw_p_holm"] = float(mw_p)
+    return result
+
+@lru_cache(maxsize=8)
+def _cached_control_analysis(history, control_group, data_version):
+    return control_group_analysis(viability_vectors(history.class_count_rows(include_aggregated=False)),
+                                  control_group)
+
+def history_control_analysis(history, control_group):
+    """基于分析历史的对照分析，结果按 (对照组, 数据版本) 缓存
+
+    样本单位为单张图片的活力率，只使用原始记录；已汇总为日数据的历史
+    （超过保留期）是另一种单位，不混入统计。
+    """
+    return _cached_control_analysis(history, control_group, history.data_version())
+
+if __name__ == '__main__':
+    # 统计计算耗时测试
+    import time
+
+    rng = np.random.default_rng(1)
+    for size in (1000, 10000, 100000):
+        totals = rng.integers(0, 300, size=(size, len(CLASS_NAMES)))
+        viable = rng.binomial(totals, [0.80, 0.72, 0.65])
+        rows = np.stack([totals, viable], axis=2).reshape(size, -1)
+        vectors = viability_vectors(rows)
+        start = time.perf_counter()
+        result = control_group_analysis(vectors, "WT")
+        elapsed = time.perf_counter() - start
+        print(f"{size:>7} 条记录：{elapsed * 1000:.1f} ms，ANOVA p = {result['anova']['p']:.3g}")